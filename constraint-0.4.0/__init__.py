@@ -15,8 +15,8 @@ Constraint Satisfaction Problem (CSP) Solver in Python.
 """
 
 from logilab.constraint.__pkginfo__ import version as __version__
-from logilab.constraint.propagation import Repository, Solver
+from logilab.constraint.propagation import Repository, Solver, SolverStats
 from logilab.constraint.distributors import DefaultDistributor
 from logilab.constraint import fd
 from logilab.constraint import fi
-__all__ = ['Repository', 'Solver', 'DefaultDistributor', 'fd', 'fi']
+__all__ = ['Repository', 'Solver', 'SolverStats', 'DefaultDistributor', 'fd', 'fi']
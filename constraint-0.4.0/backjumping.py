@@ -0,0 +1,156 @@
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+"""
+backjumping - part of Logilab's constraint satisfaction solver.
+
+A depth first search backtracks to the last decision when a node fails,
+even when the failure comes from a decision taken much higher: every
+decision in between is then tried again to no avail. Recording which
+decisions each failure depends on (see propagation.Explanations) lets
+the search jump straight back to the deepest of them, and keep the
+combinations of decisions found to fail as NoGood constraints.
+"""
+
+from logilab.constraint.propagation import Solver, Explanations
+from logilab.constraint.fd import NoGood, merge_restrictions
+
+class BackjumpingSolver(Solver):
+    """Searches with conflict-directed backjumping and nogood learning
+
+    When a node fails, the decisions its failure depends on make its
+    conflict. If the decision leading to the node is not part of it, the
+    other children of its parent fail the same way, and so on up to the
+    deepest decision of the conflict, which the search jumps back to. A
+    node whose children all failed fails in turn, for the union of their
+    conflicts less the decisions leading to them; when that union binds
+    at most learn variables, it is kept as a NoGood for the rest of the
+    search (learn=0 keeps none).
+
+    The repository is searched in place (see Solver); repositories which
+    do not support a trail are searched by copy, chronologically."""
+
+    def __init__(self, distributor=None, learn=4, **kwargs):
+        kwargs.setdefault('trail', True)
+        Solver.__init__(self, distributor, **kwargs)
+        self.learn = learn
+        # levels skipped by the backjumps of the last search
+        self.backjump_cnt = 0
+        # nogoods learnt by the last search
+        self.nogood_cnt = 0
+
+    def _init_search(self, verbose, max_nodes=None, max_time=None):
+        """See Solver"""
+        Solver._init_search(self, verbose, max_nodes, max_time)
+        self.backjump_cnt = 0
+        self.nogood_cnt = 0
+
+    def _solve_in_place(self, repository):
+        """main generator of the search with backjumping
+
+        The stack frames of Solver._solve_in_place also keep the list of
+        the restrictions of the children of each node, the index of the
+        one being searched, and the union of the conflicts of the
+        children searched, None once some child found a solution or was
+        pruned: such a node has no conflict to jump back with. The
+        decision of level i is the child searched by frame i - 1."""
+        distributor = self._distributor
+        verbose = self.verbose
+        explanations = Explanations(repository)
+        self._explanations = explanations
+        nogoods = []
+        stack = []
+        root = None
+        try:
+            outcome = self._visit(repository, 0)
+            if outcome is True:
+                root = repository.mark()
+                stack.append([distributor.split(repository.getDomains(),
+                                                verbose>=2),
+                              -1, repository.mark(), set()])
+            elif outcome is not None:
+                yield outcome
+            while stack:
+                frame = stack[-1]
+                level = len(stack)
+                repository.backtrack(frame[2])
+                frame[1] += 1
+                if frame[1] == len(frame[0]):
+                    # every child failed: so does the node
+                    stack.pop()
+                    conflict = frame[3]
+                    if conflict is None:
+                        self._unexplained(stack)
+                        continue
+                    conflict.discard(level)
+                    if 0 < len(conflict) <= self.learn:
+                        nogood = NoGood(self._decisions(stack, conflict))
+                        repository.addConstraint(nogood)
+                        nogoods.append(nogood)
+                    self._backjump(stack, conflict)
+                    continue
+                restrictions = frame[0][frame[1]]
+                repository.restrict(restrictions)
+                explanations.decide(restrictions, level)
+                explanations.conflict = None
+                outcome = self._visit(repository, level, restrictions)
+                if outcome is True:
+                    stack.append([distributor.split(repository.getDomains(),
+                                                    verbose>=2),
+                                  -1, repository.mark(), set()])
+                elif outcome is None and explanations.conflict is not None:
+                    self._backjump(stack, explanations.conflict)
+                else:
+                    self._unexplained(stack)
+                    if outcome is not None:
+                        yield outcome
+        finally:
+            self._explanations = None
+            if root is not None:
+                repository.backtrack(root)
+            for nogood in nogoods:
+                repository.removeConstraint(nogood)
+            self._leave(repository)
+            self.nogood_cnt = len(nogoods)
+
+        if verbose:
+            self._print_summary()
+
+    def _backjump(self, stack, conflict):
+        """a node of level len(stack) failed because of the decisions of
+        the levels in conflict: pop the frames whose other children would
+        fail the same way, and add conflict to the first frame left"""
+        while stack and len(stack) not in conflict:
+            stack.pop()
+            self.backjump_cnt += 1
+        if stack and stack[-1][3] is not None:
+            stack[-1][3].update(conflict)
+
+    def _unexplained(self, stack):
+        """a node of level len(stack) did not fail because of a conflict:
+        its parent cannot jump back"""
+        if stack:
+            stack[-1][3] = None
+
+    def _decisions(self, stack, levels):
+        """returns the restrictions of the decisions of the given levels,
+        merged as a NoGood takes them"""
+        merged = {}
+        for level in levels:
+            branches, index = stack[level - 1][:2]
+            merged = merge_restrictions(merged, branches[index])
+        return merged
@@ -22,6 +22,7 @@ distributors - part of Logilab's constraint satisfaction solver.
 from logilab.constraint.psyco_wrapper import Psyobj
 from logilab.constraint.interfaces import DistributorInterface
 import math, random
+from bisect import bisect_left
 
 def make_new_domains(domains):
     """return a shallow copy of dict of domains passed in argument"""
@@ -30,6 +31,77 @@ def make_new_domains(domains):
         domain[key] = value.copy()
     return domain
 
+class DomainSizeIndex(Psyobj):
+    """Variables of a dict of domains bucketed by the size of their domain
+
+    The index watches the domains, so it stays up to date while a search
+    with a trail modifies them in place, and finding the smallest or the
+    largest domain costs O(largest size) instead of O(nb variables)."""
+
+    def __init__(self, domains):
+        self.domains = domains
+        self._sizes = {}
+        # self._buckets[size] is a dictionnary of the variables whose
+        # domain has that size
+        self._buckets = [{}]
+        for variable, domain in domains.items():
+            self._insert(variable, domain.size())
+            domain.addWatcher(self, variable)
+
+    def detach(self):
+        """stop watching the domains"""
+        for domain in self.domains.values():
+            domain.removeWatcher(self)
+
+    def _insert(self, variable, size):
+        while len(self._buckets) <= size:
+            self._buckets.append({})
+        self._buckets[size][variable] = None
+        self._sizes[variable] = size
+
+    def sizeChanged(self, variable, domain):
+        """See AbstractDomain.addWatcher"""
+        del self._buckets[self._sizes[variable]][variable]
+        self._insert(variable, domain.size())
+
+    def smallest(self):
+        """returns a variable having the smallest domain with at least
+        2 values, or None if all the domains have a single value"""
+        buckets = self._buckets
+        for size in xrange(2, len(buckets)):
+            if buckets[size]:
+                return iter(buckets[size]).next()
+        return None
+
+    def largest(self):
+        """returns a variable having the largest domain with at least
+        2 values, or None if all the domains have a single value"""
+        buckets = self._buckets
+        for size in xrange(len(buckets) - 1, 1, -1):
+            if buckets[size]:
+                return iter(buckets[size]).next()
+        return None
+
+    def bound(self):
+        """iterates on the variables whose domain has a single value"""
+        if len(self._buckets) > 1:
+            for variable in self._buckets[1]:
+                yield variable
+
+    def unbound(self):
+        """iterates on (size, variable) for the domains with at least
+        2 values, smallest domains first"""
+        buckets = self._buckets
+        for size in xrange(2, len(buckets)):
+            for variable in buckets[size]:
+                yield size, variable
+
+    def logSearchSpace(self):
+        """returns the log of the product of the sizes of the domains"""
+        buckets = self._buckets
+        return sum([len(buckets[size]) * math.log(size)
+                    for size in xrange(2, len(buckets))])
+
 class AbstractDistributor(Psyobj):
     """Implements DistributorInterface but abstract because
     _distribute is left unimplemented."""
@@ -39,24 +111,67 @@ class AbstractDistributor(Psyobj):
     def __init__(self, nb_subspaces=2):
         self.nb_subspaces = nb_subspaces
         self.verbose = 0
+        self._index = None
+
+    def getIndex(self, domains):
+        """returns the DomainSizeIndex of domains, if they are the
+        domains searched in place by split()"""
+        if self._index is not None and self._index.domains is domains:
+            return self._index
+        return None
+
+    def _watch(self, domains):
+        """index domains, which the search modifies in place"""
+        if self._index is None or self._index.domains is not domains:
+            if self._index is not None:
+                self._index.detach()
+            self._index = DomainSizeIndex(domains)
+
+    def unwatch(self):
+        """stop indexing the domains split in place, once their search
+        is over"""
+        if self._index is not None:
+            self._index.detach()
+            self._index = None
         
     def findSmallestDomain(self, domains):
         """returns the variable having the smallest domain.
         (or one of such varibles if there is a tie)
         """
-        domlist = [(dom.size(), variable ) for variable, dom in domains.items()
-                                           if dom.size() > 1]
-        domlist.sort()
-        return domlist[0][1]
+        index = self.getIndex(domains)
+        if index is not None:
+            return index.smallest()
+        return min([(dom.size(), variable)
+                    for variable, dom in domains.items()
+                    if dom.size() > 1])[1]
 
     def findLargestDomain(self, domains):
         """returns the variable having the largest domain.
         (or one of such variables if there is a tie)
         """
-        domlist = [(dom.size(), variable) for variable, dom in domains.items()
-                                          if dom.size() > 1]
-        domlist.sort()
-        return domlist[-1][1]
+        index = self.getIndex(domains)
+        if index is not None:
+            return index.largest()
+        return max([(dom.size(), variable)
+                    for variable, dom in domains.items()
+                    if dom.size() > 1])[1]
+
+    def chooseVariable(self, domains):
+        """returns the variable to distribute, the one having the
+        smallest domain by default"""
+        return self.findSmallestDomain(domains)
+
+    def notifyFailure(self, restrictions, constraint):
+        """called by the Solver when the consistency check of a node
+        fails. restrictions is the part returned by split() that led to
+        the node (None when searching by copy), constraint the failing
+        constraint (None if unknown)"""
+        pass
+
+    def notifyPropagation(self, restrictions, domains):
+        """called by the Solver when the consistency check of a node
+        succeeds, see notifyFailure"""
+        pass
 
     def nb_subdomains(self, domains):
         """return number of sub domains to explore"""
@@ -82,6 +197,29 @@ class AbstractDistributor(Psyobj):
         """
         raise NotImplementedError("Use a concrete implementation of "
                                   "the Distributor interface")
+
+    def split(self, domains, verbose=0):
+        """describe the distribution without copying the domains
+
+        return a list with one dictionnary per subspace, mapping each
+        variable whose domain is restricted in that subspace to the
+        values it keeps. This is what a search with a trail uses: the
+        domains are indexed by size on the first call and the index
+        follows their changes from then on."""
+        self._watch(domains)
+        return self._split(domains, verbose)
+
+    def _split(self, domains, verbose):
+        """See split. This implementation works it out from
+        distribute(), concrete classes can do without the copies"""
+        parts = []
+        for replica in self.distribute(domains, verbose):
+            restrictions = {}
+            for variable, domain in replica.items():
+                if domain.size() != domains[variable].size():
+                    restrictions[variable] = domain.getValues()
+            parts.append(restrictions)
+        return parts
         
 class NaiveDistributor(AbstractDistributor):
     """distributes domains by splitting the smallest domain in 2 new domains
@@ -93,7 +231,7 @@ class NaiveDistributor(AbstractDistributor):
         
     def _distribute(self, dom1, dom2):
         """See AbstractDistributor"""
-        variable = self.findSmallestDomain(dom1)
+        variable = self.chooseVariable(dom1)
         values = dom1[variable].getValues()
         if self.verbose:
             print 'Distributing domain for variable', variable, \
@@ -102,19 +240,36 @@ class NaiveDistributor(AbstractDistributor):
         dom2[variable].removeValue(values[0])
         return (dom1[variable], dom2[variable])
 
+    def _split(self, domains, verbose):
+        """See AbstractDistributor"""
+        variable = self.chooseVariable(domains)
+        values = domains[variable].getValues()
+        if verbose:
+            print 'Distributing domain for variable', variable, \
+                  'at value', values[0]
+        return [{variable: values[:1]}, {variable: values[1:]}]
+
 
 class RandomizingDistributor(AbstractDistributor):
     """distributes domains as the NaiveDistrutor, except that the unique
-    value of the first domain is picked at random."""
+    value of the first domain is picked at random.
 
-    def __init__(self):
+    With a seed, the values are picked by a random generator of its own,
+    so that the search does not depend on the state of the random
+    module; otherwise they are picked by the random module."""
+
+    def __init__(self, seed=None):
         AbstractDistributor.__init__(self)
+        if seed is None:
+            self._random = random
+        else:
+            self._random = random.Random(seed)
         
     def _distribute(self, dom1, dom2):
         """See AbstractDistributor"""
-        variable = self.findSmallestDomain(dom1)
+        variable = self.chooseVariable(dom1)
         values = dom1[variable].getValues()
-        distval = random.choice(values)
+        distval = self._random.choice(values)
         values.remove(distval)
         if self.verbose:
             print 'Distributing domain for variable', variable, \
@@ -122,8 +277,101 @@ class RandomizingDistributor(AbstractDistributor):
         dom1[variable].removeValues(values)
         dom2[variable].removeValue(distval)
         return (dom1[variable], dom2[variable])
+
+    def _split(self, domains, verbose):
+        """See AbstractDistributor"""
+        variable = self.chooseVariable(domains)
+        values = domains[variable].getValues()
+        distval = self._random.choice(values)
+        values.remove(distval)
+        if verbose:
+            print 'Distributing domain for variable', variable, \
+                  'at value', distval
+        return [{variable: [distval]}, {variable: values}]
     
 
+class ValueOrderingDistributor(AbstractDistributor):
+    """distributes domains as the NaiveDistributor, except that the
+    unique value of the first domain is the best one according to a
+    scoring function, so that the first solutions found are good ones.
+
+    score(variable, value) returns a number, the value with the lowest
+    score being tried first: in a schedule, it can be the cost of
+    giving that shift to that worker. With tie_break=True, among the
+    values with the lowest score the one whose key (the value itself,
+    or its item field) is in the fewest domains of the other unbound
+    variables is tried first: the most constrained worker, who can fill
+    the fewest other shifts. Remaining ties go to the smallest value."""
+
+    def __init__(self, score, tie_break=False, field=None):
+        AbstractDistributor.__init__(self)
+        self._score = score
+        self._tie_break = tie_break
+        self._field = field
+
+    def _key(self, value):
+        if self._field is None:
+            return value
+        return value[self._field]
+
+    def bestValue(self, domains, variable):
+        """returns the value of the domain of variable to try first"""
+        score = self._score
+        scored = [(score(variable, value), value)
+                  for value in domains[variable].getValues()]
+        best = min(scored)
+        if not self._tie_break:
+            return best[1]
+        ties = [value for value_score, value in scored
+                if value_score == best[0]]
+        if len(ties) == 1:
+            return ties[0]
+
+        counts = {}
+        for value in ties:
+            counts[self._key(value)] = 0
+        index = self.getIndex(domains)
+        if index is not None:
+            unbound = [var for size, var in index.unbound()]
+        else:
+            unbound = [var for var, dom in domains.items() if dom.size() > 1]
+        for var in unbound:
+            if var == variable:
+                continue
+            keys = {}
+            for value in domains[var].getValues():
+                key = self._key(value)
+                if key in counts:
+                    keys[key] = None
+            for key in keys:
+                counts[key] += 1
+        return min([(counts[self._key(value)], value) for value in ties])[1]
+
+    def _distribute(self, dom1, dom2):
+        """See AbstractDistributor"""
+        variable = self.chooseVariable(dom1)
+        distval = self.bestValue(dom1, variable)
+        values = dom1[variable].getValues()
+        values.remove(distval)
+        if self.verbose:
+            print 'Distributing domain for variable', variable, \
+                  'at value', distval
+        dom1[variable].removeValues(values)
+        dom2[variable].removeValue(distval)
+        return (dom1[variable], dom2[variable])
+
+    def _split(self, domains, verbose):
+        """See AbstractDistributor"""
+        variable = self.chooseVariable(domains)
+        distval = self.bestValue(domains, variable)
+        values = domains[variable].getValues()
+        values.remove(distval)
+        if verbose:
+            print 'Distributing domain for variable', variable, \
+                  'at value', distval
+        return [{variable: [distval]}, {variable: values}]
+
+
 class SplitDistributor(AbstractDistributor):
     """distributes domains by splitting the smallest domain in
     nb_subspaces equal parts or as equal as possible.
@@ -135,7 +383,7 @@ class SplitDistributor(AbstractDistributor):
         self.__to_split = None
     def nb_subdomains(self, domains):
         """See AbstractDistributor"""
-        self.__to_split = self.findSmallestDomain(domains)
+        self.__to_split = self.chooseVariable(domains)
         if self.nb_subspaces:
             return min(self.nb_subspaces, domains[self.__to_split].size())
         else:
@@ -159,6 +407,18 @@ class SplitDistributor(AbstractDistributor):
             modified.append(dom[variable])
         return modified
 
+    def _split(self, domains, verbose):
+        """See AbstractDistributor"""
+        nb_subspaces = self.nb_subdomains(domains)
+        variable = self.__to_split
+        values = domains[variable].getValues()
+        nb_elts = max(1, len(values)*1./nb_subspaces)
+        if verbose:
+            print 'Distributing domain for variable', variable
+        return [{variable: values[int(math.floor(index * nb_elts)):
+                                  int(math.floor((index + 1) * nb_elts))]}
+                for index in range(nb_subspaces)]
+
 class DichotomyDistributor(SplitDistributor):
     """distributes domains by splitting the smallest domain in
     two equal parts or as equal as possible"""
@@ -172,4 +432,207 @@ class EnumeratorDistributor(SplitDistributor):
     def __init__(self):
         SplitDistributor.__init__(self, 0)
 
+
+
+class DomWDegDistributor(DichotomyDistributor):
+    """distributes domains as the DichotomyDistributor, but picks the
+    variable with the smallest ratio of domain size to weighted degree.
+
+    Each time a constraint fails, the weight of its variables grows,
+    so the search turns to the variables involved in the conflicts."""
+
+    def __init__(self):
+        DichotomyDistributor.__init__(self)
+        self.weights = {}
+
+    def notifyFailure(self, restrictions, constraint):
+        """See AbstractDistributor"""
+        if constraint is None:
+            return
+        weights = self.weights
+        for variable in constraint.affectedVariables():
+            weights[variable] = weights.get(variable, 1) + 1
+
+    def chooseVariable(self, domains):
+        """See AbstractDistributor"""
+        weights = self.weights
+        if not weights:
+            return self.findSmallestDomain(domains)
+        index = self.getIndex(domains)
+        if index is not None:
+            unbound = index.unbound()
+        else:
+            unbound = [(dom.size(), variable)
+                       for variable, dom in domains.items()
+                       if dom.size() > 1]
+        return min([(size * 1. / weights.get(variable, 1), variable)
+                    for size, variable in unbound])[1]
+
+
+class ImpactDistributor(DichotomyDistributor):
+    """distributes domains as the DichotomyDistributor, but picks the
+    variable whose restriction reduced the search space the most so far.
+
+    The impact of a restriction is 1 - (size of the search space after
+    its consistency check) / (size before), 1 when the check fails.
+    Impacts are only measured in searches with a trail (the domains
+    being indexed, the size of the search space is cheap to get); the
+    variables never measured are taken smallest domain first."""
+
+    def __init__(self):
+        DichotomyDistributor.__init__(self)
+        self.impacts = {}
+        self._pending = {}
+
+    def _watch(self, domains):
+        if self.getIndex(domains) is None:
+            self._pending = {}
+        DichotomyDistributor._watch(self, domains)
+
+    def _split(self, domains, verbose):
+        """See AbstractDistributor"""
+        parts = DichotomyDistributor._split(self, domains, verbose)
+        log_space = self._index.logSearchSpace()
+        for restrictions in parts:
+            self._pending[id(restrictions)] = (restrictions, log_space)
+        return parts
+
+    def _record(self, restrictions, impact):
+        try:
+            _, log_space = self._pending.pop(id(restrictions))
+        except KeyError:
+            return
+        if impact is None:
+            impact = 1 - math.exp(self._index.logSearchSpace() - log_space)
+        for variable in restrictions:
+            count, total = self.impacts.get(variable, (0, 0.))
+            self.impacts[variable] = (count + 1, total + impact)
+
+    def notifyFailure(self, restrictions, constraint):
+        """See AbstractDistributor"""
+        self._record(restrictions, 1.)
+
+    def notifyPropagation(self, restrictions, domains):
+        """See AbstractDistributor"""
+        self._record(restrictions, None)
+
+    def chooseVariable(self, domains):
+        """See AbstractDistributor"""
+        index = self.getIndex(domains)
+        if index is None or not self.impacts:
+            return self.findSmallestDomain(domains)
+        impacts = self.impacts
+        best = None
+        for size, variable in index.unbound():
+            count, total = impacts.get(variable, (1, 0.))
+            score = (-total / count, size)
+            if best is None or score < best[0]:
+                best = (score, variable)
+        return best[1]
+
+
+class ValueSymmetryDistributor(AbstractDistributor):
+    """distributes domains as the EnumeratorDistributor, but does not
+    try values that are interchangeable with a value already tried.
+
+    value_classes is a list of lists of interchangeable keys: swapping
+    two keys of a class everywhere in a solution gives a solution. The
+    key of a value is the value itself, or its item field. Of the keys
+    of a class that no bound variable uses yet, only the first one of
+    each run is tried, a run being the keys of the class with no used
+    key between them (in the natural order of the keys).
+
+    chains is a list of lists of variables constrained to be
+    increasing (see fd.StrictlyIncreasing), which must be taken into
+    account for the above to hold: the variables of a chain are
+    distributed in the chain order."""
+
+    def __init__(self, value_classes, field=None, chains=()):
+        AbstractDistributor.__init__(self, 0)
+        self._field = field
+        self._classes = {}
+        for index, keys in enumerate(value_classes):
+            for key in keys:
+                self._classes[key] = index
+        self._chain_of = {}
+        for chain in chains:
+            for variable in chain:
+                self._chain_of[variable] = chain
+        self.__to_split = None
+        self.__values = None
+
+    def _key(self, value):
+        if self._field is None:
+            return value
+        return value[self._field]
+
+    def chooseVariable(self, domains):
+        """See AbstractDistributor"""
+        variable = self.findSmallestDomain(domains)
+        chain = self._chain_of.get(variable)
+        if chain is not None:
+            for variable in chain:
+                if domains[variable].size() > 1:
+                    break
+        return variable
+
+    def keptValues(self, domains, variable):
+        """returns the values of the domain of variable worth trying,
+        in the order of the domain"""
+        index = self.getIndex(domains)
+        if index is not None:
+            bound = index.bound()
+        else:
+            bound = [var for var, dom in domains.items() if dom.size() == 1]
+        used = {}
+        for var in bound:
+            used[self._key(domains[var].getValues()[0])] = None
+        used = used.keys()
+        used.sort()
+
+        values = domains[variable].getValues()
+        skipped = {}
+        # class -> position in used of the run of its last kept key
+        runs = {}
+        for key, value in sorted([(self._key(value), value)
+                                  for value in values]):
+            klass = self._classes.get(key)
+            if klass is None:
+                continue
+            position = bisect_left(used, key)
+            if position < len(used) and used[position] == key:
+                continue
+            if runs.get(klass) == position:
+                skipped[value] = None
+            else:
+                runs[klass] = position
+        return [value for value in values if value not in skipped]
+
+    def nb_subdomains(self, domains):
+        """See AbstractDistributor"""
+        self.__to_split = self.chooseVariable(domains)
+        self.__values = self.keptValues(domains, self.__to_split)
+        return len(self.__values)
+
+    def _distribute(self, *args):
+        """See AbstractDistributor"""
+        variable = self.__to_split
+        if self.verbose:
+            print 'Distributing domain for variable', variable
+        modified = []
+        for dom, value in zip(args, self.__values):
+            dom[variable].removeValues([val for val
+                                        in dom[variable].getValues()
+                                        if val != value])
+            modified.append(dom[variable])
+        return modified
+
+    def _split(self, domains, verbose):
+        """See AbstractDistributor"""
+        self.nb_subdomains(domains)
+        if verbose:
+            print 'Distributing domain for variable', self.__to_split
+        return [{self.__to_split: [value]} for value in self.__values]
+
+
 DefaultDistributor = DichotomyDistributor
@@ -19,6 +19,14 @@
 
 This module provides the following usable classes:
  * FiniteDomain: a class for storing FiniteDomains
+ * IndexedFiniteDomain: a FiniteDomain stored as a bitset over a
+   ValueUniverse shared by several domains
+ * AllDistinct, MatchingAllDistinct, AllDistinctOnField and
+   NotEqualOnField constraints
+ * StrictlyIncreasing: an ordering constraint, mostly used to break
+   the symmetry between interchangeable variables
+ * NoGood: forbids a combination of values, recorded from a part of
+   the search tree which holds no solution
  * Expression: a constraint represented as an expression
  * BinaryExpression: a binary constraint represented as an expression
  * various BasicConstraint classes
@@ -29,6 +37,7 @@ make_expression factory function.  """
 from __future__ import generators
 
 import operator
+import re
 
 from logilab.constraint.propagation import AbstractDomain, BasicConstraint, \
                                            ConsistencyFailure, \
@@ -42,6 +51,9 @@ class FiniteDomain(AbstractDomain):
 
     _copy_count = 0
     _write_count = 0
+    # list recording the removals when the domain is searched with a
+    # trail (see Repository.enableTrail)
+    _trail = None
     
     def __init__(self, values):
         """values is a list of values in the domain
@@ -73,6 +85,8 @@ class FiniteDomain(AbstractDomain):
         if self._cow:
             self.setValues(self._values)
         del self._values[value]
+        if self._trail is not None:
+            self._trail.append((self, (value,)))
         self._valueRemoved()
 
     def removeValues(self, values):
@@ -83,8 +97,19 @@ class FiniteDomain(AbstractDomain):
 ##             print "removing", values, "from", self._values.keys()
             for val in values :
                 del self._values[val]
+            if self._trail is not None:
+                self._trail.append((self, tuple(values)))
             self._valueRemoved()
     __delitem__ = removeValue
+
+    def _undo(self, values):
+        """put back values removed while recording on a trail"""
+        if self._cow:
+            self.setValues(self._values)
+        for val in values:
+            self._values[val] = 0
+        self.resetFlags()
+        self._sizeChanged()
     
     def size(self):
         """computes the size of a finite domain"""
@@ -105,6 +130,162 @@ class FiniteDomain(AbstractDomain):
     def __repr__(self):
         return '<FiniteDomain %s>' % str(self.getValues())
 
+
+class ValueUniverse(object):
+    """An ordered set of values shared by several IndexedFiniteDomain,
+    mapping each value to the index of its bit"""
+
+    def __init__(self, values):
+        self.values = []
+        self.index = {}
+        for val in values:
+            if val not in self.index:
+                self.index[val] = len(self.values)
+                self.values.append(val)
+        self.values = tuple(self.values)
+
+    def mask(self, values):
+        """return the bitset of values, raise KeyError if one of them is
+        not in the universe"""
+        index = self.index
+        mask = 0
+        for val in values:
+            mask |= 1 << index[val]
+        return mask
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return '<ValueUniverse %s>' % str(self.values)
+
+
+def _bit_count(bits):
+    """number of bits set in bits"""
+    return bin(bits).count('1')
+
+def _same_universe(domains):
+    """true if domains are all IndexedFiniteDomain on the same universe"""
+    universe = getattr(domains[0], '_universe', None)
+    if universe is None:
+        return False
+    for dom in domains:
+        if getattr(dom, '_universe', None) is not universe:
+            return False
+    return True
+
+
+class IndexedFiniteDomain(FiniteDomain):
+    """
+    Variable Domain with a finite set of possible values, stored as a
+    bitset over a ValueUniverse
+
+    Domains built on the same universe share its value -> index
+    mapping, so removals, copies, intersections and size checks are
+    operations on a single integer.
+    """
+
+    def __init__(self, values, universe=None):
+        """values is a list of values in the domain, or another
+        IndexedFiniteDomain to copy.
+        universe is the ValueUniverse (or the list of values) the
+        domain is a subset of; it defaults to values"""
+        AbstractDomain.__init__(self)
+        if isinstance(values, IndexedFiniteDomain):
+            FiniteDomain._copy_count += 1
+            self._universe = values._universe
+            self._bits = values._bits
+            self._size = values._size
+        else:
+            assert len(values) > 0
+            if universe is None:
+                universe = values
+            if not isinstance(universe, ValueUniverse):
+                universe = ValueUniverse(universe)
+            self._universe = universe
+            self.setValues(values)
+
+    def setValues(self, values):
+        FiniteDomain._write_count += 1
+        self._bits = self._universe.mask(values)
+        self._size = _bit_count(self._bits)
+
+    def getUniverse(self):
+        """return the ValueUniverse of the domain"""
+        return self._universe
+
+    def getBits(self):
+        """return the bitset of the values in the domain"""
+        return self._bits
+
+    def removeValue(self, value):
+        """Remove value of domain and check for consistency"""
+        bit = 1 << self._universe.index[value]
+        if not self._bits & bit:
+            raise KeyError(value)
+        self._removeBits(bit, 1)
+
+    def removeValues(self, values):
+        """Remove values of domain and check for consistency"""
+        if values:
+            mask = self._universe.mask(values)
+            if mask & ~self._bits:
+                raise KeyError([val for val in values if val not in self])
+            self._removeBits(mask, _bit_count(mask))
+    __delitem__ = removeValue
+
+    def intersect(self, other):
+        """Remove the values which are not in the IndexedFiniteDomain
+        other (built on the same universe) and check for consistency"""
+        assert other._universe is self._universe
+        mask = self._bits & ~other._bits
+        if mask:
+            self._removeBits(mask, _bit_count(mask))
+
+    def _removeBits(self, mask, count):
+        self._bits &= ~mask
+        self._size -= count
+        if self._trail is not None:
+            self._trail.append((self, mask))
+        self._valueRemoved()
+
+    def _undo(self, mask):
+        """put back values removed while recording on a trail"""
+        self._bits |= mask
+        self._size = _bit_count(self._bits)
+        self.resetFlags()
+        self._sizeChanged()
+
+    def size(self):
+        """computes the size of a finite domain"""
+        return self._size
+    __len__ = size
+
+    def getValues(self):
+        """return all the values in the domain"""
+        return list(self)
+
+    def __iter__(self):
+        values = self._universe.values
+        bits = self._bits
+        while bits:
+            low = bits & -bits
+            yield values[low.bit_length() - 1]
+            bits ^= low
+
+    def __contains__(self, value):
+        try:
+            return bool(self._bits & (1 << self._universe.index[value]))
+        except KeyError:
+            return False
+
+    def copy(self):
+        """clone the domain"""
+        return IndexedFiniteDomain(self)
+
+    def __repr__(self):
+        return '<IndexedFiniteDomain %s>' % str(self.getValues())
+
 ##
 ## Constraints
 ##    
@@ -144,11 +325,17 @@ class AllDistinct(AbstractConstraint):
                             pass
 
         # if there are less values than variables, the constraint fails
-        values = {}
-        for size, var, dom in variables:
-            for val in dom:
-                values[val] = 0
-        if len(values) < len(variables):
+        if _same_universe([dom for size, var, dom in variables]):
+            nb_values = _bit_count(reduce(operator.or_,
+                                          [dom.getBits() for size, var, dom
+                                           in variables]))
+        else:
+            values = {}
+            for size, var, dom in variables:
+                for val in dom:
+                    values[val] = 0
+            nb_values = len(values)
+        if nb_values < len(variables):
             raise ConsistencyFailure()
             
         # the constraint is entailed if all domains have a size of 1
@@ -158,56 +345,464 @@ class AllDistinct(AbstractConstraint):
         return 1
 
 
+class MatchingAllDistinct(AllDistinct):
+    """Contraint: all values must be distinct
+
+    Same constraint as AllDistinct, with a complete narrowing algorithm
+    (Regin's): every value that belongs to no solution of the constraint
+    is removed, not only the values of the variables already bound.
+    A maximum matching between variables and values is kept from one
+    call to the next and only repaired where the domains changed."""
+
+    # when not None, values are told apart by their item _field only
+    # (see AllDistinctOnField)
+    _field = None
+
+    def __init__(self, variables):
+        AllDistinct.__init__(self, variables)
+        self._matching = {}
+
+    def __repr__(self):
+        return '<MatchingAllDistinct %s>' % str(self._variables)
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        variables = self._variables
+        nb_vars = len(variables)
+        field = self._field
+        # number the values so that variables are the nodes 0..nb_vars-1
+        # of the graph and values the nodes nb_vars.. of the same graph
+        value_index = {}
+        values = []
+        var_values = []
+        for var in variables:
+            indexes = []
+            for val in domains[var].getValues():
+                if field is not None:
+                    val = val[field]
+                try:
+                    indexes.append(value_index[val])
+                except KeyError:
+                    value_index[val] = len(values)
+                    indexes.append(len(values))
+                    values.append(val)
+            if field is not None:
+                indexes = dict.fromkeys(indexes).keys()
+            var_values.append(indexes)
+        if len(values) < nb_vars:
+            raise ConsistencyFailure()
+
+        match = self._maximum_matching(value_index, values, var_values)
+
+        # the constraint is entailed if all domains have a size of 1
+        for indexes in var_values:
+            if len(indexes) != 1:
+                break
+        else:
+            return 1
+
+        # edge var -> value is in a maximum matching iff it is the matched
+        # edge, or it belongs to an alternating path starting at a free
+        # value, or to an alternating cycle.
+        nb_nodes = nb_vars + len(values)
+        successors = [[] for node in xrange(nb_nodes)]
+        for i, indexes in enumerate(var_values):
+            successors[i].append(nb_vars + match[i])
+            for j in indexes:
+                if j != match[i]:
+                    successors[nb_vars + j].append(i)
+        matched_values = dict.fromkeys(match)
+        reached = [0] * nb_nodes
+        stack = [nb_vars + j for j in xrange(len(values))
+                 if j not in matched_values]
+        for node in stack:
+            reached[node] = 1
+        while stack:
+            node = stack.pop()
+            for succ in successors[node]:
+                if not reached[succ]:
+                    reached[succ] = 1
+                    stack.append(succ)
+        component = _strongly_connected_components(successors)
+
+        entailed = 1
+        try:
+            for i, var in enumerate(variables):
+                to_remove = [values[j] for j in var_values[i]
+                             if j != match[i] and not reached[nb_vars + j]
+                             and component[nb_vars + j] != component[i]]
+                if len(var_values[i]) - len(to_remove) != 1:
+                    entailed = 0
+                if field is not None and to_remove:
+                    to_remove = dict.fromkeys(to_remove)
+                    to_remove = [val for val in domains[var].getValues()
+                                 if val[field] in to_remove]
+                domains[var].removeValues(to_remove)
+        except ConsistencyFailure:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+        return entailed
+
+    def _maximum_matching(self, value_index, values, var_values):
+        """return a list mapping each variable to the index of its value
+        in a maximum matching, starting from the matching of the last call.
+        Raises ConsistencyFailure if some variable cannot be matched"""
+        variables = self._variables
+        match = [None] * len(variables)
+        owner = [None] * len(values)
+        for i, var in enumerate(variables):
+            try:
+                j = value_index[self._matching[var]]
+            except KeyError:
+                continue
+            if owner[j] is None and j in var_values[i]:
+                match[i] = j
+                owner[j] = i
+        for i in xrange(len(variables)):
+            if match[i] is None and \
+                   not _augment(i, var_values, match, owner):
+                raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                         repr(self))
+        self._matching = dict([(var, values[match[i]])
+                               for i, var in enumerate(variables)])
+        return match
+
+
+class AllDistinctOnField(MatchingAllDistinct):
+    """Contraint: the values of the variables must all differ on their
+    item field (for instance, shifts which overlap one another must all
+    get different workers). Narrowed as MatchingAllDistinct"""
+
+    def __init__(self, variables, field):
+        MatchingAllDistinct.__init__(self, variables)
+        self._field = field
+
+    def __repr__(self):
+        return '<AllDistinctOnField %s [%s]>' % (str(self._variables),
+                                                 self._field)
+
+
+class NotEqualOnField(AbstractConstraint):
+    """Constraint: the values of two variables must differ on their item
+    field
+
+    This is the BinaryExpression '%s[field] != %s[field]', narrowed in
+    a time linear in the size of the domains: values are only removed
+    once every value of one side has the same field, and the constraint
+    is entailed as soon as the fields of the two sides are disjoint."""
+
+    def __init__(self, variables, field):
+        assert len(variables) == 2
+        AbstractConstraint.__init__(self, variables)
+        self._field = field
+
+    def __repr__(self):
+        return '<NotEqualOnField %s [%s]>' % (str(self._variables),
+                                              self._field)
+
+    def estimateCost(self, domains):
+        """return cost"""
+        return domains[self._variables[0]].size() + \
+               domains[self._variables[1]].size()
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        field = self._field
+        dom1 = domains[self._variables[0]]
+        dom2 = domains[self._variables[1]]
+        fields1 = {}
+        for val in dom1:
+            fields1[val[field]] = None
+        fields2 = {}
+        for val in dom2:
+            fields2[val[field]] = None
+        try:
+            if len(fields1) == 1:
+                if fields1.keys()[0] in fields2:
+                    dom2.removeValues([val for val in dom2.getValues()
+                                       if val[field] in fields1])
+                return 1
+            if len(fields2) == 1:
+                if fields2.keys()[0] in fields1:
+                    dom1.removeValues([val for val in dom1.getValues()
+                                       if val[field] in fields2])
+                return 1
+        except ConsistencyFailure:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+        for key in fields1:
+            if key in fields2:
+                return 0
+        return 1
+
+
+class StrictlyIncreasing(AbstractConstraint):
+    """Constraint: the values of the variables must be strictly
+    increasing, in the order the variables are given
+
+    Posted over variables that any solution may permute (same domains,
+    same constraints), it keeps a single solution out of each group of
+    symmetric ones. The domains are narrowed to bounds consistency by
+    one pass forward and one pass backward along the chain."""
+
+    def __init__(self, variables):
+        assert len(variables)>1
+        AbstractConstraint.__init__(self, variables)
+
+    def __repr__(self):
+        return '<StrictlyIncreasing %s>' % str(self._variables)
+
+    def estimateCost(self, domains):
+        """return cost"""
+        return sum([domains[variable].size()
+                    for variable in self._variables])
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        doms = [domains[variable] for variable in self._variables]
+        try:
+            lowest = min(doms[0].getValues())
+            for dom in doms[1:]:
+                values = dom.getValues()
+                removed = [val for val in values if val <= lowest]
+                if removed:
+                    dom.removeValues(removed)
+                    values = dom.getValues()
+                lowest = min(values)
+            doms.reverse()
+            highest = max(doms[0].getValues())
+            for dom in doms[1:]:
+                values = dom.getValues()
+                removed = [val for val in values if val >= highest]
+                if removed:
+                    dom.removeValues(removed)
+                    values = dom.getValues()
+                highest = max(values)
+        except ConsistencyFailure:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+        # doms is in reverse order: entailed once every domain lies
+        # above the one before it
+        for index in range(1, len(doms)):
+            if min(doms[index - 1].getValues()) <= \
+                   max(doms[index].getValues()):
+                return 0
+        return 1
+
+
+class NoGood(AbstractConstraint):
+    """Constraint: the variables may not all take a value of their
+    forbidden set at once
+
+    restrictions maps each variable to its forbidden values. A nogood
+    records a part of the search tree known to hold no solution, so that
+    a later search does not explore it again: once every variable but
+    one is bound to forbidden values, the forbidden values of the last
+    one are removed from its domain."""
+
+    def __init__(self, restrictions):
+        assert restrictions
+        AbstractConstraint.__init__(self, restrictions.keys())
+        self._restrictions = {}
+        for variable, values in restrictions.items():
+            self._restrictions[variable] = dict.fromkeys(values)
+
+    def __repr__(self):
+        return '<NoGood %s>' % str(self._variables)
+
+    def estimateCost(self, domains):
+        """return cost"""
+        return len(self._variables)
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        free = None
+        for variable, forbidden in self._restrictions.items():
+            values = domains[variable].getValues()
+            allowed = [val for val in values if val not in forbidden]
+            if len(allowed) == len(values):
+                # no forbidden value left: the nogood cannot be violated
+                return 1
+            if allowed:
+                if free is not None:
+                    return 0
+                free = variable
+        if free is None:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+        domains[free].removeValues([val for val in domains[free].getValues()
+                                    if val in self._restrictions[free]])
+        return 1
+
+
+def merge_restrictions(path, restrictions):
+    """return the restrictions of path further restricted by restrictions
+
+    Both map variables to lists of values, as the distributors split
+    domains and as NoGood takes them: a variable restricted by both keeps
+    the values found in both lists."""
+    merged = path.copy()
+    for variable, values in restrictions.items():
+        if variable in merged:
+            keep = dict.fromkeys(merged[variable])
+            values = [val for val in values if val in keep]
+        merged[variable] = values
+    return merged
+
+
+def _augment(root, var_values, match, owner):
+    """look for an augmenting path from the unmatched variable root,
+    and update match and owner along it. Return True on success."""
+    visited = {}
+    stack = [(root, iter(var_values[root]))]
+    path = []
+    while stack:
+        var, values = stack[-1]
+        for j in values:
+            if j in visited:
+                continue
+            visited[j] = 1
+            if owner[j] is None:
+                # free value: shift the matching along the path
+                path.append(j)
+                for (var, _), j in zip(stack, path):
+                    match[var] = j
+                    owner[j] = var
+                return True
+            path.append(j)
+            stack.append((owner[j], iter(var_values[owner[j]])))
+            break
+        else:
+            stack.pop()
+            if path:
+                path.pop()
+    return False
+
+def _strongly_connected_components(successors):
+    """return a list giving the number of the strongly connected
+    component of each node of the graph (iterative Tarjan algorithm)"""
+    nb_nodes = len(successors)
+    index = [None] * nb_nodes
+    lowlink = [0] * nb_nodes
+    component = [None] * nb_nodes
+    on_stack = [0] * nb_nodes
+    scc_stack = []
+    counter = 0
+    nb_components = 0
+    for start in xrange(nb_nodes):
+        if index[start] is not None:
+            continue
+        index[start] = lowlink[start] = counter
+        counter += 1
+        scc_stack.append(start)
+        on_stack[start] = 1
+        work = [(start, iter(successors[start]))]
+        while work:
+            node, succs = work[-1]
+            for succ in succs:
+                if index[succ] is None:
+                    index[succ] = lowlink[succ] = counter
+                    counter += 1
+                    scc_stack.append(succ)
+                    on_stack[succ] = 1
+                    work.append((succ, iter(successors[succ])))
+                    break
+                elif on_stack[succ] and index[succ] < lowlink[node]:
+                    lowlink[node] = index[succ]
+            else:
+                work.pop()
+                if work and lowlink[node] < lowlink[work[-1][0]]:
+                    lowlink[work[-1][0]] = lowlink[node]
+                if lowlink[node] == index[node]:
+                    while True:
+                        member = scc_stack.pop()
+                        on_stack[member] = 0
+                        component[member] = nb_components
+                        if member == node:
+                            break
+                    nb_components += 1
+    return component
+
+
+
+
+# string literals, which are left as they are, or names which are not
+# attributes
+_NAME_RGX = re.compile(r'''('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|'''
+                       r'''(?<![\w.])[A-Za-z_]\w*)''')
+
+def _positional_formula(variables, formula):
+    """return formula with each variable renamed after its position
+    (_v0, _v1...), so that the constraints of the same shape share the
+    same template whatever the names of their variables"""
+    names = {}
+    for position, variable in enumerate(variables):
+        names[variable] = '_v%d' % position
+    def rename(match):
+        name = match.group(0)
+        return names.get(name, name)
+    return _NAME_RGX.sub(rename, formula)
 
 
 class Expression(AbstractConstraint):
     """A constraint represented as a python expression."""
+    # compiled formulas, keyed by (number of variables, positional
+    # template), see _positional_formula
     _FILTER_CACHE = {}
 
     def __init__(self, variables, formula, type='fd.Expression'):
         """variables is a list of variables which appear in the formula
-        formula is a python expression that will be evaluated as a boolean"""
+        formula is a python expression that will be evaluated as a boolean
+
+        filterFunc takes the values of the variables as positional
+        arguments, in the order of variables"""
         AbstractConstraint.__init__(self, variables)
         self.formula = formula
         self.type = type
+        template = _positional_formula(variables, formula)
+        key = (len(variables), template)
         try:
-            self.filterFunc = Expression._FILTER_CACHE[formula]
+            self.filterFunc = Expression._FILTER_CACHE[key]
         except KeyError:
             self.filterFunc = eval('lambda %s: %s' % \
-                                        (','.join(variables), formula), {}, {})
-            Expression._FILTER_CACHE[formula] = self.filterFunc
+                                   (','.join(['_v%d' % position for position
+                                              in range(len(variables))]),
+                                    template), {}, {})
+            Expression._FILTER_CACHE[key] = self.filterFunc
 
     def _init_result_cache(self):
-        """key = (variable,value), value = [has_success,has_failure]"""
-        result_cache = {}
-        for var_name in self._variables:
-            result_cache[var_name] = {}
-        return result_cache
+        """one dictionnary per variable, in the order of self._variables,
+        the values of which are the values known to be consistent"""
+        return [{} for var_name in self._variables]
 
 
     def _assign_values(self, domains):
+        """iterates on all the combinations of values of the variables,
+        given as a list in the order of self._variables. The same list
+        is modified and yielded again for each combination"""
         variables = []
-        kwargs = {}
-        for variable in self._variables:
+        args = []
+        for position, variable in enumerate(self._variables):
             domain = domains[variable]
             values = domain.getValues()
-            variables.append((domain.size(), [variable, values, 0, len(values)]))
-            kwargs[variable] = values[0]
+            variables.append((domain.size(),
+                              [position, values, 0, len(values)]))
+            args.append(values[0])
         # sort variables to instanciate those with fewer possible values first
         variables.sort()
 
         go_on = 1
         while go_on:
-            yield kwargs
+            yield args
             # try to instanciate the next variable
             for size, curr in variables:
                 if (curr[2] + 1) < curr[-1]:
                     curr[2] += 1
-                    kwargs[curr[0]] = curr[1][curr[2]]
+                    args[curr[0]] = curr[1][curr[2]]
                     break
                 else:
                     curr[2] = 0
-                    kwargs[curr[0]] = curr[1][0]
+                    args[curr[0]] = curr[1][0]
             else:
                 # it's over
                 go_on = 0
@@ -218,21 +813,22 @@ class Expression(AbstractConstraint):
         maybe_entailed = 1
         ffunc = self.filterFunc
         result_cache = self._init_result_cache()
-        for kwargs in self._assign_values(domains):
-            if maybe_entailed:
-                for var, val in kwargs.iteritems():
-                    if val not in result_cache[var]:
+        caches = zip(result_cache, range(len(result_cache)))
+        for args in self._assign_values(domains):
+            if not maybe_entailed:
+                for cache, position in caches:
+                    if args[position] not in cache:
                         break
                 else:
                     continue
-            if ffunc(**kwargs):
-                for var, val in kwargs.items():
-                    result_cache[var][val] = 1
+            if ffunc(*args):
+                for cache, position in caches:
+                    cache[args[position]] = 1
             else:
                 maybe_entailed = 0
 
         try:
-            for var, keep in result_cache.iteritems():
+            for var, keep in zip(self._variables, result_cache):
                 domain = domains[var]
                 domain.removeValues([val for val in domain if val not in keep])
                 
@@ -269,24 +865,28 @@ class BinaryExpression(Expression):
         dom2 = domains[var2]
         values2 = dom2.getValues()
         ffunc = self.filterFunc
-        if dom2.size() < dom1.size():
+        # iterate on the smallest domain in the outer loop
+        swapped = dom2.size() < dom1.size()
+        if swapped:
             var1, var2 = var2, var1
             dom1, dom2 = dom2, dom1
             values1, values2 = values2, values1
             
-        kwargs = {}
+        val1 = val2 = None
         keep1 = {}
         keep2 = {}
         maybe_entailed = 1
         try:
             # iterate for all values
             for val1 in values1:
-                kwargs[var1] = val1
                 for val2 in values2:
-                    kwargs[var2] = val2
                     if val1 in keep1 and val2 in keep2 and maybe_entailed == 0:
                         continue
-                    if ffunc(**kwargs):
+                    if swapped:
+                        consistent = ffunc(val2, val1)
+                    else:
+                        consistent = ffunc(val1, val2)
+                    if consistent:
                         keep1[val1] = 1
                         keep2[val2] = 1
                     else:
@@ -299,7 +899,7 @@ class BinaryExpression(Expression):
             raise ConsistencyFailure('Inconsistency while applying %s' % \
                                      repr(self))
         except Exception:
-            print self, kwargs
+            print self, {var1: val1, var2: val2}
             raise 
         return maybe_entailed
 
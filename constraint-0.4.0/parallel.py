@@ -0,0 +1,267 @@
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+"""
+parallel - part of Logilab's constraint satisfaction solver.
+
+Searches one repository with several processes: the top of the search
+tree is split into independent subproblems, which the processes take
+one after another from a shared queue until none is left.
+"""
+
+import traceback
+from time import time
+from Queue import Empty
+from collections import deque
+
+from logilab.constraint.psyco_wrapper import Psyobj
+from logilab.constraint.propagation import Solver, ConsistencyFailure, \
+     _BudgetExhausted, _improves
+from logilab.constraint.portfolio import supportsPortfolio, _POLL_INTERVAL
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+def _work(tasks, results, solver, subproblems, first, cost_func, incumbent,
+          max_nodes):
+    """search subproblems in a child process until the task queue gives
+    None, sending each solution found and the end of each subproblem
+    through the results queue"""
+    try:
+        solver._init_search(0, max_nodes)
+        if incumbent is not None:
+            lower_bound = getattr(cost_func, 'lower_bound', None)
+            if lower_bound is not None:
+                # the incumbent is the best cost found by any process
+                def prune(domains):
+                    return lower_bound(domains) > incumbent.value
+                solver._prune = prune
+        while True:
+            index = tasks.get()
+            if index is None:
+                break
+            for solution in solver._search(subproblems[index]):
+                cost = None
+                if incumbent is not None:
+                    cost = cost_func(**solution)
+                    if not _improves(incumbent, cost):
+                        continue
+                results.put(('solution', index, solution, cost))
+                if first:
+                    break
+            results.put(('done', index, None, None))
+        results.put(('exit', None, None, None))
+    except _BudgetExhausted:
+        results.put(('exhausted', None, None, None))
+    except Exception:
+        results.put(('error', None, traceback.format_exc(), None))
+
+
+class ParallelSolver(Psyobj):
+    """Searches a repository with several processes
+
+    The top levels of the search tree are expanded in the calling
+    process until there are about subproblems_per_process subproblems
+    per process; each process then searches the subproblems it takes
+    from a shared queue with the given solver, so that a process whose
+    subproblems were easy takes more of them. When optimizing, the
+    processes share the best cost found so far, which the lower bound
+    of the cost function is checked against.
+
+    Like for PortfolioSolver, the processes are forked and only the
+    solutions need to be picklable. Where processes cannot be forked,
+    the solver searches alone."""
+
+    def __init__(self, solver=None, processes=None,
+                 subproblems_per_process=4):
+        if solver is None:
+            solver = Solver()
+        if processes is None:
+            if multiprocessing is not None:
+                processes = multiprocessing.cpu_count()
+            else:
+                processes = 1
+        self.solver = solver
+        self.processes = processes
+        self.subproblems_per_process = subproblems_per_process
+        self.budget_exhausted = False
+        # number of subproblems the last search was split into
+        self.nb_subproblems = 0
+
+    def solve_one(self, repository, verbose=0, max_time=None):
+        """returns the first solution found by any process, or None if
+        there is none or none was found within max_time seconds"""
+        self.budget_exhausted = False
+        if not supportsPortfolio():
+            return self.solver.solve_one(repository, verbose)
+        search = self._parallel_search(repository, verbose, True, None,
+                                       None, max_time)
+        try:
+            for solution, cost in search:
+                return solution
+            return None
+        finally:
+            search.close()
+
+    def solve_all(self, repository, verbose=0, max_time=None):
+        """Generates all solutions, in the order the processes find them"""
+        self.budget_exhausted = False
+        if not supportsPortfolio():
+            for solution in self.solver.solve_all(repository, verbose):
+                yield solution
+            return
+        search = self._parallel_search(repository, verbose, False, None,
+                                       None, max_time)
+        try:
+            for solution, cost in search:
+                yield solution
+        finally:
+            search.close()
+
+    def solve(self, repository, verbose=0):
+        """return list of all solutions"""
+        return list(self.solve_all(repository, verbose))
+
+    def solve_best(self, repository, cost_func, verbose=0,
+                   max_nodes=None, max_time=None):
+        """Generates solutions with an improving cost (see
+        Solver.solve_best)
+
+        max_nodes bounds the search of each process and max_time the
+        whole search; when either is spent self.budget_exhausted is set."""
+        self.budget_exhausted = False
+        if not supportsPortfolio():
+            solver = self.solver
+            for solution, cost in solver.solve_best(repository, cost_func,
+                                                    verbose, max_nodes,
+                                                    max_time):
+                yield solution, cost
+            self.budget_exhausted = solver.budget_exhausted
+            return
+        best = None
+        search = self._parallel_search(repository, verbose, False, cost_func,
+                                       max_nodes, max_time)
+        try:
+            for solution, cost in search:
+                if best is None or cost <= best:
+                    best = cost
+                    yield solution, cost
+        finally:
+            search.close()
+
+    def _split(self, repository, verbose):
+        """expands the top of the search tree breadth first
+
+        Returns (solutions, subproblems): the solutions met while
+        expanding, and the repositories left to search."""
+        target = self.processes * self.subproblems_per_process
+        distributor = self.solver._distributor
+        solutions = []
+        frontier = deque([repository])
+        while frontier and len(frontier) < target:
+            repo = frontier.popleft()
+            try:
+                foundSolution = repo.consistency(verbose)
+            except ConsistencyFailure:
+                continue
+            if foundSolution:
+                solution = {}
+                for variable, domain in repo.getDomains().items():
+                    solution[variable] = domain.getValues()[0]
+                solutions.append(solution)
+            else:
+                frontier.extend(repo.distribute(distributor, verbose >= 2))
+        return solutions, list(frontier)
+
+    def _parallel_search(self, repository, verbose, first, cost_func,
+                         max_nodes, max_time):
+        """splits the repository and generates the (solution, cost)
+        pairs found by the processes searching it; cost is None unless
+        a cost function is given. The processes still running are
+        terminated when the generator is closed."""
+        if max_time is None:
+            deadline = None
+        else:
+            deadline = time() + max_time
+        solutions, subproblems = self._split(repository, verbose)
+        self.nb_subproblems = len(subproblems)
+        for solution in solutions:
+            if cost_func is None:
+                yield solution, None
+            else:
+                yield solution, cost_func(**solution)
+        if not subproblems:
+            return
+
+        incumbent = None
+        if cost_func is not None:
+            incumbent = multiprocessing.Value('d', float('inf'))
+            for solution in solutions:
+                incumbent.value = min(incumbent.value, cost_func(**solution))
+        tasks = multiprocessing.Queue()
+        results = multiprocessing.Queue()
+        for index in range(len(subproblems)):
+            tasks.put(index)
+        nb_processes = min(self.processes, len(subproblems))
+        for index in range(nb_processes):
+            tasks.put(None)
+        processes = []
+        try:
+            for index in range(nb_processes):
+                process = multiprocessing.Process(
+                    target=_work, args=(tasks, results, self.solver,
+                                        subproblems, first, cost_func,
+                                        incumbent, max_nodes))
+                process.daemon = True
+                process.start()
+                processes.append(process)
+            running = nb_processes
+            done = 0
+            while running:
+                timeout = _POLL_INTERVAL
+                if deadline is not None:
+                    timeout = min(timeout, deadline - time())
+                    if timeout <= 0:
+                        self.budget_exhausted = True
+                        return
+                try:
+                    kind, index, data, cost = results.get(True, timeout)
+                except Empty:
+                    # a process killed from outside never says it exits
+                    alive = len([process for process in processes
+                                 if process.is_alive()])
+                    if alive < running and results.empty():
+                        raise RuntimeError('a search process died')
+                    continue
+                if kind == 'solution':
+                    yield data, cost
+                elif kind == 'done':
+                    done += 1
+                elif kind == 'error':
+                    raise RuntimeError('search process failed:\n%s' % data)
+                else:
+                    running -= 1
+            if done < len(subproblems):
+                # processes spent their budget before the queue was empty
+                self.budget_exhausted = True
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
@@ -0,0 +1,221 @@
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+"""
+portfolio - part of Logilab's constraint satisfaction solver.
+
+Runs several Solvers on the same repository at once, each in its own
+process, and keeps the first or the best answer. Which distributor
+searches a problem fastest varies a lot from one problem to the next;
+racing a few of them bounds the time by the fastest one.
+"""
+
+import os
+import random
+import traceback
+from time import time
+from Queue import Empty
+
+from logilab.constraint.psyco_wrapper import Psyobj
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+# how often (in seconds) the portfolio checks that its processes are
+# still alive while waiting for them
+_POLL_INTERVAL = .5
+
+def _run(queue, index, solver, method, repository, args, seed):
+    """search the repository in a child process, sending each solution
+    found and the end of the search through the queue"""
+    random.seed(seed)
+    try:
+        if method == 'solve_one':
+            solution = solver.solve_one(repository, *args)
+            if solution is not None:
+                queue.put(('solution', index, solution, None))
+        else:
+            for solution, cost in solver.solve_best(repository, *args):
+                queue.put(('solution', index, solution, cost))
+        queue.put(('done', index, not solver.budget_exhausted, None))
+    except Exception:
+        queue.put(('error', index, traceback.format_exc(), None))
+
+def supportsPortfolio():
+    """tells whether the solvers of a portfolio can run in parallel"""
+    return multiprocessing is not None and hasattr(os, 'fork')
+
+
+class PortfolioSolver(Psyobj):
+    """Races several Solvers on the same repository, one process each
+
+    The solvers are usually given different distributors; the random
+    module of the process running solvers[i] is seeded with seed + i, so
+    that randomizing distributors explore different trees. A
+    PortfolioSolver is used like a Solver: solve_one returns the first
+    solution found by any solver, solve_best generates the solutions
+    improving on the best one found by all of them.
+
+    The processes are forked, so neither the repository nor the cost
+    function need to be picklable, but the solutions must be. Where
+    processes cannot be forked, the first solver runs alone."""
+
+    def __init__(self, solvers, seed=0):
+        assert solvers
+        self.solvers = solvers
+        self.seed = seed
+        self.budget_exhausted = False
+        # index of the solver that found the last solution kept
+        self.winner = None
+
+    def solve_one(self, repository, verbose=0, max_time=None):
+        """returns the first solution found by any solver, or None if
+        there is none or none was found within max_time seconds"""
+        self.budget_exhausted = False
+        self.winner = None
+        if not supportsPortfolio():
+            self.winner = 0
+            return self.solvers[0].solve_one(repository, verbose)
+        race = self._race('solve_one', repository, (verbose,), max_time)
+        try:
+            for kind, index, data, cost in race:
+                if kind == 'solution':
+                    self.winner = index
+                    return data
+                if kind == 'done':
+                    # a complete search found nothing: there is no solution
+                    return None
+            return None
+        finally:
+            race.close()
+
+    def solve_best(self, repository, cost_func, verbose=0,
+                   max_nodes=None, max_time=None):
+        """Generates solutions with an improving cost, as found by any
+        of the solvers (see Solver.solve_best)
+
+        The solvers share the best cost found by any of them, which
+        their lower bounds are checked against (see the incumbent
+        argument of Solver.solve_best). The search stops as soon as one
+        solver completes its own search, which proves the best solution
+        optimal. max_nodes bounds the search of each solver and max_time
+        the whole portfolio; when all the solvers spend their budget, or
+        time runs out, self.budget_exhausted is set."""
+        self.budget_exhausted = False
+        self.winner = None
+        if not supportsPortfolio():
+            solver = self.solvers[0]
+            self.winner = 0
+            for solution, cost in solver.solve_best(repository, cost_func,
+                                                    verbose, max_nodes,
+                                                    max_time):
+                yield solution, cost
+            self.budget_exhausted = solver.budget_exhausted
+            return
+        best = None
+        exhausted = 0
+        incumbent = multiprocessing.Value('d', float('inf'))
+        race = self._race('solve_best', repository,
+                          (cost_func, verbose, max_nodes, None, incumbent),
+                          max_time)
+        complete = False
+        try:
+            for kind, index, data, cost in race:
+                if kind == 'solution':
+                    if best is None or cost <= best:
+                        best = cost
+                        self.winner = index
+                        yield data, cost
+                elif data:
+                    # complete search: nothing better than the shared
+                    # incumbent exists, but the solution that set it may
+                    # not have come through yet
+                    complete = True
+                else:
+                    exhausted += 1
+                    if exhausted == len(self.solvers):
+                        self.budget_exhausted = True
+                        return
+                if complete:
+                    if best is None:
+                        received = float('inf')
+                    else:
+                        received = best
+                    if received <= incumbent.value:
+                        return
+        finally:
+            race.close()
+
+    def _race(self, method, repository, args, max_time):
+        """starts one process per solver and generates the messages they
+        send as (kind, solver index, data, cost) tuples, where kind is
+        'solution' or 'done' (data then tells whether the search was
+        complete). The processes still running are terminated when the
+        generator is closed, and errors raised in them are raised here
+        once every solver has failed."""
+        if max_time is None:
+            deadline = None
+        else:
+            deadline = time() + max_time
+        queue = multiprocessing.Queue()
+        processes = []
+        try:
+            for index, solver in enumerate(self.solvers):
+                process = multiprocessing.Process(
+                    target=_run, args=(queue, index, solver, method,
+                                       repository, args, self.seed + index))
+                process.daemon = True
+                process.start()
+                processes.append(process)
+            running = dict.fromkeys(range(len(processes)))
+            errors = []
+            while running:
+                timeout = _POLL_INTERVAL
+                if deadline is not None:
+                    timeout = min(timeout, deadline - time())
+                    if timeout <= 0:
+                        self.budget_exhausted = True
+                        return
+                try:
+                    kind, index, data, cost = queue.get(True, timeout)
+                except Empty:
+                    # a process killed from outside never says it is done
+                    for index in running.keys():
+                        if not processes[index].is_alive() and \
+                               queue.empty():
+                            del running[index]
+                            errors.append('solver %d died' % index)
+                    continue
+                if kind == 'error':
+                    del running[index]
+                    errors.append(data)
+                    continue
+                if kind == 'done':
+                    del running[index]
+                yield kind, index, data, cost
+            if errors and len(errors) == len(processes):
+                raise RuntimeError('every solver failed:\n%s' % errors[0])
+            if errors:
+                # the solvers which failed did not finish their search
+                self.budget_exhausted = True
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
@@ -18,7 +18,8 @@
 
 from __future__ import generators
 from operator import mul as MUL
-from time import strftime
+from time import strftime, time
+from heapq import heapify, heappush, heappop
 from logilab.constraint.interfaces import DomainInterface, ConstraintInterface
 from logilab.constraint.psyco_wrapper import Psyobj
 from logilab.common.compat import enumerate
@@ -29,7 +30,43 @@ def _default_printer(*msgs):
     print msgs[-1]
 class ConsistencyFailure(Exception):
     """The repository is not in a consistent state"""
-    pass
+    # the constraint whose narrowing failed, when it is known
+    constraint = None
+
+class _ConstraintSet(Psyobj):
+    """Set of constraints, compared by identity, that keeps the order in
+    which they were added except for removals: a removed constraint is
+    replaced by the last one, so that adding and removing are O(1)."""
+
+    def __init__(self):
+        self._items = []
+        self._index = {}
+
+    def add(self, constraint):
+        if id(constraint) in self._index:
+            return
+        self._index[id(constraint)] = len(self._items)
+        self._items.append(constraint)
+
+    def remove(self, constraint):
+        """remove constraint, raise KeyError if it is not in the set"""
+        index = self._index.pop(id(constraint))
+        last = self._items.pop()
+        if last is not constraint:
+            self._items[index] = last
+            self._index[id(last)] = index
+
+    def __contains__(self, constraint):
+        return id(constraint) in self._index
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return repr(self._items)
 
 class Repository(Psyobj):
     """Stores variables, domains and constraints
@@ -46,11 +83,11 @@ class Repository(Psyobj):
                 
         self._variables = variables   # list of variable names
         self._domains = domains    # maps variable name to domain object
-        self._constraints = [] # list of constraint objects
-#        self._queue = []       # queue of constraints waiting to be processed
+        self._constraints = _ConstraintSet() # constraint objects
         self._variableListeners = {}
+        self._trail = None
         for var in self._variables:
-            self._variableListeners[var] = []
+            self._variableListeners[var] = _ConstraintSet()
             assert self._domains.has_key(var)
         for constr in constraints or ():
             self.addConstraint(constr)
@@ -129,20 +166,37 @@ class Repository(Psyobj):
             var = constraint.getVariable()
             constraint.narrow({var: self._domains[var]})
         else:
-            self._constraints.append(constraint)
+            self._constraints.add(constraint)
             for var in constraint.affectedVariables():
-                self._variableListeners[var].append(constraint)
+                self._variableListeners[var].add(constraint)
         
+    def removeConstraint(self, constraint):
+        """Remove a constraint added with addConstraint. Unlike the
+        constraints entailed by a search with a trail, it is not put
+        back when backtracking."""
+        trail = self._trail
+        self._trail = None
+        try:
+            self._removeConstraint(constraint)
+        finally:
+            self._trail = trail
+
     def _removeConstraint(self, constraint):
         self._constraints.remove(constraint)
         for var in constraint.affectedVariables():
             try:
                 self._variableListeners[var].remove(constraint)
-            except ValueError:
+            except KeyError:
                 raise ValueError('Error removing constraint from listener',
                                  var,
                                  self._variableListeners[var],
                                  constraint)
+        if self._trail is not None:
+            self._trail.append((self, constraint))
+
+    def _undo(self, constraint):
+        """put back a constraint entailed while recording on a trail"""
+        self.addConstraint(constraint)
 
     def getDomains(self):
         return self._domains
@@ -167,11 +221,66 @@ class Repository(Psyobj):
 ##             for constraint in backup_constraints:
 ##                 self.addConstraint(constraint)
 ##             yield self
+
+    def supportsTrail(self):
+        """Returns True if all the domains can record their changes
+        on a trail, which is required by enableTrail"""
+        for domain in self._domains.itervalues():
+            if not hasattr(domain, '_undo'):
+                return False
+        return True
+
+    def enableTrail(self):
+        """Start recording domain removals and entailed constraints on a
+        trail, so that the repository can be searched in place: mark()
+        gives the current position on the trail and backtrack() undoes
+        everything done since a mark.
+        Changes recorded before this call are forgotten."""
+        self._trail = []
+        for domain in self._domains.itervalues():
+            domain._trail = self._trail
+
+    def disableTrail(self):
+        """Stop recording changes on the trail"""
+        self._trail = None
+        for domain in self._domains.itervalues():
+            domain._trail = None
+
+    def mark(self):
+        """Returns the current position on the trail"""
+        return len(self._trail)
+
+    def backtrack(self, mark):
+        """Undo every change recorded on the trail since mark"""
+        trail = self._trail
+        while len(trail) > mark:
+            undoer, data = trail.pop()
+            undoer._undo(data)
+
+    def restrict(self, restrictions):
+        """Restricts domains in place: restrictions maps variables to
+        the values their domain must keep (as returned by the split()
+        method of distributors)"""
+        for variable, values in restrictions.items():
+            domain = self._domains[variable]
+            keep = dict.fromkeys(values)
+            domain.removeValues([val for val in domain.getValues()
+                                 if val not in keep])
+            domain.resetFlags()
     
-    def consistency(self, verbose=0, custom_printer=None):
+    def consistency(self, verbose=0, custom_printer=None, variables=None,
+                    stats=None, explanations=None):
         """Prunes the domains of the variables
         This method calls constraint.narrow() and queues constraints
         that are affected by recent changes in the domains.
+        If variables is given, only the constraints on these variables
+        are queued at first, which is enough when the domains were
+        consistent before these variables were restricted.
+        If stats is given, each call to narrow() is recorded there
+        (see SolverStats).
+        If explanations is given, the decisions each pruning depends on
+        are recorded there, and so is the conflict of a failure (see
+        Explanations).
         Returns True if a solution was found"""
         if custom_printer is None:
             printer = self._printer
@@ -180,98 +289,429 @@ class Repository(Psyobj):
         if verbose:
             printer( strftime('%H:%M:%S'), '** Consistency **')
 
-        _queue = [ (constr.estimateCost(self._domains),
-                           constr) for constr in self._constraints ]
-        _queue.sort()
-        _affected_constraints = {}
-        while True:
-            if not _queue:
-                # refill the queue if some constraints have been affected
-                _queue = [(constr.estimateCost(self._domains),
-                           constr) for constr in _affected_constraints]
-                if not _queue:
-                    break
-                _queue.sort()
-                _affected_constraints.clear()
+        # the queue is a heap of (cost, order, constraint); order keeps
+        # constraints of equal cost in the order they were queued
+        domains = self._domains
+        if variables is None:
+            constraints = self._constraints
+        else:
+            constraints = _ConstraintSet()
+            for var in variables:
+                for constr in self._variableListeners[var]:
+                    constraints.add(constr)
+        _queue = [(constr.estimateCost(domains), order, constr)
+                  for order, constr in enumerate(constraints)]
+        heapify(_queue)
+        _queued = set([id(constr) for constr in constraints])
+        order = len(_queue)
+        while _queue:
             if verbose > 2:
-                printer( strftime('%H:%M:%S'), 'Queue', _queue)
-            cost, constraint = _queue.pop(0)
+                printer( strftime('%H:%M:%S'), 'Queue', sorted(_queue))
+            cost, _, constraint = heappop(_queue)
+            _queued.remove(id(constraint))
             if verbose > 1:
                 printer( strftime('%H:%M:%S'),
                 'Trying to entail constraint', constraint, '[cost:%d]' % cost)
-            entailed = constraint.narrow(self._domains)
+            try:
+                if stats is None:
+                    entailed = constraint.narrow(domains)
+                else:
+                    entailed = stats.narrow(constraint, domains)
+            except ConsistencyFailure, exc:
+                exc.constraint = constraint
+                if explanations is not None:
+                    explanations.conflict = explanations.explain(
+                        constraint.affectedVariables())
+                raise
+            reason = None
             for var in constraint.affectedVariables():
                 # affected constraints are listeners of
                 # affected variables of this constraint
-                dom = self._domains[var]
+                dom = domains[var]
                 if not dom.hasChanged():
                     continue
                 if verbose > 1 :
                     printer( strftime('%H:%M:%S'),
                         ' -> New domain for variable', var, 'is', dom)
+                if explanations is not None:
+                    if reason is None:
+                        reason = explanations.explain(
+                            constraint.affectedVariables())
+                    explanations.setReason(var, reason)
                 for constr in self._variableListeners[var]:
-                    if constr is not constraint:
-                        _affected_constraints[constr] = True
+                    if constr is not constraint and \
+                           id(constr) not in _queued:
+                        _queued.add(id(constr))
+                        heappush(_queue,
+                                 (constr.estimateCost(domains), order, constr))
+                        order += 1
                 dom.resetFlags()
             if entailed:
                 if verbose:
                     printer( strftime('%H:%M:%S'),
                         "--> Entailed constraint", constraint)
                 self._removeConstraint(constraint)
-                if constraint in _affected_constraints:
-                    del _affected_constraints[constraint]
                 
         for domain in self._domains.itervalues():
             if domain.size() != 1:
                 return 0
         return 1
 
+_NO_REASON = frozenset()
+
+class Explanations(Psyobj):
+    """The decisions the domains of a search with a trail depend on
+
+    Each decision of the search restricts some domains, and has the
+    level of the node where it is taken. The reason of a variable is the
+    set of the levels of the decisions its domain depends on: the levels
+    of the decisions restricting it, and the reasons of the variables of
+    the constraints which pruned it, since a constraint only looks at
+    the domains of its variables. The conflict of a failure is likewise
+    the union of the reasons of the variables of the failing constraint:
+    no node below the same decisions can satisfy it.
+
+    The reasons are recorded on the trail of the repository, so that
+    backtracking restores them."""
+
+    def __init__(self, repository):
+        self._trail = repository._trail
+        self.reasons = {}
+        # conflict of the last failure, None if no constraint failed
+        self.conflict = None
+
+    def explain(self, variables):
+        """returns the union of the reasons of variables"""
+        reasons = self.reasons
+        explanation = _NO_REASON
+        for var in variables:
+            reason = reasons.get(var, _NO_REASON)
+            if not reason <= explanation:
+                explanation = explanation | reason
+        return explanation
+
+    def setReason(self, variable, reason):
+        """add reason to the reason of variable"""
+        old = self.reasons.get(variable, _NO_REASON)
+        if reason <= old:
+            return
+        self._trail.append((self, (variable, old)))
+        self.reasons[variable] = old | reason
+
+    def decide(self, restrictions, level):
+        """record the restrictions (see Repository.restrict) of the
+        decision of the given level"""
+        reason = frozenset([level])
+        for variable in restrictions:
+            self.setReason(variable, reason)
+
+    def _undo(self, data):
+        """put back the reason of a variable"""
+        variable, reason = data
+        self.reasons[variable] = reason
+
+class SolverStats(Psyobj):
+    """Counters of a search, filled by the Solver it is given to
+
+    Besides the counts of search nodes, failures, distributions and
+    solutions, it records for every constraint class how often its
+    narrow() method was called, how long these calls took, how many
+    values they pruned and how many of them failed. The same counters
+    are kept for every constraint, told apart by its class and its
+    variables, to find which ones of a problem do most of the work.
+    With histogram=True, the durations of the calls are also counted
+    per power of two of microseconds.
+
+    Nothing is recorded unless the Solver is given a SolverStats, and
+    the search is then somewhat slower."""
+
+    def __init__(self, histogram=False):
+        self.histogram = histogram
+        self.reset()
+
+    def reset(self):
+        """clear every counter"""
+        self.nodes = 0
+        self.failures = 0
+        self.distributions = 0
+        self.solutions = 0
+        self.max_depth = 0
+        self.wall_time = 0.
+        self.domain_copies = 0
+        self.domain_writes = 0
+        # constraint class name -> [narrow calls, time, values pruned,
+        # failures, {duration bucket: calls}]
+        self.constraints = {}
+        # (class name, variables) -> the same record, for each constraint
+        self.instances = {}
+        # id of each constraint met -> its key in instances
+        self._keys = {}
+        self._start = None
+
+    def start(self):
+        """start timing a search"""
+        from logilab.constraint.fd import FiniteDomain
+        self.reset()
+        self._start = time()
+        self._copies = FiniteDomain._copy_count
+        self._writes = FiniteDomain._write_count
+
+    def stop(self):
+        """stop timing the search started last"""
+        from logilab.constraint.fd import FiniteDomain
+        if self._start is None:
+            return
+        self.wall_time = time() - self._start
+        self.domain_copies = FiniteDomain._copy_count - self._copies
+        self.domain_writes = FiniteDomain._write_count - self._writes
+        self._start = None
+
+    def narrow(self, constraint, domains):
+        """calls constraint.narrow(domains) and records how it went"""
+        name = constraint.__class__.__name__
+        record = self.constraints.get(name)
+        if record is None:
+            record = self.constraints[name] = [0, 0., 0, 0, {}]
+        variables = constraint.affectedVariables()
+        key = self._keys.get(id(constraint))
+        if key is None:
+            key = self._keys[id(constraint)] = (name, tuple(variables))
+        instance = self.instances.get(key)
+        if instance is None:
+            instance = self.instances[key] = [0, 0., 0, 0, {}]
+        size = 0
+        for var in variables:
+            size += domains[var].size()
+        start = time()
+        try:
+            entailed = constraint.narrow(domains)
+        except ConsistencyFailure:
+            duration = time() - start
+            for counters in (record, instance):
+                counters[3] += 1
+                self._recordCall(counters, duration)
+            raise
+        duration = time() - start
+        for var in variables:
+            size -= domains[var].size()
+        for counters in (record, instance):
+            self._recordCall(counters, duration)
+            counters[2] += size
+        return entailed
+
+    def _recordCall(self, record, duration):
+        """count a call to narrow() which took duration seconds"""
+        record[0] += 1
+        record[1] += duration
+        if self.histogram:
+            bucket = 0
+            microseconds = int(duration * 1e6)
+            while microseconds:
+                bucket += 1
+                microseconds >>= 1
+            record[4][bucket] = record[4].get(bucket, 0) + 1
+
+    def asDict(self):
+        """returns the counters as a dictionary of plain values
+
+        The constraints entry maps constraint class names to
+        dictionaries; with a histogram, their histogram entry maps
+        k to the number of calls to narrow() that took less than
+        2**k microseconds. The instances entry holds the same
+        dictionaries for every constraint, keyed by its class name
+        followed by its variables, with class and variables entries."""
+        constraints = {}
+        for name, record in self.constraints.items():
+            constraints[name] = self._recordDict(record)
+        instances = {}
+        for (name, variables), record in self.instances.items():
+            counters = self._recordDict(record)
+            counters['class'] = name
+            counters['variables'] = [str(var) for var in variables]
+            instances['%s(%s)' % (name, ', '.join(counters['variables']))] = \
+                counters
+        return {'nodes': self.nodes,
+                'failures': self.failures,
+                'distributions': self.distributions,
+                'solutions': self.solutions,
+                'max_depth': self.max_depth,
+                'wall_time': self.wall_time,
+                'domain_copies': self.domain_copies,
+                'domain_writes': self.domain_writes,
+                'constraints': constraints,
+                'instances': instances}
+
+    def _recordDict(self, record):
+        """returns the counters of a record as a dictionary"""
+        calls, duration, pruned, failures, histogram = record
+        counters = {'narrow_calls': calls,
+                    'narrow_time': duration,
+                    'values_pruned': pruned,
+                    'failures': failures}
+        if self.histogram:
+            counters['histogram'] = dict(histogram)
+        return counters
+
+    def asJSON(self):
+        """returns the counters as a JSON string (see asDict)"""
+        import json
+        return json.dumps(self.asDict(), sort_keys=True)
+
+
+class _BudgetExhausted(Exception):
+    """Raised inside the search when its node or time budget is spent"""
+    pass
+
+def _improves(incumbent, cost):
+    """tells whether cost is no greater than the best cost shared by
+    several searches in incumbent (a multiprocessing.Value), which is
+    then set to it"""
+    lock = incumbent.get_lock()
+    lock.acquire()
+    try:
+        if cost > incumbent.value:
+            return False
+        incumbent.value = cost
+        return True
+    finally:
+        lock.release()
+
 class Solver(Psyobj):
     """Top-level object used to manage the search"""
 
-    def __init__(self, distributor=None, printer=_default_printer):
-        """if no distributer given, will use the default one"""
+    def __init__(self, distributor=None, printer=_default_printer,
+                 trail=False, stats=None):
+        """if no distributer given, will use the default one
+
+        With trail=True, the search modifies the repository in place and
+        undoes the changes of a branch when backtracking, instead of
+        copying every domain for every branch. Repositories whose domains
+        cannot record their changes are still searched by copy.
+
+        If stats, a SolverStats, is given, it is reset by every search
+        and holds its counters once the search is over."""
         self.printer = printer
         if distributor is None:
             from logilab.constraint.distributors import DefaultDistributor
             distributor = DefaultDistributor()
         self.verbose = True
         self._distributor = distributor
+        # distributors which learn from the search are told how the
+        # consistency check of each node went
+        self._learning = hasattr(distributor, 'notifyFailure')
         self.max_depth = 0
-
-    def solve_one(self, repository, verbose=0):
-        """Generates only one solution"""
+        self.node_cnt = 0
+        self.fail_cnt = 0
+        self.trail = trail
+        self.budget_exhausted = False
+        self._max_nodes = None
+        self._deadline = None
+        self._prune = None
+        self.stats = stats
+        # set by the solvers recording why the nodes fail
+        self._explanations = None
+
+    def _init_search(self, verbose, max_nodes=None, max_time=None):
+        """reset the counters and set the budget of a new search"""
         self.verbose = verbose
         self.max_depth = 0
         self.distrib_cnt = 0
+        self.node_cnt = 0
+        self.fail_cnt = 0
+        self.budget_exhausted = False
+        self._max_nodes = max_nodes
+        if max_time is None:
+            self._deadline = None
+        else:
+            self._deadline = time() + max_time
+        self._prune = None
+        if self.stats is not None:
+            self.stats.start()
+
+    def _end_search(self, nb_solutions):
+        """complete the statistics of the search"""
+        stats = self.stats
+        if stats is None:
+            return
+        stats.stop()
+        stats.nodes = self.node_cnt
+        stats.distributions = self.distrib_cnt
+        stats.max_depth = self.max_depth
+        stats.solutions = nb_solutions
+
+    def solve_one(self, repository, verbose=0):
+        """Generates only one solution"""
+        self._init_search(verbose)
+        solution = None
         try:
             # XXX  FIXME: this is a workaround a bug in psyco-1.4
 ##             return  self._solve(repository).next()
-            return  self._solve(repository, 0).next()
+            solution = self._search(repository).next()
+            return solution
         except StopIteration:
             return
+        finally:
+            self._end_search(int(solution is not None))
         
-    def solve_best(self, repository, cost_func, verbose=0):
-        """Generates solution with an improving cost"""
-        self.verbose = verbose
-        self.max_depth = 0
-        self.distrib_cnt = 0
-        best_cost = None
+    def solve_best(self, repository, cost_func, verbose=0,
+                   max_nodes=None, max_time=None, incumbent=None):
+        """Generates solution with an improving cost
+
+        If cost_func has a lower_bound attribute, it is called with the
+        domains of each search node and must return a value no greater
+        than the cost of any solution below that node; the subtrees that
+        cannot match the best cost found so far are not explored.
+
+        max_nodes and max_time (in seconds) bound the search. When the
+        budget is spent the generator stops and self.budget_exhausted is
+        set: the last solution generated is the best one found so far.
+
+        incumbent, a multiprocessing.Value('d'), shares the best cost
+        with searches run by other processes: the solutions costing more
+        are not generated, and the lower bound is checked against it."""
+        self._init_search(verbose, max_nodes, max_time)
+        best = [None]
+        nb_solutions = 0
+        lower_bound = getattr(cost_func, 'lower_bound', None)
+        if lower_bound is not None:
+            def prune(domains):
+                bound = best[0]
+                if incumbent is not None and \
+                       (bound is None or incumbent.value < bound):
+                    bound = incumbent.value
+                return bound is not None and lower_bound(domains) > bound
+            self._prune = prune
+        try:
             # XXX  FIXME: this is a workaround a bug in psyco-1.4
-##        for solution in self._solve(repository):
-        for solution in self._solve(repository, 0):
-            cost = cost_func(**solution)
-            if best_cost is None or cost <= best_cost:
-                best_cost = cost
-                yield solution, cost            
+##            for solution in self._solve(repository):
+            for solution in self._search(repository):
+                nb_solutions += 1
+                cost = cost_func(**solution)
+                if best[0] is None or cost <= best[0]:
+                    if incumbent is not None and \
+                           not _improves(incumbent, cost):
+                        continue
+                    best[0] = cost
+                    yield solution, cost
+        except _BudgetExhausted:
+            self.budget_exhausted = True
+            if verbose:
+                self.printer( strftime('%H:%M:%S'),
+                              'Search budget exhausted after %d nodes' %
+                              self.node_cnt)
+        finally:
+            self._end_search(nb_solutions)
         
     def solve_all(self, repository, verbose=0):
         """Generates all solutions"""
-        self.verbose = verbose
-        self.max_depth = 0
-        self.distrib_cnt = 0
-        for solution in self._solve(repository):
-            yield solution
+        self._init_search(verbose)
+        nb_solutions = 0
+        try:
+            for solution in self._search(repository):
+                nb_solutions += 1
+                yield solution
+        finally:
+            self._end_search(nb_solutions)
 
     def solve(self, repository, verbose=0):
         """return list of all solutions"""
@@ -281,44 +721,159 @@ class Solver(Psyobj):
         for solution in self.solve_all(repository, verbose):
             solutions.append(solution)
         return solutions
+
+    def _search(self, repository):
+        """return the main generator suited to the repository"""
+        if self.trail and repository.supportsTrail():
+            repository.enableTrail()
+            return self._solve_in_place(repository)
+        return self._solve(repository)
+
+    def _count_node(self):
+        """count a search node, raising _BudgetExhausted when the
+        budget of the search is spent"""
+        self.node_cnt += 1
+        if self._max_nodes is not None and self.node_cnt > self._max_nodes:
+            raise _BudgetExhausted()
+        if self._deadline is not None and time() > self._deadline:
+            raise _BudgetExhausted()
         
-    def _solve(self, repository, recursion_level=0):
-        """main generator"""
-        _solve = self._solve
+    def _visit(self, repository, recursion_level, changed=None):
+        """check the consistency of a search node
+
+        changed holds the restrictions applied since the last
+        consistency check of the repository, None if unknown (see
+        Repository.consistency). Returns the solution found at the
+        node, True if the node must be distributed, or None if it fails
+        or cannot improve on the best cost"""
         verbose = self.verbose
         if recursion_level > self.max_depth:
             self.max_depth = recursion_level
+        self._count_node()
         if verbose >= 2:
             self.printer( strftime('%H:%M:%S'),)
             self.printer( '*** [%d] Solve called with repository' % recursion_level,)
             repository.display_vars()
         try:
-            foundSolution = repository.consistency(verbose, custom_printer=self.printer)
+            foundSolution = repository.consistency(
+                verbose, custom_printer=self.printer, variables=changed,
+                stats=self.stats, explanations=self._explanations)
         except ConsistencyFailure, exc:
             if verbose:
                 self.printer( strftime('%H:%M:%S'), exc)
-        else:
-            if foundSolution:
-                solution = {}
-                for variable, domain in repository.getDomains().items():
-                    solution[variable] = domain.getValues()[0]
-                if verbose:
-                    self.printer( strftime('%H:%M:%S'), '### Found Solution', solution)
-                    self.printer( '-'*80)
-                yield solution
-            else:
-                self.distrib_cnt += 1
-                for repo in repository.distribute(self._distributor,
-                                                  verbose>=2):
-                    for solution in _solve(repo, recursion_level+1):
-                        if solution is not None:
-                            yield solution
-                            
-        if recursion_level == 0 and self.verbose:
-            self.printer( strftime('%H:%M:%S'),'Finished search')
-            self.printer( strftime('%H:%M:%S'), 'Maximum recursion depth = ',
-                self.max_depth)
-            self.printer( 'Nb distributions = ', self.distrib_cnt)
+            self.fail_cnt += 1
+            if self.stats is not None:
+                self.stats.failures += 1
+            if self._learning:
+                self._distributor.notifyFailure(changed, exc.constraint)
+            return None
+        if self._learning:
+            self._distributor.notifyPropagation(changed,
+                                                repository.getDomains())
+        if foundSolution:
+            solution = {}
+            for variable, domain in repository.getDomains().items():
+                solution[variable] = domain.getValues()[0]
+            if verbose:
+                self.printer( strftime('%H:%M:%S'), '### Found Solution', solution)
+                self.printer( '-'*80)
+            return solution
+        if self._prune is not None and \
+               self._prune(repository.getDomains()):
+            if verbose:
+                self.printer( strftime('%H:%M:%S'),
+                              'Pruned: cannot improve on best cost')
+            return None
+        self.distrib_cnt += 1
+        return True
+
+    def _solve(self, repository):
+        """main generator
+
+        The search is a depth first traversal driven by an explicit
+        stack, so that a solution is yielded directly whatever its
+        depth, and only the repositories of the current path, whose
+        remaining children are still to be created, are kept."""
+        distributor = self._distributor
+        verbose = self.verbose
+        # iterators over the children not yet searched of the nodes of
+        # the current path, the deepest last
+        stack = [iter([repository])]
+        while stack:
+            try:
+                repo = stack[-1].next()
+            except StopIteration:
+                stack.pop()
+                continue
+            outcome = self._visit(repo, len(stack) - 1)
+            if outcome is True:
+                stack.append(repo.distribute(distributor, verbose>=2))
+            elif outcome is not None:
+                yield outcome
+
+        if verbose:
+            self._print_summary()
+
+    def _solve_in_place(self, repository):
+        """main generator of the search with a trail
+
+        repository is modified in place: the restrictions of a branch
+        (see AbstractDistributor.split) are undone when backtracking,
+        and the search leaves it as it was after the consistency check
+        of the root, with its trail disabled. Like _solve, the search is
+        driven by an explicit stack."""
+        distributor = self._distributor
+        verbose = self.verbose
+        # for each node of the current path, the iterator over the
+        # restrictions of its children not yet searched, and the
+        # position on the trail before any of them applies
+        stack = []
+        try:
+            outcome = self._visit(repository, 0)
+            if outcome is True:
+                stack.append((iter(distributor.split(repository.getDomains(),
+                                                     verbose>=2)),
+                              repository.mark()))
+            elif outcome is not None:
+                yield outcome
+            while stack:
+                branches, mark = stack[-1]
+                repository.backtrack(mark)
+                try:
+                    restrictions = branches.next()
+                except StopIteration:
+                    stack.pop()
+                    continue
+                repository.restrict(restrictions)
+                outcome = self._visit(repository, len(stack), restrictions)
+                if outcome is True:
+                    stack.append((iter(distributor.split(
+                        repository.getDomains(), verbose>=2)),
+                                  repository.mark()))
+                elif outcome is not None:
+                    yield outcome
+        finally:
+            if stack:
+                repository.backtrack(stack[0][1])
+            self._leave(repository)
+
+        if verbose:
+            self._print_summary()
+
+    def _leave(self, repository):
+        """stop following the changes of a repository searched in place:
+        disable its trail, and the index the distributor keeps of its
+        domains"""
+        repository.disableTrail()
+        unwatch = getattr(self._distributor, 'unwatch', None)
+        if unwatch is not None:
+            unwatch()
+
+    def _print_summary(self):
+        self.printer( strftime('%H:%M:%S'),'Finished search')
+        self.printer( strftime('%H:%M:%S'), 'Maximum recursion depth = ',
+            self.max_depth)
+        self.printer( 'Nb distributions = ', self.distrib_cnt)
 
         
 
@@ -373,9 +928,29 @@ class AbstractDomain(Psyobj):
     Can be used as a starting point for concrete domains"""
 
     __implements__ = DomainInterface
+    # (watcher, variable) pairs told about the changes of size of the
+    # domain (see distributors.DomainSizeIndex)
+    _watchers = ()
+
     def __init__(self):
         self.__changed = 0
 
+    def addWatcher(self, watcher, variable):
+        """watcher.sizeChanged(variable, domain) will be called whenever
+        values are removed from the domain or put back in it.
+        Copies of the domain are not watched"""
+        self._watchers = self._watchers + ((watcher, variable),)
+
+    def removeWatcher(self, watcher):
+        self._watchers = tuple([(_watcher, variable)
+                                for _watcher, variable in self._watchers
+                                if _watcher is not watcher])
+
+    def _sizeChanged(self):
+        """The implementation of _undo should call this method"""
+        for watcher, variable in self._watchers:
+            watcher.sizeChanged(variable, self)
+
     def resetFlags(self):
         self.__changed = 0
     
@@ -385,6 +960,8 @@ class AbstractDomain(Psyobj):
     def _valueRemoved(self):
         """The implementation of removeValue should call this method"""
         self.__changed = 1
+        if self._watchers:
+            self._sizeChanged()
         if self.size() == 0:
             raise ConsistencyFailure()
     
@@ -0,0 +1,184 @@
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+"""
+restarts - part of Logilab's constraint satisfaction solver.
+
+A randomized depth first search often loses its time below a bad choice
+made near the root. Restarting the search from the root every so many
+failures, with other random choices, avoids staying stuck there; the
+parts of the tree explored by the runs aborted are recorded as NoGood
+constraints, so that the search remains complete.
+"""
+
+from logilab.constraint.propagation import Solver
+from logilab.constraint.distributors import RandomizingDistributor
+from logilab.constraint.fd import NoGood, merge_restrictions
+
+def luby(index):
+    """returns the index-th term (from 1) of the Luby sequence:
+    1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8..."""
+    assert index >= 1
+    while True:
+        power = 1
+        while power * 2 - 1 < index:
+            power *= 2
+        if power * 2 - 1 == index:
+            return power
+        index -= power - 1
+
+
+class RestartingSolver(Solver):
+    """Searches with restarts, recording nogoods between the runs
+
+    The search is aborted and started again from the root once it has
+    met cutoff * luby(n) failures since the start of its n-th run, or
+    cutoff * factor ** (n - 1) failures with a geometric factor. Before
+    each restart, every branch fully explored by the run aborted becomes
+    a NoGood of the choices leading to it, which the following runs
+    propagate like any other constraint; a solution met again in a later
+    run is not generated twice.
+
+    Without a distributor, a RandomizingDistributor seeded with seed is
+    used: a new solver with the same seed makes the same search. The
+    repository is searched in place (see Solver) and left as it was once
+    the search is over; repositories which do not support a trail are
+    searched by copy, without restarts."""
+
+    def __init__(self, distributor=None, cutoff=100, factor=None, seed=0,
+                 **kwargs):
+        if distributor is None:
+            distributor = RandomizingDistributor(seed)
+        kwargs.setdefault('trail', True)
+        Solver.__init__(self, distributor, **kwargs)
+        assert cutoff >= 1
+        self.cutoff = cutoff
+        self.factor = factor
+        # restarts made by the last search
+        self.restart_cnt = 0
+        # nogoods recorded by the last search
+        self.nogood_cnt = 0
+
+    def _init_search(self, verbose, max_nodes=None, max_time=None):
+        """See Solver"""
+        Solver._init_search(self, verbose, max_nodes, max_time)
+        self.restart_cnt = 0
+        self.nogood_cnt = 0
+
+    def _run_limit(self, run):
+        """returns the number of failures allowed to the run-th run"""
+        if self.factor is None:
+            return self.cutoff * luby(run)
+        return int(self.cutoff * self.factor ** (run - 1))
+
+    def _solve_in_place(self, repository):
+        """main generator of the search with restarts
+
+        Each run is the search of Solver._solve_in_place, whose stack
+        frames also keep the list of the restrictions of the children of
+        each node and the index of the one being searched, from which
+        the nogoods are built when the run is aborted."""
+        distributor = self._distributor
+        verbose = self.verbose
+        root = repository.mark()
+        nogoods = []
+        found = {}
+        try:
+            while True:
+                limit = self.fail_cnt + self._run_limit(self.restart_cnt + 1)
+                outcome = self._visit(repository, 0)
+                if outcome is not True:
+                    if outcome is not None and \
+                           self._isNew(outcome, found):
+                        yield outcome
+                    break
+                # for each node of the current path, the restrictions of
+                # its children, the index of the one searched, and the
+                # position on the trail before any of them applies
+                stack = [[distributor.split(repository.getDomains(),
+                                            verbose>=2),
+                          -1, repository.mark()]]
+                while stack:
+                    frame = stack[-1]
+                    repository.backtrack(frame[2])
+                    frame[1] += 1
+                    if frame[1] == len(frame[0]):
+                        stack.pop()
+                        continue
+                    restrictions = frame[0][frame[1]]
+                    repository.restrict(restrictions)
+                    outcome = self._visit(repository, len(stack),
+                                          restrictions)
+                    if outcome is True:
+                        stack.append([distributor.split(
+                            repository.getDomains(), verbose>=2),
+                                      -1, repository.mark()])
+                    elif outcome is not None and \
+                             self._isNew(outcome, found):
+                        yield outcome
+                    if self.fail_cnt >= limit:
+                        break
+                if not stack:
+                    break
+                if outcome is True:
+                    # the node just distributed is not explored yet
+                    stack.pop()
+                else:
+                    stack[-1][1] += 1
+                repository.backtrack(root)
+                for restrictions in self._nogoods(stack):
+                    nogood = NoGood(restrictions)
+                    repository.addConstraint(nogood)
+                    nogoods.append(nogood)
+                self.restart_cnt += 1
+                self.nogood_cnt = len(nogoods)
+                if verbose:
+                    self.printer('Restart %d, %d nogoods' %
+                                 (self.restart_cnt, len(nogoods)))
+        finally:
+            repository.backtrack(root)
+            for nogood in nogoods:
+                repository.removeConstraint(nogood)
+            self._leave(repository)
+
+        if verbose:
+            self._print_summary()
+
+    def _isNew(self, solution, found):
+        """tells whether solution was not found before, and records it
+        in found"""
+        key = tuple(sorted(solution.items()))
+        if key in found:
+            return False
+        found[key] = None
+        return True
+
+    def _nogoods(self, stack):
+        """returns the restrictions of the nogoods of an aborted run
+
+        In each frame of the stack, the children before the index are
+        explored; every frame but the last is searching its child at the
+        index. A nogood binds the variables to the values kept by the
+        children searched down to the frame and by the child explored."""
+        nogoods = []
+        path = {}
+        for depth, (branches, index, mark) in enumerate(stack):
+            for restrictions in branches[:index]:
+                nogoods.append(merge_restrictions(path, restrictions))
+            if depth < len(stack) - 1:
+                path = merge_restrictions(path, branches[index])
+        return nogoods
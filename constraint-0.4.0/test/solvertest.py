@@ -0,0 +1,41 @@
+"""Unit testing for the restarts module"""
+
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+
+"""problems and helpers shared by the tests of the solvers"""
+
+from logilab.constraint import fd
+from logilab.constraint.propagation import Repository
+
+def sortedSolutions(solutions):
+    return sorted([tuple(sorted(solution.items()))
+                   for solution in solutions])
+
+def makeQueens(size):
+    variables = ['q%d' % i for i in range(size)]
+    domains = {}
+    for v in variables:
+        domains[v] = fd.FiniteDomain(range(size))
+    repo = Repository(variables, domains)
+    for i in range(size):
+        for j in range(i + 1, size):
+            repo.addConstraint(fd.make_expression(
+                (variables[i], variables[j]),
+                '%s != %s and abs(%s - %s) != %d' % (
+                variables[i], variables[j], variables[i], variables[j],
+                j - i)))
+    return repo
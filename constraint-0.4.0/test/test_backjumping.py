@@ -0,0 +1,91 @@
+"""Unit testing for the backjumping module"""
+
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+import unittest
+from logilab.constraint import fd
+from logilab.constraint.propagation import Repository, Solver
+from logilab.constraint.backjumping import BackjumpingSolver
+
+from solvertest import sortedSolutions, makeQueens
+
+class BackjumpingSolverTC(unittest.TestCase):
+    def makeLateConflict(self, nb_free):
+        """a chain of nb_free variables, distributed first, above two
+        variables which cannot be both equal and different"""
+        variables = ['a%d' % i for i in range(nb_free)] + ['y', 'z']
+        domains = {}
+        for v in variables[:-2]:
+            domains[v] = fd.FiniteDomain(range(3))
+        domains['y'] = fd.FiniteDomain(range(4))
+        domains['z'] = fd.FiniteDomain(range(4))
+        repo = Repository(variables, domains)
+        for v1, v2 in zip(variables[:-3], variables[1:-2]):
+            repo.addConstraint(fd.make_expression((v1, v2),
+                                                  '%s != %s' % (v1, v2)))
+        repo.addConstraint(fd.make_expression(('y', 'z'), 'y != z'))
+        repo.addConstraint(fd.make_expression(('y', 'z'), 'y == z'))
+        return repo
+
+    def testSolveAll(self):
+        solver = BackjumpingSolver()
+        solutions = solver.solve(makeQueens(6))
+        self.assertEquals(len(solutions), 4)
+        self.assertEquals(sortedSolutions(solutions),
+                          sortedSolutions(Solver().solve(makeQueens(6))))
+
+    def testSolveOne(self):
+        solution = BackjumpingSolver().solve_one(makeQueens(8))
+        values = solution.values()
+        self.assertEquals(sorted(values), range(8))
+
+    def testBackjump(self):
+        solver = BackjumpingSolver()
+        self.assertEquals(solver.solve_one(self.makeLateConflict(6)), None)
+        self.assert_(solver.backjump_cnt > 0)
+        plain = Solver(trail=True)
+        self.assertEquals(plain.solve_one(self.makeLateConflict(6)), None)
+        self.assert_(solver.node_cnt < plain.node_cnt / 10)
+
+    def testLearning(self):
+        repo = makeQueens(6)
+        nb_constraints = len(repo._constraints)
+        solver = BackjumpingSolver(learn=10)
+        self.assertEquals(len(solver.solve(repo)), 4)
+        self.assert_(solver.nogood_cnt > 0)
+        self.assertEquals(len(repo._constraints), nb_constraints)
+        for domain in repo.getDomains().values():
+            self.assertEquals(domain.size(), 6)
+            self.assertEquals(domain._watchers, ())
+
+    def testSolveBest(self):
+        def cost(q0, q1, q2, q3, q4, q5):
+            return q0 * 6 + q1
+        solutions = list(BackjumpingSolver().solve_best(makeQueens(6),
+                                                         cost))
+        self.assertEquals(solutions[-1][1], 9)
+        self.assertEquals(solutions[-1][0],
+                          {'q0':1, 'q1':3, 'q2':5, 'q3':0, 'q4':2, 'q5':4})
+
+    def testWithoutTrail(self):
+        solver = BackjumpingSolver(trail=False)
+        self.assertEquals(solver.solve_one(self.makeLateConflict(3)), None)
+        self.assertEquals(solver.backjump_cnt, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -154,8 +154,189 @@ class AllDistinctTC(AbstractConstraintTC):
             exception = 1
         assert exception
 
+    def testIndexedDomains(self):
+        universe = fd.ValueUniverse(range(1, 5))
+        domains = {'x':fd.IndexedFiniteDomain((1,), universe),
+                   'y':fd.IndexedFiniteDomain((2,), universe),
+                   'z':fd.IndexedFiniteDomain((1,2,3,4), universe),}
+        entailed = self.constraint.narrow(domains)
+        self.assert_(not entailed)
+        self.assertEquals(domains['z'].getValues(), [3, 4])
+        domains['z'] = fd.IndexedFiniteDomain((1,2), universe)
+        self.assertRaises(propagation.ConsistencyFailure,
+                          self.constraint.narrow, domains)
+
+class MatchingAllDistinctTC(AllDistinctTC):
+    def setUp(self):
+        AllDistinctTC.setUp(self)
+        self.constraint = fd.MatchingAllDistinct(self.relevant_variables)
+
+    def testHallInterval(self):
+        """x and y use up 1 and 2, so z must take 3"""
+        domains = {'x':fd.FiniteDomain((1,2)),
+                   'y':fd.FiniteDomain((1,2)),
+                   'z':fd.FiniteDomain((1,2,3)),}
+        entailed = self.constraint.narrow(domains)
+        self.failIf(entailed)
+        self.assertEquals([3], domains['z'].getValues())
+        self.assertEquals(2, domains['x'].size())
+
+    def testAlternatingPath(self):
+        """values reachable from a free value are kept"""
+        domains = {'x':fd.FiniteDomain((1,2)),
+                   'y':fd.FiniteDomain((2,3)),
+                   'z':fd.FiniteDomain((1,2,3,4)),}
+        self.constraint.narrow(domains)
+        self.assertEquals(2, domains['x'].size())
+        self.assertEquals(2, domains['y'].size())
+        self.assertEquals(4, domains['z'].size())
+
+    def testMatchingReused(self):
+        domains = {'x':fd.FiniteDomain((1,2)),
+                   'y':fd.FiniteDomain((1,2)),
+                   'z':fd.FiniteDomain((1,2,3)),}
+        self.constraint.narrow(domains)
+        domains['x'].removeValue(1)
+        entailed = self.constraint.narrow(domains)
+        self.failUnless(entailed)
+        self.assertEquals([1], domains['y'].getValues())
+
+
+class AllDistinctOnFieldTC(AbstractConstraintTC):
+    def setUp(self):
+        self.relevant_variables = ['x','y','z']
+        self.irrelevant_variable = 'tagada'
+        self.constraint = fd.AllDistinctOnField(self.relevant_variables, 1)
+        self.domains = {'x':fd.FiniteDomain((('a',1),('b',2))),
+                        'y':fd.FiniteDomain((('a',1),('b',3))),
+                        'z':fd.FiniteDomain((('a',1),('b',4))),}
+        self.entailed_domains = {'x':fd.FiniteDomain((('a',1),('b',1))),
+                                 'y':fd.FiniteDomain((('a',2),)),
+                                 'z':fd.FiniteDomain((('a',3),)),}
+
+    def narrowingAssertions(self):
+        for var in self.relevant_variables:
+            self.assertEquals(self.domains[var].size(), 2)
+
+    def testHallInterval(self):
+        """x and y use up fields 1 and 2, so z must take 3"""
+        domains = {'x':fd.FiniteDomain((('a',1),('a',2))),
+                   'y':fd.FiniteDomain((('b',1),('b',2))),
+                   'z':fd.FiniteDomain((('c',1),('d',1),('c',2),('c',3))),}
+        self.failUnless(not self.constraint.narrow(domains))
+        self.assertEquals(domains['z'].getValues(), [('c',3)])
+
+    def testFailure(self):
+        """two variables but a single field"""
+        domains = {'x':fd.FiniteDomain((('a',1),)),
+                   'y':fd.FiniteDomain((('b',1),('c',1))),
+                   'z':fd.FiniteDomain((('c',2),)),}
+        self.assertRaises(propagation.ConsistencyFailure,
+                          self.constraint.narrow, domains)
+
+
+class NotEqualOnFieldTC(AbstractConstraintTC):
+    def setUp(self):
+        self.relevant_variables = ['x','y']
+        self.irrelevant_variable = 'tagada'
+        self.constraint = fd.NotEqualOnField(self.relevant_variables, 1)
+        self.domains = {'x':fd.FiniteDomain((('a',1),('a',2))),
+                        'y':fd.FiniteDomain((('b',1),('b',2))),}
+        self.entailed_domains = {'x':fd.FiniteDomain((('a',1),('b',1))),
+                                 'y':fd.FiniteDomain((('a',2),)),}
+
+    def narrowingAssertions(self):
+        self.assertEquals(self.domains['x'].size(), 2)
+        self.assertEquals(self.domains['y'].size(), 2)
+
+    def testOneSideFixed(self):
+        domains = {'x':fd.FiniteDomain((('a',1),('b',1))),
+                   'y':fd.FiniteDomain((('c',1),('c',2),('d',1))),}
+        self.failUnless(self.constraint.narrow(domains))
+        self.assertEquals(domains['y'].getValues(), [('c',2)])
+
+    def testDisjoint(self):
+        domains = {'x':fd.FiniteDomain((('a',1),('a',2))),
+                   'y':fd.FiniteDomain((('b',3),('b',4))),}
+        self.failUnless(self.constraint.narrow(domains))
+        self.assertEquals(domains['y'].size(), 2)
+
+    def testFailure(self):
+        domains = {'x':fd.FiniteDomain((('a',1),)),
+                   'y':fd.FiniteDomain((('b',1),)),}
+        self.assertRaises(propagation.ConsistencyFailure,
+                          self.constraint.narrow, domains)
+
+class StrictlyIncreasingTC(AbstractConstraintTC):
+    def setUp(self):
+        self.relevant_variables = ['x','y','z']
+        self.irrelevant_variable = 'tagada'
+        self.constraint = fd.StrictlyIncreasing(self.relevant_variables)
+        self.domains = {'x':fd.FiniteDomain((1,2,3,4)),
+                        'y':fd.FiniteDomain((1,2,3,4)),
+                        'z':fd.FiniteDomain((1,2,3,4)),}
+        self.entailed_domains = {'x':fd.FiniteDomain((1,2)),
+                                 'y':fd.FiniteDomain((3,)),
+                                 'z':fd.FiniteDomain((4,5)),}
+
+    def narrowingAssertions(self):
+        self.assertEquals(self.domains['x'].getValues(), [1,2])
+        self.assertEquals(self.domains['y'].getValues(), [2,3])
+        self.assertEquals(self.domains['z'].getValues(), [3,4])
+
+    def testNotEntailed(self):
+        self.failIf(self.constraint.narrow(self.domains))
+
+    def testFailure(self):
+        domains = {'x':fd.FiniteDomain((2,3)),
+                   'y':fd.FiniteDomain((1,3)),
+                   'z':fd.FiniteDomain((1,2)),}
+        self.assertRaises(propagation.ConsistencyFailure,
+                          self.constraint.narrow, domains)
+
+    def testIndexedDomains(self):
+        universe = fd.ValueUniverse([('d1','s1','w%d' % i) for i in range(3)])
+        domains = {}
+        for variable in self.relevant_variables:
+            domains[variable] = fd.IndexedFiniteDomain(universe.values,
+                                                       universe)
+        self.failUnless(self.constraint.narrow(domains))
+        self.assertEquals([domains[v].getValues()[0][2] for v in 'xyz'],
+                          ['w0', 'w1', 'w2'])
+
+class NoGoodTC(AbstractConstraintTC):
+    def setUp(self):
+        self.relevant_variables = ['x','y']
+        self.irrelevant_variable = 'tagada'
+        self.constraint = fd.NoGood({'x':[1], 'y':[1,2]})
+        self.domains = {'x':fd.FiniteDomain((1,)),
+                        'y':fd.FiniteDomain((1,2,3)),}
+        self.entailed_domains = {'x':fd.FiniteDomain((2,3)),
+                                 'y':fd.FiniteDomain((1,2)),}
+
+    def narrowingAssertions(self):
+        self.assertEquals(self.domains['x'].getValues(), [1])
+        self.assertEquals(self.domains['y'].getValues(), [3])
+
+    def testNotEntailed(self):
+        domains = {'x':fd.FiniteDomain((1,2)),
+                   'y':fd.FiniteDomain((1,3)),}
+        self.failIf(self.constraint.narrow(domains))
+        self.assertEquals(domains['x'].size(), 2)
+        self.assertEquals(domains['y'].size(), 2)
+
+    def testFailure(self):
+        domains = {'x':fd.FiniteDomain((1,)),
+                   'y':fd.FiniteDomain((1,2)),}
+        self.assertRaises(propagation.ConsistencyFailure,
+                          self.constraint.narrow, domains)
+
+    def testMergeRestrictions(self):
+        path = {'x':[1,2,3], 'y':[1]}
+        merged = fd.merge_restrictions(path, {'x':[3,2,4], 'z':[5]})
+        self.assertEquals(merged, {'x':[3,2], 'y':[1], 'z':[5]})
+        self.assertEquals(path, {'x':[1,2,3], 'y':[1]})
 
-    
 class UnaryMathConstrTC(AbstractConstraintTC):
     def setUp(self):
         self.relevant_variables = ['x']
@@ -212,6 +393,35 @@ class TernaryMathConstrTC(AbstractConstraintTC):
         v.sort()
         assert v == [2,3],str(v)
 
+    def testNotEntailed(self):
+        """every value has a support, but not every combination does"""
+        constraint = fd.make_expression(('x', 'y', 'z'), 'x<y or y<z')
+        domains = {'x':fd.FiniteDomain((0,1)),
+                   'y':fd.FiniteDomain((0,1)),
+                   'z':fd.FiniteDomain((1,2))}
+        self.failIf(constraint.narrow(domains))
+        self.assertEquals(domains['z'].size(), 2)
+
+class ExpressionCacheTC(unittest.TestCase):
+    def testSharedByShape(self):
+        c1 = fd.make_expression(('d1s1n0', 'd1s2n0'), 'd1s1n0[2] != d1s2n0[2]')
+        c2 = fd.make_expression(('d3s1n4', 'd3s2n1'), 'd3s1n4[2] != d3s2n1[2]')
+        self.assert_(c1.filterFunc is c2.filterFunc)
+        self.failIf(c1.filterFunc(('a', 'b', 'w1'), ('a', 'c', 'w1')))
+
+    def testVariableOrder(self):
+        c1 = fd.make_expression(('x', 'y'), 'x < y')
+        c2 = fd.make_expression(('x', 'y'), 'y < x')
+        self.failIf(c1.filterFunc is c2.filterFunc)
+        self.assert_(c1.filterFunc(1, 2))
+        self.assert_(c2.filterFunc(2, 1))
+
+    def testAttributesAndStrings(self):
+        constraint = fd.make_expression(('x', 'real'),
+                                        'x.real == real and "x" != str(x)')
+        self.assert_(constraint.filterFunc(2+1j, 2))
+        self.failIf(constraint.filterFunc(2+1j, 1))
+
 class AbstractBasicConstraintTC(unittest.TestCase):
     """override the following methods:
      * setUp to initialize variables
@@ -72,6 +72,30 @@ class AbstractDistributorTC(unittest.TestCase):
         for initial_domain in (self.domains1,self.domains2):
             distributed_domains = self.distributor.distribute(initial_domain)
             self.distributionAssertions(initial_domain,distributed_domains)
+
+    def testSplit(self):
+        """tests that split describes a partition of the right domain"""
+        for initial_domain in (self.domains1,self.domains2):
+            parts = self.distributor.split(initial_domain)
+            values = []
+            for restrictions in parts:
+                self.assertEquals(['v2'], restrictions.keys())
+                values.extend(restrictions['v2'])
+            values.sort()
+            self.assertEquals(values, sorted(initial_domain['v2'].getValues()))
+            self.assertEquals(initial_domain['v2'].size(),
+                              len(initial_domain['v2'].getValues()))
+            
+    def testSplitIndexesDomains(self):
+        """tests that split keeps the smallest domain up to date while
+        the domains are modified in place"""
+        dist = self.buildDistributor()
+        dist.split(self.domains2)
+        self.assertEquals('v2', dist.findSmallestDomain(self.domains2))
+        self.domains2['v3'].removeValues([7, 8, 9, 10, 11])
+        self.assertEquals('v3', dist.findSmallestDomain(self.domains2))
+        self.assertEquals('v2', dist.findLargestDomain(self.domains2))
+        self.assertEquals('v2', dist.findSmallestDomain(self.domains1))
             
 class NaiveDistributorTC(AbstractDistributorTC):
     def buildDistributor(self):
@@ -89,6 +113,39 @@ class RandomizingDistributorTC(NaiveDistributorTC):
         return distributors.RandomizingDistributor()
     
 
+class ValueOrderingDistributorTC(NaiveDistributorTC):
+    def buildDistributor(self):
+        return distributors.ValueOrderingDistributor(self.score)
+
+    def score(self, variable, value):
+        return -value
+
+    def testBestValueFirst(self):
+        """tests that the value with the lowest score is tried first"""
+        for initial_domain in (self.domains1,self.domains2):
+            parts = self.distributor.split(initial_domain)
+            self.assertEquals(parts[0]['v2'],
+                              [max(initial_domain['v2'].getValues())])
+            distributed = self.distributor.distribute(initial_domain)
+            self.assertEquals(distributed[0]['v2'].getValues(),
+                              parts[0]['v2'])
+
+    def testTieBreak(self):
+        """tests that ties go to the key in the fewest other domains"""
+        domains = {'v1':fd.FiniteDomain([(1, 'a'), (1, 'b'), (1, 'c')]),
+                   'v2':fd.FiniteDomain([(2, 'a'), (2, 'b'), (2, 'c'),
+                                         (2, 'd')]),
+                   'v3':fd.FiniteDomain([(3, 'a'), (3, 'c'), (3, 'd')]),}
+        dist = distributors.ValueOrderingDistributor(lambda var, val: 0)
+        self.assertEquals(dist.bestValue(domains, 'v1'), (1, 'a'))
+        dist = distributors.ValueOrderingDistributor(lambda var, val: 0,
+                                                     True, 1)
+        self.assertEquals(dist.bestValue(domains, 'v1'), (1, 'b'))
+        # the score still comes first
+        dist = distributors.ValueOrderingDistributor(
+            lambda var, val: val[1] == 'b', True, 1)
+        self.assertEquals(dist.bestValue(domains, 'v1'), (1, 'a'))
+
 class DichotomyDistributorTC(AbstractDistributorTC):
     def buildDistributor(self):
         return distributors.DichotomyDistributor()
@@ -122,6 +179,71 @@ class EnumeratorDistributorTC(AbstractDistributorTC):
                 assert d[v].getValues() == initial[v].getValues()
             assert d['v2'].size() == 1
 
+class DomWDegDistributorTC(DichotomyDistributorTC):
+    def buildDistributor(self):
+        return distributors.DomWDegDistributor()
+
+    def testWeightedDegree(self):
+        """tests that variables of failing constraints are preferred"""
+        dist = self.buildDistributor()
+        constraint = fd.make_expression(('v1', 'v3'), 'v1 > v3')
+        dist.notifyFailure(None, constraint)
+        dist.notifyFailure(None, constraint)
+        self.assertEquals('v3', dist.chooseVariable(self.domains1))
+
+class ImpactDistributorTC(DichotomyDistributorTC):
+    def buildDistributor(self):
+        return distributors.ImpactDistributor()
+
+    def testImpact(self):
+        """tests that the variables with the highest impact are preferred"""
+        dist = self.buildDistributor()
+        self.domains1['v4'] = fd.FiniteDomain([1, 2])
+        parts = dist.split(self.domains1)
+        self.assertEquals(parts[0].keys(), ['v2'])
+        dist.notifyFailure(parts[0], None)
+        parts = dist.split(self.domains1)
+        self.assertEquals(parts[0].keys(), ['v2'])
+        self.assertEquals(dist.impacts['v2'], (1, 1.))
+        # restricting v4 only halves the search space
+        parts = [{'v4': [1]}]
+        dist._pending[id(parts[0])] = (parts[0],
+                                       dist._index.logSearchSpace())
+        self.domains1['v4'].removeValue(2)
+        dist.notifyPropagation(parts[0], self.domains1)
+        self.assertEquals(dist.impacts['v4'], (1, .5))
+        self.assertEquals('v2', dist.chooseVariable(self.domains1))
+
+class ValueSymmetryDistributorTC(EnumeratorDistributorTC):
+    def buildDistributor(self):
+        return distributors.ValueSymmetryDistributor([])
+
+    def testInterchangeableValues(self):
+        """tests that only the first unused value of each run of a
+        class is tried"""
+        dist = distributors.ValueSymmetryDistributor([[4, 5, 6, 7]])
+        domains = {'v1':fd.FiniteDomain([5]),
+                   'v2':fd.FiniteDomain([4, 6, 7, 8]),}
+        self.assertEquals(sorted(dist.keptValues(domains, 'v2')), [4, 6, 8])
+        parts = dist.split(domains)
+        self.assertEquals(sorted([part['v2'] for part in parts]),
+                          [[4], [6], [8]])
+        self.assertEquals(len(dist.distribute(domains)), 3)
+
+    def testField(self):
+        """tests that values are compared on their item field"""
+        dist = distributors.ValueSymmetryDistributor([['a', 'b']], 1)
+        domains = {'v1':fd.FiniteDomain([(1, 'a'), (1, 'b'), (1, 'c')]),
+                   'v2':fd.FiniteDomain([(2, 'c')]),}
+        self.assertEquals(sorted(dist.keptValues(domains, 'v1')),
+                          [(1, 'a'), (1, 'c')])
+
+    def testChains(self):
+        """tests that the variables of a chain are distributed in order"""
+        dist = distributors.ValueSymmetryDistributor([], None,
+                                                     [['v1', 'v3', 'v2']])
+        self.assertEquals('v3', dist.chooseVariable(self.domains1))
+
 
 def get_all_cases(module):
     import types
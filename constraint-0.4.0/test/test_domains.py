@@ -67,6 +67,39 @@ class SuiteDomainTC(AbstractDomainTC):
         self.values = range(3)
         self.domain = fd.FiniteDomain(self.values)
 
+class IndexedDomainTC(AbstractDomainTC):
+    def setUp(self):
+        self.universe = fd.ValueUniverse(range(5))
+        self.values = range(3)
+        self.domain = fd.IndexedFiniteDomain(self.values, self.universe)
+
+    def testRemoveMissing(self):
+        self.assertRaises(KeyError, self.domain.removeValue, 4)
+        self.assertRaises(KeyError, self.domain.removeValues, [0, 4])
+        self.assertEquals(self.domain.size(), 3)
+
+    def testCopy(self):
+        copy = self.domain.copy()
+        copy.removeValue(0)
+        self.assertEquals(copy.getValues(), [1, 2])
+        self.assertEquals(self.domain.getValues(), [0, 1, 2])
+
+    def testIntersect(self):
+        other = fd.IndexedFiniteDomain([1, 2, 4], self.universe)
+        self.domain.intersect(other)
+        self.assertEquals(self.domain.getValues(), [1, 2])
+        self.assertEquals(self.domain.size(), 2)
+        self.failUnless(self.domain.hasChanged())
+
+    def testUndo(self):
+        self.domain._trail = trail = []
+        self.domain.removeValues([0, 2])
+        self.failIf(0 in self.domain)
+        domain, removed = trail.pop()
+        domain._undo(removed)
+        self.assertEquals(self.domain.getValues(), [0, 1, 2])
+        self.failIf(self.domain.hasChanged())
+
 
 
 def get_all_cases(module):
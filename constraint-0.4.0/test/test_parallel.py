@@ -0,0 +1,83 @@
+"""Unit testing for the parallel module"""
+
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+import unittest
+from logilab.constraint import fd
+from logilab.constraint.propagation import Repository, Solver
+from logilab.constraint.parallel import ParallelSolver
+
+class ParallelSolverTC(unittest.TestCase):
+    def setUp(self):
+        self.solver = ParallelSolver(Solver(trail=True), 3)
+        self.variables = list('abcde')
+        self.repo = self.makeRepository(self.variables, 10)
+        for v1 in self.variables:
+            for v2 in self.variables:
+                if v1 < v2:
+                    self.repo.addConstraint(fd.make_expression((v1, v2),
+                                                               '%s < %s'%(v1, v2)))
+
+    def makeRepository(self, variables, size):
+        domains = {}
+        for v in variables:
+            domains[v] = fd.FiniteDomain(range(size))
+        return Repository(variables, domains)
+
+    def costFunc(self, a, b, c, d, e):
+        return -(a*a+b*b+c*c+d*d+e*e)
+
+    def testSolveOne(self):
+        solution = self.solver.solve_one(self.repo)
+        self.assert_(solution['a'] < solution['b'] < solution['c'] <
+                     solution['d'] < solution['e'])
+        self.assert_(self.solver.nb_subproblems > 1)
+
+    def testSolveAll(self):
+        solutions = self.solver.solve(self.repo)
+        self.assertEquals(len(solutions), 252)
+        expected = [sol for sol in Solver().solve(self.repo)]
+        key = lambda sol: [sol[v] for v in self.variables]
+        self.assertEquals(sorted(solutions, key=key),
+                          sorted(expected, key=key))
+
+    def testNoSolution(self):
+        # pigeonhole: 5 pairwise different variables with 4 values
+        variables = list('abcde')
+        repo = self.makeRepository(variables, 4)
+        for v1 in variables:
+            for v2 in variables:
+                if v1 < v2:
+                    repo.addConstraint(fd.make_expression((v1, v2),
+                                                          '%s != %s'%(v1, v2)))
+        self.assertEquals(self.solver.solve_one(repo), None)
+        self.failIf(self.solver.budget_exhausted)
+
+    def testSolveBest(self):
+        solutions = list(self.solver.solve_best(self.repo, self.costFunc))
+        self.assertEquals(solutions[-1], ({'a':5, 'b':6, 'c':7, 'd':8, 'e':9}, -255))
+        costs = [cost for solution, cost in solutions]
+        self.assertEquals(costs, sorted(costs, reverse=True))
+        self.failIf(self.solver.budget_exhausted)
+
+    def testSolveBestNodeBudget(self):
+        list(self.solver.solve_best(self.repo, self.costFunc, max_nodes=1))
+        self.assert_(self.solver.budget_exhausted)
+
+if __name__ == '__main__':
+    unittest.main()
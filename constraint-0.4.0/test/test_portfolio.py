@@ -0,0 +1,98 @@
+"""Unit testing for the portfolio module"""
+
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+import unittest
+from logilab.constraint import fd
+from logilab.constraint.propagation import Repository, Solver
+from logilab.constraint.distributors import DomWDegDistributor, \
+     RandomizingDistributor
+from logilab.constraint.portfolio import PortfolioSolver, supportsPortfolio
+
+class PortfolioSolverTC(unittest.TestCase):
+    def setUp(self):
+        self.solver = PortfolioSolver([Solver(trail=True),
+                                       Solver(DomWDegDistributor(),
+                                              trail=True),
+                                       Solver(RandomizingDistributor())])
+        self.domains = {}
+        self.variables = list('abc')
+        for v in self.variables:
+            self.domains[v] = fd.FiniteDomain(range(6))
+        self.repo = Repository(self.variables, self.domains)
+        for v1 in self.variables:
+            for v2 in self.variables:
+                if v1 < v2:
+                    self.repo.addConstraint(fd.make_expression((v1, v2),
+                                                               '%s < %s'%(v1, v2)))
+
+    def costFunc(self, a, b, c):
+        return -(a*a+b*b+c*c)
+
+    def testSolveOne(self):
+        solution = self.solver.solve_one(self.repo)
+        self.assert_(solution['a'] < solution['b'] < solution['c'])
+        self.assert_(self.solver.winner in (0, 1, 2))
+
+    def testNoSolution(self):
+        self.repo.addConstraint(fd.make_expression(('a', 'c'), 'c < a'))
+        self.assertEquals(self.solver.solve_one(self.repo), None)
+        self.failIf(self.solver.budget_exhausted)
+
+    def testSolveBest(self):
+        solutions = list(self.solver.solve_best(self.repo, self.costFunc))
+        self.assertEquals(solutions[-1], ({'a':3, 'b':4, 'c':5}, -50))
+        costs = [cost for solution, cost in solutions]
+        self.assertEquals(costs, sorted(costs, reverse=True))
+        self.failIf(self.solver.budget_exhausted)
+
+    def testSolveBestWithLowerBound(self):
+        def costFunc(a, b, c):
+            return -(a*a+b*b+c*c)
+        def lower_bound(domains):
+            return -sum([max(domains[v].getValues())**2 for v in 'abc'])
+        costFunc.lower_bound = lower_bound
+        for i in range(5):
+            solutions = list(self.solver.solve_best(self.repo, costFunc))
+            self.assertEquals(solutions[-1], ({'a':3, 'b':4, 'c':5}, -50))
+            self.failIf(self.solver.budget_exhausted)
+
+    def testSolveBestNodeBudget(self):
+        solutions = list(self.solver.solve_best(self.repo, self.costFunc,
+                                                max_nodes=1))
+        self.assertEquals(solutions, [])
+        self.assert_(self.solver.budget_exhausted)
+
+    def testParallel(self):
+        if not supportsPortfolio():
+            return
+        # the search only ever fails in the first solver's process
+        solver = PortfolioSolver([Solver(_FailingDistributor()),
+                                  Solver(trail=True)])
+        self.assert_(solver.solve_one(self.repo) is not None)
+        self.assertEquals(solver.winner, 1)
+        solver = PortfolioSolver([Solver(_FailingDistributor())])
+        self.assertRaises(RuntimeError, solver.solve_one, self.repo)
+
+
+class _FailingDistributor(DomWDegDistributor):
+    def distribute(self, domains, verbose=0):
+        raise ValueError('failing on purpose')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,7 +21,8 @@ import unittest
 import os
 from logilab.constraint.propagation import *
 from logilab.constraint import fd
-from logilab.constraint.distributors import DefaultDistributor
+from logilab.constraint.distributors import DefaultDistributor, \
+     DomWDegDistributor, ImpactDistributor
 
 class Repository_TC(unittest.TestCase):
     def setUp(self):
@@ -85,8 +86,8 @@ class Repository_TC(unittest.TestCase):
         try:
             self.repo.consistency()
             self.fail('No ConsistencyFailure raised')
-        except ConsistencyFailure:
-            pass
+        except ConsistencyFailure, exc:
+            self.assertEqual(exc.constraint.affectedVariables(), ['a', 'b'])
 
 
 class Sover_TC(unittest.TestCase):
@@ -130,6 +131,93 @@ class Sover_TC(unittest.TestCase):
                          [])
 
 
+class TrailSolver_TC(Sover_TC):
+    def setUp(self):
+        Sover_TC.setUp(self)
+        self.solver = Solver(trail=True)
+
+    def testDomainsRestored(self):
+        self.repo.consistency()
+        sizes = [(v, d.size()) for v, d in self.repo.getDomains().items()]
+        self.repo.addConstraint(fd.make_expression(('a', 'f'), 'a + 5 == f'))
+        self.solver.solve(self.repo)
+        self.assertEqual(sizes, [(v, d.size()) for v, d in
+                                 self.repo.getDomains().items()])
+
+    def assertTrailDisabled(self, repo):
+        self.assertEqual(repo._trail, None)
+        for dom in repo.getDomains().values():
+            self.assertEqual(dom._trail, None)
+            self.assertEqual(dom._watchers, ())
+
+    def makeDistinct(self):
+        domains = {}
+        for v in 'abcd':
+            domains[v] = fd.FiniteDomain(range(4))
+        repo = Repository(list('abcd'), domains)
+        repo.addConstraint(fd.AllDistinct(list('abcd')))
+        return repo
+
+    def testTrailDisabled(self):
+        repo = self.makeDistinct()
+        self.assertEqual(len(list(self.solver.solve_all(repo))), 24)
+        self.assertTrailDisabled(repo)
+        # the root finds the only solution
+        list(self.solver.solve_all(self.repo))
+        self.assertTrailDisabled(self.repo)
+
+    def testTrailDisabledWhenClosed(self):
+        repo = self.makeDistinct()
+        solutions = self.solver.solve_all(repo)
+        solutions.next()
+        self.assertNotEqual(repo._trail, None)
+        solutions.close()
+        self.assertTrailDisabled(repo)
+
+    def testIndexDetached(self):
+        repo = self.makeDistinct()
+        self.solver.solve_one(repo)
+        for dom in repo.getDomains().values():
+            self.assertEqual(dom._watchers, ())
+        self.assertEqual(self.solver._distributor._index, None)
+
+    def testMarkAndBacktrack(self):
+        self.repo.enableTrail()
+        mark = self.repo.mark()
+        self.repo.restrict({'a': [0, 1]})
+        self.assertEqual(self.repo.getDomains()['a'].size(), 2)
+        self.repo.consistency()
+        self.assertEqual(self.repo.getDomains()['a'].size(), 1)
+        self.assert_(len(self.repo._constraints) < 15)
+        self.repo.backtrack(mark)
+        for v, dom in self.repo.getDomains().items():
+            self.assertEqual(dom.size(), 6)
+        self.assertEqual(len(self.repo._constraints), 15)
+
+    def testDeeperThanRecursionLimit(self):
+        import sys
+        variables = ['v%04d' % i for i in range(sys.getrecursionlimit() + 100)]
+        domains = {}
+        for v in variables:
+            domains[v] = fd.FiniteDomain([0, 1])
+        repo = Repository(variables, domains)
+        solution = self.solver.solve_one(repo)
+        self.assertEqual(len(solution), len(variables))
+        self.assertEqual(self.solver.max_depth, len(variables))
+        for v, dom in repo.getDomains().items():
+            self.assertEqual(dom.size(), 2)
+
+class DomWDegSolver_TC(Sover_TC):
+    def setUp(self):
+        Sover_TC.setUp(self)
+        self.solver = Solver(DomWDegDistributor(), trail=True)
+
+class ImpactSolver_TC(Sover_TC):
+    def setUp(self):
+        Sover_TC.setUp(self)
+        self.solver = Solver(ImpactDistributor(), trail=True)
+
+
 class SolverBest_TC(unittest.TestCase):
     def setUp(self):
         self.solver = Solver()
@@ -160,7 +248,169 @@ class SolverBest_TC(unittest.TestCase):
         self.assertEquals(costs, sorted_costs)
         self.assertEquals(costs, [s[1] for s in solutions])
 
-                         
+    def testSolveBestWithLowerBound(self):
+        def costFunc(a, b, c):
+            return -(a*a+b*b+c*c)
+        def lower_bound(domains):
+            return -sum([max(domains[v].getValues())**2 for v in 'abc'])
+        costFunc.lower_bound = lower_bound
+        solutions = list(self.solver.solve_best(self.repo, costFunc))
+        self.assertEquals(solutions[-1], ({'a':3, 'b':4, 'c':5}, -50))
+
+        exhaustive = Solver()
+        solutions = list(exhaustive.solve_best(self.repo, self.costFunc))
+        self.assertEquals(solutions[-1][1], -50)
+        self.assert_(self.solver.node_cnt < exhaustive.node_cnt)
+
+    def testSolveBestSharedIncumbent(self):
+        import multiprocessing
+        def costFunc(a, b, c):
+            return -(a*a+b*b+c*c)
+        def lower_bound(domains):
+            return -sum([max(domains[v].getValues())**2 for v in 'abc'])
+        costFunc.lower_bound = lower_bound
+        # another search already found the best cost
+        incumbent = multiprocessing.Value('d', -50.)
+        solutions = list(self.solver.solve_best(self.repo, costFunc,
+                                                incumbent=incumbent))
+        self.assertEquals(solutions, [({'a':3, 'b':4, 'c':5}, -50)])
+        alone = Solver()
+        list(alone.solve_best(self.repo, costFunc))
+        self.assert_(self.solver.node_cnt < alone.node_cnt)
+        incumbent = multiprocessing.Value('d', -30.)
+        solutions = list(self.solver.solve_best(self.repo, costFunc,
+                                                incumbent=incumbent))
+        self.assertEquals(incumbent.value, -50.)
+
+    def testSolveBestNodeBudget(self):
+        solutions = list(self.solver.solve_best(self.repo, self.costFunc,
+                                                max_nodes=1))
+        self.assert_(self.solver.budget_exhausted)
+        self.assertEquals(solutions, [])
+        solutions = list(self.solver.solve_best(self.repo, self.costFunc))
+        self.failIf(self.solver.budget_exhausted)
+
+
+class SolverStats_TC(unittest.TestCase):
+    def setUp(self):
+        self.stats = SolverStats(histogram=True)
+        self.domains = {}
+        self.variables = list('abcd')
+        for v in self.variables:
+            self.domains[v] = fd.FiniteDomain(range(4))
+        self.repo = Repository(self.variables, self.domains)
+        for v1 in self.variables:
+            for v2 in self.variables:
+                if v1 < v2:
+                    self.repo.addConstraint(fd.make_expression((v1, v2),
+                                                               '%s != %s'%(v1, v2)))
+
+    def testSolveAll(self):
+        solver = Solver(stats=self.stats)
+        solutions = solver.solve(self.repo)
+        stats = self.stats.asDict()
+        self.assertEquals(stats['solutions'], len(solutions))
+        self.assertEquals(stats['nodes'], solver.node_cnt)
+        self.assertEquals(stats['distributions'], solver.distrib_cnt)
+        self.assertEquals(stats['max_depth'], solver.max_depth)
+        self.assert_(stats['domain_copies'] > 0)
+        self.assert_(stats['wall_time'] >= 0)
+        self.assertEquals(stats['constraints'].keys(), ['BinaryExpression'])
+        constraint = stats['constraints']['BinaryExpression']
+        self.assert_(constraint['values_pruned'] > 0)
+        self.assertEquals(sum(constraint['histogram'].values()),
+                          constraint['narrow_calls'])
+
+    def testInstances(self):
+        repo = Repository(list('abc'),
+                          {'a': fd.FiniteDomain(range(4)),
+                           'b': fd.FiniteDomain(range(4)),
+                           'c': fd.FiniteDomain(range(4))})
+        repo.addConstraint(fd.make_expression(('a', 'b'), 'a < b'))
+        repo.addConstraint(fd.make_expression(('b', 'c'), 'b != c'))
+        repo.consistency(stats=self.stats)
+        stats = self.stats.asDict()
+        instances = stats['instances']
+        self.assertEquals(sorted(instances.keys()),
+                          ['BinaryExpression(a, b)',
+                           'BinaryExpression(b, c)'])
+        less = instances['BinaryExpression(a, b)']
+        self.assertEquals(less['class'], 'BinaryExpression')
+        self.assertEquals(less['variables'], ['a', 'b'])
+        self.assertEquals(less['values_pruned'], 2)
+        self.assertEquals(instances['BinaryExpression(b, c)']['values_pruned'],
+                          0)
+        self.assertEquals(sum([instance['histogram'][bucket]
+                               for instance in instances.values()
+                               for bucket in instance['histogram']]),
+                          stats['constraints']['BinaryExpression']
+                          ['narrow_calls'])
+        self.assertEquals(stats['constraints']['BinaryExpression']
+                          ['values_pruned'], 2)
+
+    def testFailures(self):
+        self.repo.addConstraint(fd.make_expression(('a', 'b'), 'a + b == 7'))
+        solver = Solver(stats=self.stats, trail=True)
+        self.assertEquals(solver.solve_one(self.repo), None)
+        stats = self.stats.asDict()
+        self.assert_(stats['failures'] > 0)
+        self.assertEquals(stats['solutions'], 0)
+        failures = [record['failures']
+                    for record in stats['constraints'].values()]
+        self.assertEquals(sum(failures), stats['failures'])
+
+    def testSolveOneResets(self):
+        solver = Solver(stats=self.stats)
+        solver.solve(self.repo)
+        solver.solve_one(self.repo)
+        self.assertEquals(self.stats.solutions, 1)
+        self.assertEquals(self.stats.nodes, solver.node_cnt)
+
+    def testJSON(self):
+        import json
+        solver = Solver(stats=SolverStats())
+        solver.solve_one(self.repo)
+        stats = json.loads(solver.stats.asJSON())
+        self.assertEquals(stats['solutions'], 1)
+        self.failIf('histogram' in stats['constraints']['BinaryExpression'])
+
+class Explanations_TC(unittest.TestCase):
+    def setUp(self):
+        self.domains = {}
+        self.variables = list('abcd')
+        for v in self.variables:
+            self.domains[v] = fd.FiniteDomain(range(4))
+        self.repo = Repository(self.variables, self.domains)
+        self.repo.addConstraint(fd.make_expression(('a', 'b'), 'a < b'))
+        self.repo.addConstraint(fd.make_expression(('c', 'd'), 'c + d == 6'))
+        self.repo.enableTrail()
+        self.explanations = Explanations(self.repo)
+
+    def testReasons(self):
+        mark = self.repo.mark()
+        self.repo.restrict({'a': [2]})
+        self.explanations.decide({'a': [2]}, 1)
+        self.repo.restrict({'c': [3]})
+        self.explanations.decide({'c': [3]}, 2)
+        self.repo.consistency(variables=['a', 'c'],
+                              explanations=self.explanations)
+        reasons = self.explanations.reasons
+        self.assertEquals(self.domains['b'].getValues(), [3])
+        self.assertEquals(reasons['b'], frozenset([1]))
+        self.assertEquals(reasons['d'], frozenset([2]))
+        self.repo.backtrack(mark)
+        self.failIf(reasons.get('b'))
+        self.failIf(reasons.get('d'))
+
+    def testConflict(self):
+        self.repo.restrict({'a': [3]})
+        self.explanations.decide({'a': [3]}, 1)
+        self.repo.restrict({'c': [1]})
+        self.explanations.decide({'c': [1]}, 2)
+        self.assertRaises(ConsistencyFailure, self.repo.consistency,
+                          explanations=self.explanations)
+        self.assertEquals(self.explanations.conflict, frozenset([1]))
+
 
 if __name__ == '__main__':
     unittest.main()
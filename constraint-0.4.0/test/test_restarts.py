@@ -0,0 +1,119 @@
+"""Unit testing for the restarts module"""
+
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+import unittest
+from logilab.constraint import fd
+from logilab.constraint.propagation import Repository, Solver
+from logilab.constraint.restarts import RestartingSolver, luby
+
+from solvertest import sortedSolutions, makeQueens
+
+class LubyTC(unittest.TestCase):
+    def testSequence(self):
+        self.assertEquals([luby(i) for i in range(1, 16)],
+                          [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8])
+
+class RestartingSolverTC(unittest.TestCase):
+    def setUp(self):
+        self.variables = list('abcd')
+        self.repo = self.makeRepository()
+
+    def makeRepository(self):
+        domains = {}
+        for v in self.variables:
+            domains[v] = fd.FiniteDomain(range(7))
+        repo = Repository(self.variables, domains)
+        for v1 in self.variables:
+            for v2 in self.variables:
+                if v1 < v2:
+                    repo.addConstraint(fd.make_expression((v1, v2),
+                                                          '%s < %s'%(v1, v2)))
+        return repo
+
+    def makePigeonHoles(self, nb_pigeons):
+        variables = ['p%d' % i for i in range(nb_pigeons)]
+        domains = {}
+        for v in variables:
+            domains[v] = fd.FiniteDomain(range(nb_pigeons - 1))
+        repo = Repository(variables, domains)
+        for v1 in variables:
+            for v2 in variables:
+                if v1 < v2:
+                    repo.addConstraint(fd.make_expression((v1, v2),
+                                                          '%s != %s'%(v1, v2)))
+        return repo
+
+    def testSolveOne(self):
+        solution = RestartingSolver(cutoff=1).solve_one(self.repo)
+        self.assert_(solution['a'] < solution['b'] < solution['c'] <
+                     solution['d'])
+
+    def testSolveAll(self):
+        solver = RestartingSolver(cutoff=1)
+        solutions = solver.solve(makeQueens(6))
+        self.assert_(solver.restart_cnt > 0)
+        self.assertEquals(len(solutions), 4)
+        self.assertEquals(sortedSolutions(solutions),
+                          sortedSolutions(Solver().solve(makeQueens(6))))
+
+    def testGeometric(self):
+        solver = RestartingSolver(cutoff=1, factor=1.5)
+        self.assertEquals(len(solver.solve(makeQueens(6))), 4)
+        self.assert_(solver.restart_cnt > 0)
+
+    def testNoSolution(self):
+        solver = RestartingSolver(cutoff=2)
+        repo = self.makePigeonHoles(6)
+        self.assertEquals(solver.solve_one(repo), None)
+        self.assert_(solver.restart_cnt > 0)
+        self.assert_(solver.nogood_cnt > 0)
+
+    def testRepositoryRestored(self):
+        solver = RestartingSolver(cutoff=1)
+        repo = makeQueens(6)
+        nb_constraints = len(repo._constraints)
+        solver.solve(repo)
+        self.assert_(solver.nogood_cnt > 0)
+        self.assertEquals(len(repo._constraints), nb_constraints)
+        for domain in repo.getDomains().values():
+            self.assertEquals(domain.size(), 6)
+            self.assertEquals(domain._watchers, ())
+        self.assertEquals(len(solver.solve(repo)), 4)
+
+    def testSeed(self):
+        orders = []
+        for seed in (3, 3):
+            solver = RestartingSolver(cutoff=1, seed=seed)
+            orders.append(list(solver.solve_all(makeQueens(6))))
+        self.assertEquals(orders[0], orders[1])
+
+    def testSolveBest(self):
+        def cost(a, b, c, d):
+            return -(a + b + c + d)
+        solutions = list(RestartingSolver(cutoff=1).solve_best(self.repo,
+                                                                cost))
+        self.assertEquals(solutions[-1], ({'a':3, 'b':4, 'c':5, 'd':6}, -18))
+
+    def testWithoutTrail(self):
+        solver = RestartingSolver(cutoff=1, trail=False)
+        self.assertEquals(len(solver.solve(self.repo)), 35)
+        self.assertEquals(solver.restart_cnt, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+################################################
+# Measures how the scheduler scales, on problems made
+# by generate_roster.py for a ladder of worker counts:
+#
+#    python benchmark.py [options] --output results.json
+#    python benchmark.py [options] --baseline results.json
+#
+# Each size is scheduled by schedule_file_input.py in a
+# process of its own, which reports its wall time, peak
+# resident memory, search nodes and calls to narrow()
+# (see SolverStats). --output stores the results as JSON;
+# --baseline compares them with stored ones, and exits
+# with status 1 if some size got slower, bigger or
+# searched more. Run with --help for the options.
+################################################
+
+from optparse import OptionParser
+from time import time, sleep
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import generate_roster
+
+SCHEDULER = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ),
+                          'schedule_file_input.py' )
+
+# The counters compared with the baseline, and whether they
+# can vary from one run to the next (and so get a tolerance)
+COMPARED = [ ('wall_time', True), ('peak_rss_kb', True),
+             ('nodes', False), ('narrow_calls', False) ]
+
+# Wall times this close to their baseline, in seconds, are
+# never reported: they are mostly noise
+MIN_TIME_DIFFERENCE = 0.5
+
+# The line with which the child process gives its results
+RESULT_PREFIX = 'BENCHMARK '
+
+
+################################################
+# Runs in the child process: schedules the problem of
+# the given files and prints its measures as JSON.
+#
+# @param paths The files, as schedule_file_input.py takes them
+# @param optimizing Whether to optimize the schedule found
+################################################
+def measure( paths, optimizing ):
+    import resource
+    sys.argv = [ SCHEDULER ] + paths
+    sys.path.insert( 0, os.path.dirname( SCHEDULER ) )
+    start = time()
+    # importing it reads the files and builds the problem
+    import schedule_file_input as scheduler
+    setup_time = time() - start
+    scheduler.DEBUGGING = False
+    scheduler.SOLVER_STATS = True
+    scheduler.OPTIMIZING = optimizing
+    threshold, solutions = scheduler.find_schedule()
+    wall_time = time() - start
+
+    nodes = 0
+    narrow_calls = 0
+    for stats in scheduler.solver_stats:
+        nodes += stats['nodes']
+        for constraint in stats['constraints'].values():
+            narrow_calls += constraint['narrow_calls']
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+    print RESULT_PREFIX + json.dumps( {
+        'status': 'ok', 'threshold': threshold,
+        'wall_time': wall_time, 'setup_time': setup_time,
+        'peak_rss_kb': peak_rss, 'nodes': nodes,
+        'narrow_calls': narrow_calls,
+        'searches': len(scheduler.solver_stats) } )
+
+################################################
+# Schedules the problem of the given files in a child
+# process, killing it after timeout seconds.
+#
+# @return The measures of the child, whose status is 'ok',
+#         'timeout' or 'error'
+################################################
+def run_child( paths, optimizing, timeout ):
+    command = [ sys.executable, os.path.abspath( __file__ ), '--child' ]
+    if optimizing:
+        command.append( '--optimizing' )
+    output = tempfile.TemporaryFile()
+    start = time()
+    child = subprocess.Popen( command + paths, stdout=output,
+                              stderr=subprocess.STDOUT )
+    while child.poll() is None:
+        if time() - start > timeout:
+            child.kill()
+            child.wait()
+            return { 'status': 'timeout', 'wall_time': time() - start }
+        sleep( 0.05 )
+    output.seek( 0 )
+    lines = output.read().splitlines()
+    for line in lines:
+        if line.startswith( RESULT_PREFIX ):
+            return json.loads( line[ len(RESULT_PREFIX): ] )
+    return { 'status': 'error', 'output': '\n'.join( lines[-20:] ) }
+
+################################################
+# Generates and schedules a problem for every size.
+#
+# @param sizes The numbers of workers to try
+# @param generator The keyword arguments of generate_roster.generate,
+#                  but the number of workers
+# @return The list of the measures of every size, with the
+#         number of workers added
+################################################
+def run_ladder( sizes, generator, optimizing, timeout ):
+    runs = []
+    directory = tempfile.mkdtemp( prefix='roster' )
+    try:
+        for workers in sizes:
+            paths = generate_roster.generate( directory, workers=workers,
+                                              **generator )
+            run = run_child( paths, optimizing, timeout )
+            run['workers'] = workers
+            runs.append( run )
+            print format_run( run )
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree( directory )
+    return runs
+
+def format_run( run ):
+    if run['status'] != 'ok':
+        return '%7d workers: %s after %.2fs' % ( run['workers'], run['status'],
+                                                 run.get( 'wall_time', 0 ) )
+    return '%7d workers: %8.2fs (setup %.2fs) %9d KB %8d nodes ' \
+           '%9d narrow calls, threshold %s' % (
+               run['workers'], run['wall_time'], run['setup_time'],
+               run['peak_rss_kb'], run['nodes'], run['narrow_calls'],
+               run['threshold'] )
+
+################################################
+# Compares runs with those of a baseline.
+#
+# @param tolerance The share by which wall time and memory
+#                  may exceed their baseline
+# @return The list of the regressions found, as messages
+################################################
+def compare( runs, baseline, tolerance ):
+    regressions = []
+    previous = {}
+    for run in baseline['runs']:
+        previous[ run['workers'] ] = run
+    for run in runs:
+        base = previous.get( run['workers'] )
+        if base is None or base['status'] != 'ok':
+            continue
+        prefix = '%d workers: ' % run['workers']
+        if run['status'] != 'ok':
+            regressions.append( prefix + run['status'] )
+            continue
+        for counter, noisy in COMPARED:
+            limit = base[counter]
+            if noisy:
+                limit = limit * ( 1 + tolerance )
+            if counter == 'wall_time':
+                limit = max( limit, base[counter] + MIN_TIME_DIFFERENCE )
+            if run[counter] > limit:
+                regressions.append( prefix + '%s %s, baseline %s' % (
+                    counter, run[counter], base[counter] ) )
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = OptionParser( usage='%prog [options]' )
+    generate_roster.add_generator_options( parser )
+    parser.remove_option( '--workers' )
+    parser.add_option( '--sizes', default='50,150,500,1500,5000',
+                       help='comma separated numbers of workers [%default]' )
+    parser.add_option( '--optimizing', action='store_true', default=False,
+                       help='also optimize the schedules found' )
+    parser.add_option( '--timeout', type='float', default=600,
+                       help='seconds allowed for each size [%default]' )
+    parser.add_option( '--output', metavar='FILE',
+                       help='store the results in FILE as JSON' )
+    parser.add_option( '--baseline', metavar='FILE',
+                       help='compare the results with those stored in FILE' )
+    parser.add_option( '--tolerance', type='float', default=0.25,
+                       help='share by which wall time and memory may exceed '
+                            'the baseline [%default]' )
+    parser.add_option( '--child', action='store_true',
+                       help='(internal) schedule the given files' )
+    options, args = parser.parse_args()
+    if options.child:
+        measure( args, options.optimizing )
+        sys.exit( 0 )
+
+    # --workers was removed, generator_arguments must not see it
+    options.workers = None
+    generator = generate_roster.generator_arguments( options )
+    del generator['workers']
+    sizes = [ int(size) for size in options.sizes.split(',') ]
+    runs = run_ladder( sizes, generator, options.optimizing, options.timeout )
+    results = { 'generator': generator, 'optimizing': options.optimizing,
+                'runs': runs }
+    if options.output:
+        output = open( options.output, 'w' )
+        try:
+            json.dump( results, output, indent=1, sort_keys=True )
+        finally:
+            output.close()
+    if options.baseline:
+        baseline = json.load( open( options.baseline ) )
+        if baseline['generator'] != generator or \
+               baseline['optimizing'] != options.optimizing:
+            print 'Warning: the baseline was made with other options'
+        regressions = compare( runs, baseline, options.tolerance )
+        for regression in regressions:
+            print 'Regression:', regression
+        if regressions:
+            sys.exit( 1 )
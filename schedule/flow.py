@@ -0,0 +1,240 @@
+################################################
+# Flow based feasibility check for the scheduler.
+#
+# Leaving overlaps aside, a schedule is a bipartite
+# b-matching: every worker-shift needs one of its allowed
+# workers, and a worker fills at most one worker-shift of
+# a given (day, shift). That is a max-flow problem over
+#
+#    source -> worker-shift -> (group, worker) -> sink
+#
+# with unit capacities, where the group of a worker-shift
+# is its (day, shift). An overlap window whose shifts are
+# in no other window becomes a single group, so that a
+# worker also fills at most one worker-shift of the whole
+# window. When every window can be grouped that way the
+# flow is exact; otherwise it is a relaxation: a flow that
+# cannot serve every worker-shift proves there is no
+# schedule, and a flow that does may still break an
+# overlap (see satisfies_windows).
+#
+# Unit capacities make every augmenting path alternate
+# between worker-shifts and (group, worker) nodes, so the
+# flow is found as a maximum bipartite matching.
+################################################
+
+from heapq import heappush, heappop
+
+INFINITY = float('inf')
+
+
+################################################
+# Works out the group of each (non-unique) shift.
+#
+# @param short_keys The short key of every shift, e.g. "d2s3"
+# @param overlap_windows A list of tuples of short keys of
+#                        shifts that all overlap one another
+#                        (see make_overlap_windows)
+# @return A tuple (groups, exact): groups maps each short key
+#         to its group, exact tells whether the groups account
+#         for every overlap
+################################################
+def make_flow_groups( short_keys, overlap_windows ):
+    windows_of = {}
+    for window in overlap_windows:
+        for short_key in window:
+            windows_of[short_key] = windows_of.get( short_key, 0 ) + 1
+
+    groups = {}
+    for short_key in short_keys:
+        groups[short_key] = short_key
+    exact = True
+    for window in overlap_windows:
+        for short_key in window:
+            if windows_of[short_key] != 1:
+                exact = False
+                break
+        else:
+            for short_key in window:
+                groups[short_key] = window
+    return (groups, exact)
+
+
+################################################
+# Computes a maximum flow, i.e. fills as many worker-shifts
+# as possible.
+#
+# @param allowed_workers A dictionary mapping each unique shift
+#                        to the workers allowed to work it
+#                        (see make_allowed_workers)
+# @param groups The groups returned by make_flow_groups, keyed
+#               by short shift key
+# @param shorten_shift_key The function giving the short key
+#                          of a unique shift
+# @return A dictionary mapping each worker-shift that could be
+#         filled to its worker
+################################################
+def max_flow_assignment( allowed_workers, groups, shorten_shift_key ):
+    # worker-shifts with the fewest workers first: they are the
+    # likeliest to need an augmenting path
+    shifts = [ (len(workers), shift)
+               for shift, workers in allowed_workers.items() ]
+    shifts.sort()
+
+    # (group, worker) -> the worker-shift it serves
+    owner = {}
+    # worker-shift -> the worker serving it
+    assignment = {}
+    options = {}
+    for size, shift in shifts:
+        group = groups[ shorten_shift_key(shift) ]
+        options[shift] = [ (group, worker)
+                           for worker in sorted( allowed_workers[shift] ) ]
+
+    for size, shift in shifts:
+        augment( shift, options, owner, assignment )
+    return assignment
+
+
+################################################
+# Looks for an augmenting path from the unserved
+# worker-shift root, and applies it if there is one.
+# The search is iterative, so long paths do not hit
+# the recursion limit.
+#
+# @return True if root is now served
+################################################
+def augment( root, options, owner, assignment ):
+    visited = set()
+    # each frame is (worker-shift, index of its next option,
+    # node through which it was reached)
+    stack = [ [root, 0, None] ]
+    while stack:
+        frame = stack[-1]
+        shift = frame[0]
+        if frame[1] == len( options[shift] ):
+            stack.pop()
+            continue
+        node = options[shift][frame[1]]
+        frame[1] += 1
+        if node in visited:
+            continue
+        visited.add( node )
+        if node not in owner:
+            # free node: flip the edges along the path
+            for path_shift, index, _ in reversed( stack ):
+                path_node = options[path_shift][index - 1]
+                owner[path_node] = path_shift
+                assignment[path_shift] = path_node[1]
+            return True
+        stack.append( [owner[node], 0, node] )
+    return False
+
+
+################################################
+# Computes a minimum cost flow filling every worker-shift,
+# i.e. the cheapest assignment, by successive shortest
+# paths: worker-shifts are served one after another along
+# the cheapest augmenting path, found by Dijkstra over
+# costs reduced by potentials so that they stay positive.
+#
+# @param allowed_workers A dictionary mapping each unique shift
+#                        to the workers allowed to work it
+# @param groups The groups returned by make_flow_groups
+# @param shorten_shift_key The function giving the short key
+#                          of a unique shift
+# @param cost A function taking a unique shift and a worker and
+#             returning the (non negative) cost of the pair
+# @return A dictionary mapping each worker-shift to its worker,
+#         or None if some worker-shift cannot be filled
+################################################
+def min_cost_assignment( allowed_workers, groups, shorten_shift_key, cost ):
+    options = {}
+    for shift, workers in allowed_workers.items():
+        group = groups[ shorten_shift_key(shift) ]
+        options[shift] = [ ( (group, worker), cost(shift, worker) )
+                           for worker in sorted( workers ) ]
+
+    # (group, worker) -> the worker-shift it serves
+    owner = {}
+    # worker-shift -> the (group, worker) serving it
+    served_by = {}
+    shift_potential = dict.fromkeys( options, 0 )
+    node_potential = {}
+    for root in sorted( options ):
+        shift_dist = { root: 0 }
+        node_dist = {}
+        node_prev = {}
+        done = set()
+        heap = [ (0, root) ]
+        best = None
+        while heap:
+            dist, shift = heappop( heap )
+            if shift in done:
+                continue
+            if best is not None and dist >= best[0]:
+                break
+            done.add( shift )
+            for node, node_cost in options[shift]:
+                reduced = node_cost + shift_potential[shift] - \
+                          node_potential.get( node, 0 )
+                if dist + reduced >= node_dist.get( node, INFINITY ):
+                    continue
+                node_dist[node] = dist + reduced
+                node_prev[node] = shift
+                if node in owner:
+                    # the matched edge back to the owner is tight
+                    next_shift = owner[node]
+                    if dist + reduced < shift_dist.get( next_shift, INFINITY ):
+                        shift_dist[next_shift] = dist + reduced
+                        heappush( heap, (dist + reduced, next_shift) )
+                elif best is None or dist + reduced < best[0]:
+                    best = (dist + reduced, node)
+        if best is None:
+            return None
+
+        # keep the reduced costs positive for the next root; free
+        # nodes all keep a potential of 0, so that the cheapest path
+        # is the one reaching the closest free node
+        limit = best[0]
+        for shift in options:
+            shift_potential[shift] += min( shift_dist.get( shift, INFINITY ),
+                                           limit )
+        for node in owner:
+            node_potential[node] = node_potential.get( node, 0 ) + \
+                                   min( node_dist.get( node, INFINITY ), limit )
+        node = best[1]
+        node_potential[node] = node_potential.get( node, 0 ) + \
+                               min( node_dist[node], limit )
+
+        # flip the edges along the path
+        while True:
+            shift = node_prev[node]
+            previous = served_by.get( shift )
+            served_by[shift] = node
+            owner[node] = shift
+            if shift == root:
+                break
+            node = previous
+
+    assignment = {}
+    for shift, node in served_by.items():
+        assignment[shift] = node[1]
+    return assignment
+
+
+################################################
+# Checks that an assignment gives different workers to the
+# worker-shifts of every overlap window.
+#
+# @param assignment A dictionary mapping worker-shifts to workers
+# @param unique_windows A list of tuples of unique shifts that
+#                       all overlap one another
+#                       (see extend_overlap_windows_to_be_unique)
+################################################
+def satisfies_windows( assignment, unique_windows ):
+    for window in unique_windows:
+        workers = set( [ assignment[shift] for shift in window ] )
+        if len(workers) != len(window):
+            return False
+    return True
@@ -0,0 +1,211 @@
+################################################
+# Generates random scheduling problems in the file
+# formats read by schedule_file_input.py:
+#
+#    python generate_roster.py [options] directory
+#
+# writes shifts.txt, workers.txt, overlapping.txt,
+# jobs.txt and shift_jobs.txt to directory, which are
+# then scheduled with
+#
+#    python schedule_file_input.py directory/shifts.txt
+#        directory/workers.txt directory/overlapping.txt
+#        directory/jobs.txt directory/shift_jobs.txt
+#
+# The same options and seed always give the same files.
+# Run with --help for the options.
+################################################
+
+from optparse import OptionParser
+import os
+import random
+
+
+################################################
+# The (day, shift) pairs of the horizon, in time order.
+#
+# @param days The number of days
+# @param shifts_per_day The number of shifts of each day
+################################################
+def make_horizon( days, shifts_per_day ):
+    return [ (day, shift) for day in range( 1, days + 1 )
+                          for shift in range( 1, shifts_per_day + 1 ) ]
+
+################################################
+# Draws how many workers each shift needs: from 1 up to
+# the given share of the workers.
+#
+# @param rng The random.Random to draw from
+# @param horizon The (day, shift) pairs (see make_horizon)
+# @param workers The number of workers
+# @param staffing The highest share of the workers a shift needs
+# @return A list of [day, shift, needed]
+################################################
+def make_shifts( rng, horizon, workers, staffing ):
+    most = max( 1, int( workers * staffing ) )
+    return [ [day, shift, rng.randint( 1, most )] for day, shift in horizon ]
+
+################################################
+# Draws the availability of every worker for every shift.
+#
+# @param rng The random.Random to draw from
+# @param horizon The (day, shift) pairs (see make_horizon)
+# @param workers The number of workers
+# @param density The probability that a worker is available
+#                at all for a shift; the availability is then
+#                drawn from 1 to 100, and is 0 otherwise
+# @return A list of [worker, day, shift, availability]
+################################################
+def make_workers( rng, horizon, workers, density ):
+    rows = []
+    for worker in range( workers ):
+        for day, shift in horizon:
+            availability = 0
+            if rng.random() < density:
+                availability = rng.randint( 1, 100 )
+            rows.append( [worker, day, shift, availability] )
+    return rows
+
+################################################
+# Draws which consecutive shifts overlap: each shift
+# overlaps the next one, the next day's first included,
+# with the given probability.
+#
+# @param rng The random.Random to draw from
+# @param horizon The (day, shift) pairs (see make_horizon)
+# @param overlap_ratio The probability of each overlap
+# @return A list of [day_0, shift_0, day_1, shift_1]
+################################################
+def make_overlaps( rng, horizon, overlap_ratio ):
+    overlaps = []
+    for first, second in zip( horizon, horizon[1:] ):
+        if rng.random() < overlap_ratio:
+            overlaps.append( list(first) + list(second) )
+    return overlaps
+
+################################################
+# Draws the job type of every worker.
+#
+# @param rng The random.Random to draw from
+# @param workers The number of workers
+# @param job_types The number of job types
+# @return A list of [worker, job]
+################################################
+def make_jobs( rng, workers, job_types ):
+    return [ [worker, rng.randrange( job_types )]
+             for worker in range( workers ) ]
+
+################################################
+# Draws the shifts that need some job type, and how
+# many of their workers must have it.
+#
+# @param rng The random.Random to draw from
+# @param shifts The shifts (see make_shifts)
+# @param job_types The number of job types
+# @param job_ratio The probability that a shift needs a job type
+# @return A list of [day, shift, job, number_needed]
+################################################
+def make_shift_jobs( rng, shifts, job_types, job_ratio ):
+    shift_jobs = []
+    for day, shift, needed in shifts:
+        if rng.random() < job_ratio:
+            shift_jobs.append( [day, shift, rng.randrange( job_types ),
+                                rng.randint( 1, needed )] )
+    return shift_jobs
+
+################################################
+# Writes rows of integers to a file, after a comment
+# header, ending the data with the usual '%' line.
+################################################
+def write_rows( file_path, header, rows ):
+    output = open( file_path, 'w' )
+    try:
+        output.write( '# ' + header + '\n' )
+        for row in rows:
+            output.write( ','.join( [ str(item) for item in row ] ) + '\n' )
+        output.write( '%\n' )
+    finally:
+        output.close()
+
+################################################
+# Generates a problem and writes its files.
+#
+# @param directory Where to write the files, created if needed
+# @param seed The seed of the random draws
+# @return A list with the paths of the shift, worker,
+#         overlap, job and shift-job files, in the order
+#         schedule_file_input.py takes them
+################################################
+def generate( directory, workers=50, days=7, shifts_per_day=3,
+              density=0.7, overlap_ratio=0.2, staffing=0.05, job_types=2,
+              job_ratio=0.3, seed=0 ):
+    rng = random.Random( seed )
+    horizon = make_horizon( days, shifts_per_day )
+    shifts = make_shifts( rng, horizon, workers, staffing )
+    files = [ ( 'shifts.txt', 'day,shift,needed', shifts ),
+              ( 'workers.txt', 'worker,day,shift,availability',
+                make_workers( rng, horizon, workers, density ) ),
+              ( 'overlapping.txt', 'day_0,shift_0,day_1,shift_1',
+                make_overlaps( rng, horizon, overlap_ratio ) ),
+              ( 'jobs.txt', 'worker,job',
+                make_jobs( rng, workers, job_types ) ),
+              ( 'shift_jobs.txt', 'day,shift,job_type,number_needed',
+                make_shift_jobs( rng, shifts, job_types, job_ratio ) ) ]
+    if not os.path.isdir( directory ):
+        os.makedirs( directory )
+    paths = []
+    for name, header, rows in files:
+        path = os.path.join( directory, name )
+        write_rows( path, header, rows )
+        paths.append( path )
+    return paths
+
+
+################################################
+# Adds the options of generate() to an OptionParser.
+################################################
+def add_generator_options( parser ):
+    parser.add_option( '--workers', type='int', default=50,
+                       help='number of workers [%default]' )
+    parser.add_option( '--days', type='int', default=7,
+                       help='length of the horizon in days [%default]' )
+    parser.add_option( '--shifts-per-day', type='int', default=3,
+                       help='number of shifts of each day [%default]' )
+    parser.add_option( '--density', type='float', default=0.7,
+                       help='probability that a worker is available for '
+                            'a shift [%default]' )
+    parser.add_option( '--overlap-ratio', type='float', default=0.2,
+                       help='probability that a shift overlaps the next '
+                            '[%default]' )
+    parser.add_option( '--staffing', type='float', default=0.05,
+                       help='highest share of the workers a shift needs '
+                            '[%default]' )
+    parser.add_option( '--job-types', type='int', default=2,
+                       help='number of job types [%default]' )
+    parser.add_option( '--job-ratio', type='float', default=0.3,
+                       help='probability that a shift needs a job type '
+                            '[%default]' )
+    parser.add_option( '--seed', type='int', default=0,
+                       help='seed of the random draws [%default]' )
+
+################################################
+# The keyword arguments of generate() given by the
+# options of add_generator_options.
+################################################
+def generator_arguments( options ):
+    return dict( workers=options.workers, days=options.days,
+                 shifts_per_day=options.shifts_per_day,
+                 density=options.density,
+                 overlap_ratio=options.overlap_ratio,
+                 staffing=options.staffing, job_types=options.job_types,
+                 job_ratio=options.job_ratio, seed=options.seed )
+
+
+if __name__ == '__main__':
+    parser = OptionParser( usage='%prog [options] directory' )
+    add_generator_options( parser )
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error( 'expected the directory to write the files to' )
+    for path in generate( args[0], **generator_arguments( options ) ):
+        print path
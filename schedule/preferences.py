@@ -0,0 +1,303 @@
+################################################
+# Worker x shift preference matrix for the scheduler.
+#
+# Every preference level lives in one dense matrix with
+# a row per (non-unique) shift and a column per worker,
+# instead of a dictionary keyed by strings such as
+# "w3d1s2". Ranking the workers of each shift, counting
+# the workers available at a threshold and summing the
+# cost of a schedule are then whole-row or whole-matrix
+# operations.
+#
+# numpy is optional: without it the matrix is a list of
+# rows and the same operations run as plain loops.
+################################################
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class PreferenceMatrix(object):
+    ################################################
+    # @param short_keys The short key of every shift to
+    #                   schedule, e.g. "d2s3", each once
+    # @param workers A tuple with the names of the workers,
+    #                worker number i being workers[i]
+    # @param worker_list The worker list representation, a list
+    #                    of [worker, day, shift, availability];
+    #                    entries for shifts not in short_keys
+    #                    are ignored, and a worker who did not
+    #                    rate a shift counts as not available (0)
+    ################################################
+    def __init__( self, short_keys, workers, worker_list ):
+        self.short_keys = list(short_keys)
+        self.workers = list(workers)
+        self.shift_index = {}
+        for row, short_key in enumerate( self.short_keys ):
+            self.shift_index[short_key] = row
+        self.worker_index = {}
+        for column, worker in enumerate( self.workers ):
+            self.worker_index[worker] = column
+
+        # (day, shift) -> row, the way worker_list names shifts
+        rows_of = {}
+        for short_key, row in self.shift_index.items():
+            day, shift = short_key[1:].split('s')
+            rows_of[ (int(day), int(shift)) ] = row
+
+        if numpy is not None:
+            self.values = numpy.zeros( (len(self.short_keys),
+                                        len(self.workers)), numpy.int16 )
+            if worker_list:
+                entries = numpy.array( worker_list, numpy.int32 )
+                lookup = numpy.empty( (entries[:,1].max() + 1,
+                                       entries[:,2].max() + 1), numpy.int32 )
+                lookup.fill( -1 )
+                for (day, shift), row in rows_of.items():
+                    if day < lookup.shape[0] and shift < lookup.shape[1]:
+                        lookup[day, shift] = row
+                rows = lookup[ entries[:,1], entries[:,2] ]
+                kept = rows >= 0
+                self.values[ rows[kept], entries[kept, 0] ] = entries[kept, 3]
+        else:
+            self.values = [ [0] * len(self.workers) for row in self.short_keys ]
+            for worker, day, shift, availability in worker_list:
+                row = rows_of.get( (day, shift) )
+                if row is not None:
+                    self.values[row][worker] = availability
+
+    ################################################
+    # Returns the preference level of a worker for a
+    # (non-unique) shift.
+    ################################################
+    def preference( self, worker, short_key ):
+        return int( self.values[ self.shift_index[short_key] ]
+                               [ self.worker_index[worker] ] )
+
+    ################################################
+    # Returns the distinct preference levels found in
+    # the matrix, highest first.
+    ################################################
+    def levels( self ):
+        if numpy is not None:
+            levels = [ int(level) for level in numpy.unique( self.values ) ]
+        else:
+            levels = list( set( [ level for row in self.values
+                                  for level in row ] ) )
+        levels.sort(reverse=True)
+        return levels
+
+    ################################################
+    # Ranks the workers of every shift by decreasing
+    # preference level, ties going by worker name.
+    #
+    # @return A dictionary whose keys are short shift keys
+    #         and whose values are tuples (negated prefs,
+    #         workers) of two parallel lists
+    ################################################
+    def rankings( self ):
+        table = {}
+        if numpy is not None:
+            # rank of each column when the names are sorted
+            by_name = sorted( range(len(self.workers)),
+                              key=self.workers.__getitem__ )
+            name_rank = numpy.empty( len(self.workers), numpy.int32 )
+            name_rank[by_name] = numpy.arange( len(self.workers) )
+            negated = -self.values.astype( numpy.int32 )
+            order = numpy.lexsort( ( numpy.resize( name_rank, negated.shape ),
+                                     negated ), axis=1 )
+            for row, short_key in enumerate( self.short_keys ):
+                columns = order[row]
+                table[short_key] = ( negated[row][columns].tolist(),
+                                     [ self.workers[column]
+                                       for column in columns ] )
+        else:
+            for row, short_key in enumerate( self.short_keys ):
+                ranking = [ (-level, worker) for level, worker
+                            in zip( self.values[row], self.workers ) ]
+                ranking.sort()
+                table[short_key] = ( [item[0] for item in ranking],
+                                     [item[1] for item in ranking] )
+        return table
+
+    ################################################
+    # Counts the workers whose preference level for each
+    # shift is at least the threshold.
+    #
+    # @return A dictionary mapping short shift keys to counts
+    ################################################
+    def available_counts( self, availability_threshold ):
+        if numpy is not None:
+            counts = ( self.values >= availability_threshold ).sum( axis=1 )
+            counts = counts.tolist()
+        else:
+            counts = [ len( [ level for level in row
+                              if level >= availability_threshold ] )
+                       for row in self.values ]
+        return dict( zip( self.short_keys, counts ) )
+
+    ################################################
+    # Groups the workers who gave the same preference level
+    # for every shift. The scheduler cannot tell two such
+    # workers apart, so any schedule stays as good when they
+    # swap all their shifts.
+    #
+    # @param worker_keys Optional dictionary mapping workers to
+    #                    something else they must share to be
+    #                    in a same group, e.g. their job type
+    # @return A list of lists of workers, each in the order of
+    #         the columns and holding at least two
+    ################################################
+    def worker_classes( self, worker_keys=None ):
+        if numpy is not None:
+            # tostring() is the name numpy < 1.9 gives tobytes()
+            if hasattr( self.values, 'tobytes' ):
+                columns = [ column.tobytes() for column in self.values.T ]
+            else:
+                columns = [ column.tostring() for column in self.values.T ]
+        else:
+            columns = zip( *self.values ) or [ () ] * len(self.workers)
+        classes = {}
+        order = []
+        for worker, column in zip( self.workers, columns ):
+            key = column
+            if worker_keys is not None:
+                key = ( column, worker_keys.get( worker ) )
+            if key not in classes:
+                classes[key] = []
+                order.append( key )
+            classes[key].append( worker )
+        return [ classes[key] for key in order if len(classes[key]) > 1 ]
+
+    ################################################
+    # Sums the preference levels of (shift, worker) pairs.
+    #
+    # @param short_keys The short keys of the shifts
+    # @param workers The workers, parallel to short_keys
+    ################################################
+    def total( self, short_keys, workers ):
+        rows = [ self.shift_index[short_key] for short_key in short_keys ]
+        columns = [ self.worker_index[worker] for worker in workers ]
+        if numpy is not None:
+            return int( self.values[ rows, columns ].sum() )
+        total = 0
+        for row, column in zip( rows, columns ):
+            total += self.values[row][column]
+        return total
+
+
+class ScheduleScorer(object):
+    ################################################
+    # Scores schedules: each worker-shift costs how far its
+    # worker is from full availability for it, and a schedule
+    # costs the sum over its worker-shifts, lower being better.
+    # The cost of every (worker-shift, worker) pair is looked
+    # up once here, so a schedule scores in one pass over its
+    # worker-shifts and a single change in constant time.
+    #
+    # A scorer can be passed to Solver.solve_best() as is: it
+    # takes the solver's keyword arguments, and lower_bound()
+    # lets the solver skip whatever cannot beat the best
+    # schedule found so far.
+    #
+    # NOTE: Nozick's Utility Monster applies.
+    #
+    # @param preference_matrix The PreferenceMatrix of the workers
+    # @param shifts The unique keys of the worker-shifts, e.g. "d2s3n1"
+    # @param shorten_shift_key The function giving the short key
+    #                          of a unique shift
+    # @param max_preference The highest availability a worker can give
+    ################################################
+    def __init__( self, preference_matrix, shifts, shorten_shift_key,
+                  max_preference ):
+        if numpy is not None:
+            costs = ( max_preference - preference_matrix.values ).tolist()
+        else:
+            costs = [ [ max_preference - level for level in row ]
+                      for row in preference_matrix.values ]
+        # unique shift -> {worker: cost}, shared by the
+        # worker-shifts of a same (day, shift)
+        rows = {}
+        self._costs = {}
+        for shift in shifts:
+            short_key = shorten_shift_key(shift)
+            if short_key not in rows:
+                row = costs[ preference_matrix.shift_index[short_key] ]
+                rows[short_key] = dict( zip( preference_matrix.workers, row ) )
+            self._costs[shift] = rows[short_key]
+
+    ################################################
+    # Returns the cost of a worker working a worker-shift.
+    ################################################
+    def cost( self, shift, worker ):
+        return self._costs[shift][worker]
+
+    ################################################
+    # Returns the cost of a schedule.
+    #
+    # @param assignment A dictionary mapping each worker-shift
+    #                   to its worker
+    ################################################
+    def score( self, assignment ):
+        costs = self._costs
+        total = 0
+        for shift, worker in assignment.items():
+            total += costs[shift][worker]
+        return total
+
+    ################################################
+    # Returns the cost of a solution, as the Solver gives
+    # them: each worker-shift is associated with a value
+    # (day, shift, worker).
+    ################################################
+    def __call__( self, **solution ):
+        costs = self._costs
+        total = 0
+        for shift, value in solution.items():
+            total += costs[shift][ value[2] ]
+        return total
+
+    ################################################
+    # Returns by how much the cost of a schedule changes
+    # when a worker-shift is given to another worker.
+    #
+    # @param assignment A dictionary mapping each worker-shift
+    #                   to its worker
+    ################################################
+    def reassign_delta( self, assignment, shift, worker ):
+        costs = self._costs[shift]
+        return costs[worker] - costs[ assignment[shift] ]
+
+    ################################################
+    # Returns by how much the cost of a schedule changes
+    # when two worker-shifts swap their workers.
+    #
+    # @param assignment A dictionary mapping each worker-shift
+    #                   to its worker
+    ################################################
+    def swap_delta( self, assignment, shift1, shift2 ):
+        costs1 = self._costs[shift1]
+        costs2 = self._costs[shift2]
+        worker1 = assignment[shift1]
+        worker2 = assignment[shift2]
+        return costs1[worker2] + costs2[worker1] - \
+               costs1[worker1] - costs2[worker2]
+
+    ################################################
+    # Returns a lower bound of the cost of every complete
+    # schedule still allowed by the given domains: each
+    # worker-shift costs at least as much as its cheapest
+    # remaining worker.
+    #
+    # @param domains A dictionary mapping each worker-shift
+    #                to its current domain of (day, shift,
+    #                worker) values
+    ################################################
+    def lower_bound( self, domains ):
+        bound = 0
+        for shift, domain in domains.items():
+            costs = self._costs[shift]
+            bound += min([ costs[ value[2] ] for value in domain.getValues() ])
+        return bound
@@ -15,13 +15,87 @@
 ################################################
 
 from logilab.constraint import *
+from logilab.constraint.propagation import ConsistencyFailure
+from logilab.constraint.distributors import ValueSymmetryDistributor, \
+     ValueOrderingDistributor, DomWDegDistributor, ImpactDistributor, \
+     RandomizingDistributor
+from logilab.constraint.portfolio import PortfolioSolver, supportsPortfolio
+from logilab.constraint.parallel import ParallelSolver
+from logilab.constraint.restarts import RestartingSolver
+from logilab.constraint.backjumping import BackjumpingSolver
+from bisect import bisect_right
+import flow
+from preferences import PreferenceMatrix, ScheduleScorer
 from pprint import pprint # "Pretty Print" -- for nicely printed dicts
 from time import strftime
+import multiprocessing
 import random
 import sys
 
 DEBUGGING = True
 
+# Set OPTIMIZING to True to look for the schedule that best
+# matches the workers' preferences, once the best availability
+# threshold is known, instead of keeping the first one found.
+# The min cost flow (see flow.py) gives it directly unless it
+# breaks an overlap; the search repairing it then stops after
+# OPTIMIZING_NODE_BUDGET search nodes (None for no limit) and
+# keeps the best schedule found so far.
+OPTIMIZING = False
+OPTIMIZING_NODE_BUDGET = 20000
+
+# Set PORTFOLIO_PROCESSES above 1 to race that many solvers,
+# each with its own way of branching, in separate processes:
+# the first schedule found wins and the other processes are
+# stopped. When optimizing, every solver gets its own node
+# budget and they share the cost of the best schedule found
+# so far, so that each one skips what cannot beat it.
+PORTFOLIO_PROCESSES = 0
+
+# Set PARALLEL_PROCESSES above 1 to split each search between
+# that many processes instead, each searching its own part of
+# the search tree; this also speeds up proving that there is no
+# schedule at some threshold. PORTFOLIO_PROCESSES wins if both
+# are set.
+PARALLEL_PROCESSES = 0
+
+# Set THRESHOLD_PROCESSES above 1 to try that many availability
+# thresholds at once, in separate processes, when the best one
+# needs a search. A probe is stopped as soon as another one
+# shows that its answer no longer matters.
+THRESHOLD_PROCESSES = 0
+
+# Set RESTART_CUTOFF above 0 to pick the workers at random,
+# restarting the search once it met that many failures times
+# the Luby sequence (1, 1, 2, 1, 1, 2, 4...). Each restart
+# remembers the parts of the search already explored, so no
+# schedule is missed. Not used with interchangeable workers.
+RESTART_CUTOFF = 0
+
+# Set BACKJUMPING to True to go back, when the search fails,
+# straight to the choice that caused the failure instead of
+# the last one, and to remember small combinations of choices
+# that fail. This saves a lot of search on over-constrained
+# overlaps and jobs. Not used with interchangeable workers;
+# RESTART_CUTOFF wins if both are set.
+BACKJUMPING = False
+
+# Set SOLVER_STATS to True to keep the statistics of every
+# search in solver_stats, and print them as JSON when
+# DEBUGGING: search nodes, failures, and the calls, time and
+# pruning of each kind of constraint. Searches split between
+# processes are not counted.
+SOLVER_STATS = False
+
+# The highest availability a worker can give for a shift
+MAX_PREFERENCE = 100
+
+# The constraint keeping a worker from being scheduled twice
+# on the same shift. fd.MatchingAllDistinct prunes every worker
+# that cannot be part of a solution, which saves a lot of search
+# on hard inputs; fd.AllDistinct is cheaper but much weaker.
+DISTINCT_CONSTRAINT = fd.MatchingAllDistinct
+
 ################################################
 # Converts the shift list to a dictionary for easy searching
 #
@@ -43,41 +117,82 @@ def shift_list_to_dictionary( shift_list ):
     return shift_d
 
 ################################################
-# This function takes a list of non-unique overlapping shift
-# tuples (as returned by the load_overlapping_shifts() function)
-# and translates all shifts to their unique counterparts. E.g.,
-# if we had 3 workers at shift 2 of day 1, we would change all
-# instances of "d1s2" to 3 separate constraints involving
-# "d1s2n1", "d1s2n2", and "d1s2n3", respectively.
+# This function groups the pairs of overlapping shifts
+# (as returned by the load_overlapping_shifts() function)
+# into time windows: sets of shifts that all overlap one
+# another, and so need as many different workers as they
+# have worker-shifts. Each pair ends up in one window at
+# least, grown greedily with the shifts overlapping all of
+# the window.
 #
 # @param nonunique_overlap A list of tuples, where each tuple
 #                          specifies the non-unique string
 #                          representation of 2 shifts that overlap.
+# @return A list of tuples, each holding the non-unique string
+#         representation of shifts that all overlap one another.
+################################################
+def make_overlap_windows( nonunique_overlap ):
+    neighbours = {}
+    for (shift_0, shift_1) in nonunique_overlap:
+        neighbours.setdefault( shift_0, {} )[shift_1] = None
+        neighbours.setdefault( shift_1, {} )[shift_0] = None
+
+    windows = []
+    covered = {}
+    for (shift_0, shift_1) in nonunique_overlap:
+        # workers of the same shift are already all different
+        if shift_0 == shift_1 or (shift_0, shift_1) in covered:
+            continue
+        window = [shift_0, shift_1]
+        for shift in sorted( neighbours[shift_0] ):
+            if shift in window:
+                continue
+            for other in window:
+                if shift not in neighbours[other]:
+                    break
+            else:
+                window.append( shift )
+        window.sort()
+        for shift_a in window:
+            for shift_b in window:
+                covered[ (shift_a, shift_b) ] = None
+        windows.append( tuple(window) )
+
+    return windows
+
+################################################
+# This function takes a list of time windows (as returned by
+# the make_overlap_windows() function) and translates all
+# shifts to their unique counterparts. E.g., if we had 3
+# workers at shift 2 of day 1, "d1s2" would be replaced by
+# "d1s2n1", "d1s2n2", and "d1s2n3".
+#
+# @param overlap_windows A list of tuples of the non-unique
+#                        string representation of shifts that
+#                        all overlap one another.
 # @param shift_list A list of all worker-shifts, each specified as
 #                   [day, shift, number]
 # @return A list containing a number of tuples; each tuple
 #         specifies the unique string representation of
-#         two person-shifts that overlap one another.
+#         person-shifts that all overlap one another.
 ################################################
-def extend_overlapping_shifts_to_be_unique( nonunique_overlap, shift_list ):
-    unique_overlap_list = []
+def extend_overlap_windows_to_be_unique( overlap_windows, shift_list ):
+    unique_windows = []
 
     # Convert the list to a dictionary for easy searching
     shift_d = shift_list_to_dictionary( shift_list )
 
-    for pair in nonunique_overlap:
-        if not ((pair[0] in shift_d) and (pair[1] in shift_d)):
-            raise ValueError
-
-        # For each unique shift associated with the first shift . . .
-        for i in range( shift_d[ pair[0] ] + 1 ):
-            # And each unique shift associated with the second . . .
-            for j in range( shift_d[ pair[1] ] + 1):
-                unique_overlap_list.append(
-                    ( extend_shift_key( pair[0], i ),
-                      extend_shift_key( pair[1], j ) ) )
+    for window in overlap_windows:
+        unique_window = ()
+        for shift in window:
+            if shift not in shift_d:
+                raise ValueError
+            # Each unique shift associated with the shift
+            for i in range( shift_d[ shift ] + 1 ):
+                unique_window = unique_window + ( extend_shift_key( shift, i ), )
+        unique_windows.append( unique_window )
 
-    return unique_overlap_list
+    return unique_windows
 
 ################################################
 # This function takes a path to a file and returns
@@ -277,7 +392,7 @@ def shift_job_to_string_list ( shift_job_item, worker_number ):
 # The keys in shift_tuple uniquely identify each
 # shift, but sometimes we only care about day and
 # shift, not which of the worker-shifts at that time.
-# So to get the key for worker_prefs, we break off
+# So to get the key for preferences, we break off
 # everything from 'n' to the end.
 ################################################
 def shorten_shift_key(key):
@@ -360,185 +475,329 @@ def make_shift_job_tuple( shift_job_list ):
 ################################################
 # This function creates the domains for each shift variable.
 # It limits the domain to the day and shift that the
-# shift represents, and allows any worker to work that shift.
+# shift represents, and allows any worker to work that shift
+# unless allowed_workers says otherwise. Filtering the
+# workers here is much cheaper than adding one constraint
+# per forbidden (worker, shift) pair.
+# All the domains are bitsets over one shared universe of
+# (day, shift, worker) values, which keeps copies, removals
+# and the AllDistinct checks down to integer operations.
 #
 # @params shift_list A list of all the shifts, [day,shift] format
 # @params workers_tuple A tuple containing the strings representing
 #                       each worker
+# @params allowed_workers Optional dictionary mapping the unique
+#                         string of a shift to the set of workers
+#                         allowed to work it (see make_allowed_workers)
+# @raise ConsistencyFailure if some shift has no allowed worker left
 ################################################
-def make_shift_domains( shift_list, workers_tuple ):
+def make_shift_domains( shift_list, workers_tuple, allowed_workers=None ):
     domains = {}
+    universe = fd.ValueUniverse([('d'+str(shift[0]),'s'+str(shift[1]),worker)
+                                 for shift in shift_list
+                                 for worker in workers_tuple])
     for shift in shift_list:
+        shift_string = unique_shift_to_string(shift)
+        workers = workers_tuple
+        if allowed_workers is not None and shift_string in allowed_workers:
+            allowed = allowed_workers[shift_string]
+            workers = [worker for worker in workers_tuple if worker in allowed]
+        if not workers:
+            raise ConsistencyFailure('no worker can work %s' % shift_string)
+
         # Get the possible values for this shift
         values = [('d'+str(shift[0]),'s'+str(shift[1]),worker)
-                for worker in workers_tuple ]
+                for worker in workers ]
 
-        shift_string = unique_shift_to_string(shift)
-        domains[shift_string] = fd.FiniteDomain(values)
+        domains[shift_string] = fd.IndexedFiniteDomain(values, universe)
     return domains
 
 
-################################################
-# This function creates a dictionary containing
-# the preference level for each individual 
-# worker-shift entity.
-# 
-# @params worker_list The worker list representation,
-#                     which is a list of lists in the
-#                     format: [worker],[day],[shift],[availability]
-################################################
-def make_worker_prefs( worker_list ):
-    worker_prefs = {}
-    for item in worker_list:
-        shift = shift_to_string([item[1],item[2]])
-        worker = worker_to_string(item[0])
-        key = worker+shift
-        worker_prefs[key] = item[3]
-
-    return worker_prefs
-
-
 ################################################
 # This function creates constraints based on overlap of
-# shifts.
+# shifts: all the person-shifts of a time window must
+# be given different workers (item 2 of their values).
+# One n-ary constraint per window sees that a window
+# needs more workers than it can get, which pairwise
+# constraints never notice.
 #
 # @params constraints A dictionary, possibly holding some
 #                     constraints already
 #
-# @params overlap_list A list containing tuples of string
-#                      representations of overlapping
-#                      person-shifts
+# @params overlap_windows A list containing tuples of string
+#                         representations of person-shifts
+#                         that all overlap one another
 # @return A list of overlap constraints, formulated for the
 #         logilab solver, to be appended to the problem's
 #         constraint list
 ################################################
-def make_overlapping_constraints( constraints, overlap_list ):
-    for shift_pair in overlap_list:
-        constraints.append( fd.make_expression(
-            shift_pair, "%(shift_0)s[2] != %(shift_1)s[2]" %
-            {'shift_0' : shift_pair[0], "shift_1": shift_pair[1]} ))
+def make_overlapping_constraints( constraints, overlap_windows ):
+    for window in overlap_windows:
+        if len(window) == 2:
+            constraints.append( fd.NotEqualOnField( window, 2 ) )
+        else:
+            constraints.append( fd.AllDistinctOnField( window, 2 ) )
 
     return constraints
-    
+
 ################################################
-# This function creates constraints based on an employees
-# job and the amount of jobs needed on each shift
+# Groups the worker-shifts that any schedule may swap
+# workers between: the copies of a same (day, shift)
+# that require the same job type. They have the same
+# workers, costs and overlaps, so every permutation of
+# their workers is an equally good schedule.
 #
-# @params constraints A dictionary, possibly holding some
+# @params shift_tuple A tuple with the names of each shift
+#
+# @params job_exclusions Optional dictionary returned by
+#                        make_job_exclusions()
+# @return A list of lists of unique shifts, each in the
+#         order of shift_tuple and holding at least two
+################################################
+def make_slot_groups( shift_tuple, job_exclusions=None ):
+    groups = {}
+    order = []
+    for shift in shift_tuple:
+        excluded = ()
+        if job_exclusions and shift in job_exclusions:
+            excluded = tuple( sorted( job_exclusions[shift] ) )
+        key = ( shorten_shift_key(shift), excluded )
+        if key not in groups:
+            groups[key] = []
+            order.append( key )
+        groups[key].append( shift )
+
+    return [ groups[key] for key in order if len(groups[key]) > 1 ]
+
+################################################
+# Groups the workers the solver cannot tell apart:
+# those with the same preference level for every
+# shift, who are excluded from the same worker-shifts.
+# Swapping two of them everywhere in a schedule gives
+# an equally good schedule.
+#
+# @params preference_matrix The PreferenceMatrix of the workers
+#
+# @params job_exclusions Optional dictionary returned by
+#                        make_job_exclusions()
+# @return A list of lists of workers, each holding at least two
+################################################
+def make_worker_classes( preference_matrix, job_exclusions=None ):
+    excluded_from = {}
+    if job_exclusions:
+        for shift, excluded in job_exclusions.items():
+            for worker in excluded:
+                excluded_from.setdefault( worker, [] ).append( shift )
+    for worker, shifts in excluded_from.items():
+        shifts.sort()
+        excluded_from[worker] = tuple( shifts )
+    return preference_matrix.worker_classes( excluded_from )
+
+################################################
+# This function creates constraints that break the
+# symmetry between interchangeable worker-shifts: the
+# workers of each group must be in increasing order,
+# so the solver only ever sees one of the k! equivalent
+# ways to give k worker-shifts their workers.
+#
+# @params constraints A list, possibly holding some
 #                     constraints already
 #
-# @params overlap_list A list containing tuples of string
-#                      representations of overlapping
-#                      person-shifts
-# @return A list of overlap constraints, formulated for the
-#         logilab solver, to be appended to the problem's
-#         constraint list
+# @params slot_groups The groups returned by make_slot_groups()
+# @return The constraint list, with the ordering constraints
+#         appended
 ################################################
-def make_overlapping_constraints( constraints, overlap_list ):
-    for shift_pair in overlap_list:
-        constraints.append( fd.make_expression(
-            shift_pair, "%(shift_0)s[2] != %(shift_1)s[2]" %
-            {'shift_0' : shift_pair[0], "shift_1": shift_pair[1]} ))
+def make_slot_symmetry_constraints( constraints, slot_groups ):
+    for group in slot_groups:
+        constraints.append( fd.StrictlyIncreasing( group ) )
 
     return constraints
 
 ################################################
-# This function adds constraints based on availability
-# preferences from the workers. If the worker's preference
-# level is below the given threshold, the constraint
-# is added to the list.
+# Returns the workers whose preference level for the
+# given (non-unique) shift is at least the threshold.
 #
-# @params constraints A dictionary, possibly holding some
-#                     constraints already
+# @params availability_table The table returned by
+#                            PreferenceMatrix.rankings()
 #
-# @params shift_tuple A tuple with the names of each shift
+# @params short_key A short shift key, e.g. "d2s3"
 #
-# @params worker_tuple A tuple with the names of each worker
+# @params availability_threshold An integer from 0 to 100 specifying
+#                                 the lowest availability level allowed
+#                                 to be worked for a shift.
+################################################
+def available_workers( availability_table, short_key, availability_threshold ):
+    negated_prefs, workers = availability_table[short_key]
+    return workers[:bisect_right(negated_prefs, -availability_threshold)]
+
+################################################
+# This function works out which workers may fill
+# each worker-shift: those available at the given
+# threshold, minus the ones whose job type does not
+# match the one the worker-shift requires.
+#
+# @params shift_tuple A tuple with the names of each shift
 #
-# @params worker_prefs A dictionary with the preference level
-#                      of each worker for each shift
+# @params availability_table The table returned by
+#                            PreferenceMatrix.rankings()
 #
 # @params availability_threshold An integer from 0 to 100 specifying
 #                                 the lowest availability level allowed
 #                                 to be worked for a shift.
+#
+# @params job_exclusions Optional dictionary returned by
+#                        make_job_exclusions()
+# @return A dictionary mapping each unique shift to the set
+#         of workers allowed to work it
 ################################################
-def make_availability_constraints( constraints, shift_tuple, worker_tuple, worker_prefs, availability_threshold ):
-    for worker in worker_tuple:
-        for shift in shift_tuple:
-            short_key = shorten_shift_key(shift)
-            key = worker + short_key
-            if worker_prefs[key] < availability_threshold:
-                constraints.append( fd.make_expression(
-                    (shift,), "%(a_shift)s[2] != '%(worker)s'" %
-                    {'a_shift' : shift, "worker": worker} ))
+def make_allowed_workers( shift_tuple, availability_table, availability_threshold, job_exclusions=None ):
+    allowed_workers = {}
+    for shift in shift_tuple:
+        workers = available_workers( availability_table,
+                                     shorten_shift_key(shift),
+                                     availability_threshold )
+        if job_exclusions and shift in job_exclusions:
+            excluded = job_exclusions[shift]
+            workers = [worker for worker in workers if worker not in excluded]
+        allowed_workers[shift] = set(workers)
+
+    return allowed_workers
+
+################################################
+# Finds the highest availability threshold for which
+# a schedule exists. Lowering the threshold only ever
+# allows more (worker, shift) pairs, so feasibility is
+# monotonic and we can binary search over the levels
+# instead of trying them one after another.
+#
+# @params levels The candidate thresholds, highest first
+#                (see PreferenceMatrix.levels)
+#
+# @params solve_for_threshold A function taking a threshold and
+#                             returning a solution, or None if
+#                             there is none for that threshold
+# @return A tuple (threshold, solution), or (None, None) if even
+#         the lowest level has no solution
+################################################
+def find_best_threshold( levels, solve_for_threshold ):
+    best_threshold = None
+    best_solution = None
+    low = 0
+    high = len(levels) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        solution = solve_for_threshold( levels[middle] )
+        if solution is None:
+            # Nothing at or above this level works
+            low = middle + 1
+        else:
+            best_threshold = levels[middle]
+            best_solution = solution
+            high = middle - 1
+
+    return (best_threshold, best_solution)
 
-    return constraints
-    
 ################################################
-# Creates constraints for job types.  If a worker
+# Runs in a child process: tries one threshold and
+# sends the solution, or None, through the connection.
+################################################
+def probe_threshold( connection, solve_for_threshold, threshold ):
+    connection.send( solve_for_threshold( threshold ) )
+
+################################################
+# Same as find_best_threshold, trying up to processes
+# thresholds at once in forked processes. Each round
+# spreads its probes over the levels still in doubt,
+# the highest of them included. A success makes every
+# lower level pointless, and a failure every higher
+# one, so the probes at those levels are stopped at
+# once and the round ends with the last useful probe.
+# Every probe answers through its own pipe, which a
+# stopped probe cannot leave half written for the others.
+#
+# @params processes The number of thresholds tried at once
+# @return A tuple (threshold, solution), or (None, None) if even
+#         the lowest level has no solution
+################################################
+def find_best_threshold_in_parallel( levels, solve_for_threshold, processes ):
+    if processes <= 1 or not supportsPortfolio():
+        return find_best_threshold( levels, solve_for_threshold )
+    best_threshold = None
+    best_solution = None
+    # levels[low:high + 1] are still in doubt
+    low = 0
+    high = len(levels) - 1
+    while low <= high:
+        count = min( processes, high - low + 1 )
+        # index in levels -> (process, connection) of its probe
+        probes = {}
+        for step in range( count ):
+            index = low + ( (high - low + 1) * step ) // count
+            receiver, sender = multiprocessing.Pipe( False )
+            probe = multiprocessing.Process( target=probe_threshold,
+                                             args=(sender, solve_for_threshold,
+                                                   levels[index]) )
+            probe.start()
+            probes[index] = (probe, receiver)
+        try:
+            while probes:
+                answered = None
+                for index, (probe, receiver) in sorted( probes.items() ):
+                    if receiver.poll( 0.05 ):
+                        answered = index
+                        break
+                    if not probe.is_alive() and not receiver.poll():
+                        raise RuntimeError( "Probe at threshold " +
+                                            str(levels[index]) + " died" )
+                if answered is None:
+                    continue
+                index = answered
+                probe, receiver = probes.pop( index )
+                solution = receiver.recv()
+                probe.join()
+                if solution is None:
+                    # Nothing at or above this level works
+                    low = max( low, index + 1 )
+                    moot = [ other for other in probes if other < index ]
+                else:
+                    best_threshold = levels[index]
+                    best_solution = solution
+                    high = min( high, index - 1 )
+                    moot = [ other for other in probes if other > index ]
+                for other in moot:
+                    probe, receiver = probes.pop( other )
+                    probe.terminate()
+                    probe.join()
+        finally:
+            for probe, receiver in probes.values():
+                probe.terminate()
+                probe.join()
+
+    return (best_threshold, best_solution)
+
+################################################
+# Works out the job type exclusions.  If a worker
 # does not have the correct job type, that worker
 # cannot work that posistion for that shift, so 
-# a constraint is added.
-#
-# @param constraints A dictionary, possibly holding some
-#                    constraints already
+# he/she is excluded from it.
 #
 # @param worker_job_list A list containing an entry for
 #                        a worker and his/her job number
 #
 # @param shift_job_tuple contains information for shift position
 #                        that require specific job types.
+# @return A dictionary mapping the unique string of each
+#         worker-shift with a job requirement to the set of
+#         workers that cannot work it
 ################################################
-def make_job_constraints( constraints, worker_job_list, shift_job_tuple ):
+def make_job_exclusions( worker_job_list, shift_job_tuple ):
+    job_exclusions = {}
     for shift_job in shift_job_tuple:
+        excluded = job_exclusions.setdefault( shift_job[0], set() )
         for worker_job in worker_job_list:
             if (int(shift_job[1]) != worker_job[1]):
-                shift_key = shift_job[0]
-                worker = 'w' + str(worker_job[0])
-                constraints.append( fd.make_expression(
-                    (shift_key,), "%(a_shift)s[2] != '%(a_worker)s'" %
-                    {'a_shift' : shift_key, "a_worker": worker} ))
-    return constraints
-
-
-################################################
-# This function takes a bunch of variables and returns a
-# numerical "score" indicating how much we dislike this
-# assignment. Particularly, it considers how many workers'
-# preferences have been violated and to what degree.
-#
-# NOTE: In order for soft constraints to be taken into
-#       account, you must indicate that a worker *can*
-#       work a shift in the main problem setup. We take
-#       care of the preference part here.
-# NOTE Also: Nozick's Utility Monster applies.
-#
-# @param worker_prefs The preference level of each
-#                     worker for each shift
-# @param **kwargs A variable-length parameter where each
-#                 keyword (being a shift ID) is associated
-#                 with values (the shift's assignments)
-################################################
-def cost_function( **kwargs ):
-    global worker_prefs
-    score = 0
-
-    # Debugging:
-    #for key in kwargs:
-        #print "another keyword arg: %s: %s" % (key, kwargs[key])
-    
-    worker_and_shift_l = []
-    for key in kwargs:
-        short_key = shorten_shift_key(key)
-        worker_and_shift_l.append( str( kwargs[key][2] ) + str( short_key ) )
-
-    for constraint in worker_prefs:
-        if constraint in worker_and_shift_l:
-            score += worker_prefs[ constraint ]
-    
-    # For each soft constraint we have,
-    # add 1 if that soft constraint is violated
-    return score
+                excluded.add( worker_to_string(worker_job[0]) )
+    return job_exclusions
 
 
 ########################
@@ -550,7 +809,6 @@ def cost_function( **kwargs ):
 # Yeah, this can be done in a more robust way...
 shift_file = sys.argv[1]
 worker_file = sys.argv[2]
-availability_threshold = 100
 
 
 # Process the files into simple lists of lists
@@ -570,15 +828,21 @@ worker_tuple = make_worker_tuple(worker_list)
 
 # Check for overlapping shifts
 overlapping_list = []
+overlap_windows = []
 try:
     overlap_file = sys.argv[3]
     if overlap_file == "none":
         overlapping_list = None
     else:
+        # Overlap windows hold the string rep. of (non-unique)
+        # shifts that all overlap one another
+        overlap_windows = make_overlap_windows(
+            load_overlapping_shifts( overlap_file ) )
         # Overlapping list is a list containing a number of tuples:
-        # each tuple specifies the string rep. of 2 (unique) shifts that overlap
-        overlapping_list = extend_overlapping_shifts_to_be_unique(
-            load_overlapping_shifts( overlap_file ), shift_list )
+        # each tuple specifies the string rep. of (unique) shifts
+        # that all overlap one another
+        overlapping_list = extend_overlap_windows_to_be_unique(
+            overlap_windows, shift_list )
 except IndexError:
     overlapping_list = None
     
@@ -599,78 +863,367 @@ if worker_job_list:
     shift_job_list = load_shift_jobs( shift_job_file )
     shift_job_tuple = make_shift_job_tuple( shift_job_list )
 
-# Do this loop until solutions are found,
-# decrementing the availability_threshold 
-# by 1 each time
+# The solutions found for the best availability
+# threshold (at most one, for now)
 solutions = []
 
+# The statistics of every search so far, when SOLVER_STATS
+# is set (see SolverStats.asDict)
+solver_stats = []
 
 
-# Create a dictionary that can be easily traversed
-# to find the preference a worker has indicated
-# for a given day and shift
-worker_prefs = make_worker_prefs(worker_list)
 
+# Every preference a worker has indicated for a
+# day and shift we schedule, in one worker x shift
+# matrix (see preferences.py)
+# How many worker-shifts each (non-unique) shift has
+shifts_needed = {}
+short_keys = []
+for shift in shift_tuple:
+    short_key = shorten_shift_key(shift)
+    if short_key not in shifts_needed:
+        shifts_needed[short_key] = 0
+        short_keys.append( short_key )
+    shifts_needed[short_key] += 1
+preference_matrix = PreferenceMatrix( short_keys, worker_tuple, worker_list )
 
-static_constraints = []
+# Scores schedules by how well they match those
+# preferences, lower being better
+scorer = ScheduleScorer( preference_matrix, shift_tuple, shorten_shift_key,
+                         MAX_PREFERENCE )
+
+
+# Job types and availability only decide which workers
+# may fill each worker-shift, so they are applied to the
+# domains directly rather than posted as constraints
+job_exclusions = None
 if worker_job_list:
-    static_constraints = make_job_constraints( static_constraints, worker_job_list, shift_job_tuple)
+    job_exclusions = make_job_exclusions( worker_job_list, shift_job_tuple )
 
+static_constraints = []
 if overlapping_list:
     static_constraints = make_overlapping_constraints( static_constraints, overlapping_list )
-        
 
+# Copies of a shift needing the same job are interchangeable,
+# so only one ordering of their workers is searched
+slot_groups = make_slot_groups( shift_tuple, job_exclusions )
+static_constraints = make_slot_symmetry_constraints( static_constraints,
+                                                     slot_groups )
+
+# Workers with the same preferences and the same job
+# exclusions are interchangeable, so the search only
+# tries one of those it has not used yet
+worker_classes = make_worker_classes( preference_matrix, job_exclusions )
+
+# Workers are ranked once here; each threshold
+# we try just takes the ones it needs.
+availability_table = preference_matrix.rankings()
+
+# The flow check groups shifts by overlap window when it can
+# (see flow.py); flow_is_exact tells whether it then accounts
+# for every overlap
+flow_groups, flow_is_exact = flow.make_flow_groups( short_keys,
+                                                    overlap_windows )
+
+# The value of each worker-shift variable for a given worker
+shift_values = {}
+for shift in shift_list:
+    shift_values[ unique_shift_to_string(shift) ] = (
+        'd'+str(shift[0]), 's'+str(shift[1]) )
 
-while len(solutions) < 1:
-    if DEBUGGING:
-        print strftime('%H:%M:%S')+": Availability: "+str(availability_threshold)
 
+################################################
+# Builds the problem in which nobody works a shift
+# they rated below availability_threshold.
+# Returns the Repository, or None if some worker-shift
+# cannot be filled at all.
+################################################
+def make_repository( availability_threshold, allowed_workers=None ):
     # Set up the domains for each variable.
     # This will restrict each variable to the
     # indicated day and shift, and allow any
-    # worker
-    domains = make_shift_domains(shift_list, worker_tuple)
-
+    # worker available at this threshold and
+    # having the right job type
+    if allowed_workers is None:
+        allowed_workers = make_allowed_workers( shift_tuple,
+                                                availability_table,
+                                                availability_threshold,
+                                                job_exclusions )
+    try:
+        domains = make_shift_domains(shift_list, worker_tuple, allowed_workers)
+    except ConsistencyFailure:
+        return None
 
-    # Set up the constraints based on the given
-    # availability threshold
     constraints = static_constraints[:]
-    constraints = make_availability_constraints( constraints,
-                                                shift_tuple,
-                                                worker_tuple,
-                                                worker_prefs,
-                                                availability_threshold )
-    
-
-    # Decrement the availability_threshold
-    availability_threshold -= 1
 
     # We don't want to schedule the same worker at the same
     # shift more than once
-    constraints.append(fd.AllDistinct(shift_tuple))
+    constraints.append(DISTINCT_CONSTRAINT(shift_tuple))
 
     # Repository objects are used to hold the variables, domains
     # and constraints describing the problem. A Solver object solves
     # the problem described by a Repository.
-    r = Repository(shift_tuple,domains,constraints)
-
-    # Solver( ) takes parameter Distributor if we want to try to optimize that way
-    #   (cf. Solver source in constraint-0.4.0/propogation.py)
-    # Parameters for solve_best are Repository, cost_function, (bool)verbose
-    #    (source found in constraint-0.4.0/propogation.py)
-    #for s in Solver().solve_best(r, cost_function, 0):
-    #    solutions.append(s)
-    # This will append better solutions as it finds them; last one is best!
+    return Repository(shift_tuple,domains,constraints)
+
+################################################
+# The cost of a value (day, shift, worker) of a
+# worker-shift, for the ValueOrderingDistributor.
+################################################
+def value_cost( shift, value ):
+    return scorer.cost( shift, value[2] )
+
+################################################
+# Makes the Solver searching the repositories of
+# make_repository: it searches in place, and does not
+# try a worker interchangeable with one already tried.
+# With PORTFOLIO_PROCESSES above 1 it is a portfolio of
+# solvers searching in parallel, and with PARALLEL_PROCESSES
+# above 1 a solver splitting its search between processes.
+################################################
+def make_solver():
+    stats = None
+    if SOLVER_STATS:
+        stats = SolverStats()
+    # trail=True searches in place instead of copying every domain per node
+    if not worker_classes:
+        # The worker who likes a shift best is tried first, so the
+        # first schedule found is already a good one; ties go to the
+        # worker who can fill the fewest other shifts
+        distributor = ValueOrderingDistributor( value_cost, True, 2 )
+        solver = Solver( distributor, trail=True, stats=stats )
+        if RESTART_CUTOFF > 0:
+            solver = RestartingSolver( cutoff=RESTART_CUTOFF, stats=stats )
+        elif BACKJUMPING:
+            solver = BackjumpingSolver( distributor, stats=stats )
+    else:
+        # Workers are item 2 of the values; the distributor needs the
+        # slot groups to stay consistent with their ordering constraints
+        distributor = ValueSymmetryDistributor( worker_classes, 2, slot_groups )
+        solver = Solver( distributor, trail=True, stats=stats )
+    if PORTFOLIO_PROCESSES <= 1:
+        if PARALLEL_PROCESSES > 1:
+            return ParallelSolver( solver, PARALLEL_PROCESSES )
+        return solver
+
+    # The other solvers branch on the worker-shifts involved
+    # in the most failures, or with the most pruning values;
+    # the randomizing ones each get their own seed
+    solvers = [ solver,
+                Solver( DomWDegDistributor(), trail=True ),
+                Solver( ImpactDistributor(), trail=True ) ]
+    while len(solvers) < PORTFOLIO_PROCESSES:
+        solvers.append( Solver( RandomizingDistributor(), trail=True ) )
+    return PortfolioSolver( solvers[:PORTFOLIO_PROCESSES] )
+
+################################################
+# Runs the flow check (see flow.py) for a threshold.
+# Returns a tuple (allowed_workers, assignment), where
+# assignment maps each worker-shift to a worker, or is
+# None if the flow cannot fill every worker-shift, which
+# proves there is no schedule for this threshold.
+# A shift with fewer available workers than worker-shifts
+# rules the threshold out before any flow runs; both items
+# are then None.
+################################################
+def flow_for_threshold( availability_threshold ):
+    # Not enough workers available for some shift at all
+    counts = preference_matrix.available_counts( availability_threshold )
+    for short_key, needed in shifts_needed.items():
+        if counts[short_key] < needed:
+            return (None, None)
+
+    allowed_workers = make_allowed_workers( shift_tuple,
+                                            availability_table,
+                                            availability_threshold,
+                                            job_exclusions )
+    assignment = flow.max_flow_assignment( allowed_workers, flow_groups,
+                                           shorten_shift_key )
+    if len(assignment) < len(shift_tuple):
+        return (allowed_workers, None)
+    return (allowed_workers, assignment)
+
+################################################
+# Gives the workers of each group of interchangeable
+# worker-shifts in increasing order, as the symmetry
+# constraints require (see make_slot_groups). Swapping
+# them changes neither the validity nor the cost of the
+# assignment, which is modified in place.
+################################################
+def order_slot_groups( assignment ):
+    for group in slot_groups:
+        workers = sorted([ assignment[shift] for shift in group ])
+        for shift, worker in zip( group, workers ):
+            assignment[shift] = worker
+
+################################################
+# Turns a flow assignment into a solution, in the
+# format the Solver returns them.
+################################################
+def assignment_to_solution( assignment ):
+    order_slot_groups( assignment )
+    solution = {}
+    for shift, worker in assignment.items():
+        solution[shift] = shift_values[shift] + (worker,)
+    return solution
+
+################################################
+# Same as solve_for_threshold, with the flow check
+# only: returns a flow assignment, or None.
+################################################
+def solve_flow_for_threshold( availability_threshold ):
+    return flow_for_threshold( availability_threshold )[1]
+
+################################################
+# Looks for the schedule that best matches the workers'
+# preferences, with nobody working a shift they rated
+# below availability_threshold.
+# The min cost flow is the best schedule whenever it
+# keeps every overlap. Otherwise the worker-shifts of
+# the overlaps it breaks are searched again, every other
+# worker-shift keeping its flow worker, and the whole
+# problem only if that fails.
+# Returns the schedules found, best last.
+################################################
+def optimize_for_threshold( availability_threshold ):
+    allowed_workers = make_allowed_workers( shift_tuple,
+                                            availability_table,
+                                            availability_threshold,
+                                            job_exclusions )
+    assignment = flow.min_cost_assignment( allowed_workers, flow_groups,
+                                           shorten_shift_key, scorer.cost )
+    if assignment is None:
+        return []
+    if flow_is_exact or \
+           flow.satisfies_windows( assignment, overlapping_list or [] ):
+        return [ assignment_to_solution( assignment ) ]
+
+    if DEBUGGING:
+        print strftime('%H:%M:%S')+": Min cost flow breaks an overlap, repairing"
+    order_slot_groups( assignment )
+    broken = set()
+    for window in overlapping_list:
+        if not flow.satisfies_windows( assignment, [window] ):
+            broken.update( window )
+    repaired_workers = {}
+    for shift, workers in allowed_workers.items():
+        if shift in broken:
+            repaired_workers[shift] = workers
+        else:
+            repaired_workers[shift] = set([ assignment[shift] ])
+
+    found = []
+    for workers in (repaired_workers, allowed_workers):
+        r = make_repository( availability_threshold, workers )
+        if r is None:
+            continue
+        # scorer.lower_bound lets the solver skip whatever
+        # cannot beat the best schedule found so far.
+        solver = make_solver()
+        for s, cost in solver.solve_best( r, scorer, 0,
+                                          max_nodes=OPTIMIZING_NODE_BUDGET ):
+            found.append(s)
+        record_solver_stats( solver )
+        if DEBUGGING and solver.budget_exhausted:
+            print strftime('%H:%M:%S')+": Node budget spent, keeping the best schedule so far"
+        if found:
+            break
+    return found
+
+################################################
+# Adds the statistics of the last search of a solver
+# made by make_solver, if it kept any, to solver_stats.
+################################################
+def record_solver_stats( solver ):
+    stats = getattr( solver, 'stats', None )
+    if stats is not None:
+        solver_stats.append( stats.asDict() )
+        if DEBUGGING:
+            print strftime('%H:%M:%S')+": Solver stats: "+stats.asJSON()
+
+################################################
+# Tries to find a schedule in which nobody works a
+# shift they rated below availability_threshold.
+# Returns the solution, or None if there is none.
+# The CSP only runs when the flow check can fill
+# every worker-shift but breaks some overlap.
+################################################
+def solve_for_threshold( availability_threshold ):
+    if DEBUGGING:
+        print strftime('%H:%M:%S')+": Availability: "+str(availability_threshold)
+
+    allowed_workers, assignment = flow_for_threshold( availability_threshold )
+    if assignment is None:
+        return None
+    if flow_is_exact or \
+           flow.satisfies_windows( assignment, overlapping_list or [] ):
+        return assignment_to_solution( assignment )
+
+    if DEBUGGING:
+        print strftime('%H:%M:%S')+": Flow breaks an overlap, searching"
+    r = make_repository( availability_threshold, allowed_workers )
+    if r is None:
+        return None
+
     # Just look for one solution, for testing when we 
     # don't care how good the result is.
     # 1 for verbose, 0 for silent
-    solutions.append(Solver().solve_one(r,0))
-    if solutions[0] == None:
-        solutions = []
-
-
+    solver = make_solver()
+    solution = solver.solve_one(r,0)
+    record_solver_stats( solver )
+    return solution
 
-print "Found", len(solutions), "solutions."
-print "\n\nHere's the best solution we found:"
-pprint(solutions[-1])
 
+################################################
+# Finds the highest availability threshold at which
+# there is a schedule, and that schedule; with
+# OPTIMIZING, the better schedules at that threshold
+# follow it.
+#
+# @return A tuple (threshold, solutions): threshold is None
+#         if there is no schedule, and the solutions are also
+#         appended to the solutions list, best last
+################################################
+def find_schedule():
+    # Only the preference levels that actually appear in
+    # the data are worth trying as thresholds. The flow check
+    # alone gives the highest threshold that may have a
+    # schedule; most of the time the flow found there is
+    # already one.
+    levels = preference_matrix.levels()
+    flow_threshold, assignment = find_best_threshold( levels,
+                                                      solve_flow_for_threshold )
+    availability_threshold = None
+    solution = None
+    if flow_threshold is not None and THRESHOLD_PROCESSES > 1:
+        levels = [ level for level in levels if level <= flow_threshold ]
+        availability_threshold, solution = find_best_threshold_in_parallel(
+            levels, solve_for_threshold, THRESHOLD_PROCESSES )
+    elif flow_threshold is not None:
+        levels = [ level for level in levels if level <= flow_threshold ]
+        solution = solve_for_threshold( levels[0] )
+        if solution is not None:
+            availability_threshold = levels[0]
+        else:
+            availability_threshold, solution = find_best_threshold(
+                levels[1:], solve_for_threshold )
+    if solution is not None:
+        solutions.append(solution)
+
+    if solutions and OPTIMIZING:
+        if DEBUGGING:
+            print strftime('%H:%M:%S')+": Optimizing at availability "+str(availability_threshold)
+        # This will append better solutions as it finds them; last one is best!
+        solutions.extend( optimize_for_threshold( availability_threshold ) )
+    return (availability_threshold, solutions)
+
+
+# Importing this file builds the problem described by
+# sys.argv without solving it (see benchmark.py)
+if __name__ == '__main__':
+    availability_threshold, solutions = find_schedule()
+
+    print "Found", len(solutions), "solutions."
+    if solutions:
+        print "Availability threshold:", availability_threshold
+        print "\n\nHere's the best solution we found:"
+        pprint(solutions[-1])
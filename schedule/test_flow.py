@@ -0,0 +1,132 @@
+################################################
+# Unit tests for flow.py: the maximum flow and the
+# minimum cost flow are checked against a brute force
+# search on small random problems, some of which have
+# worker-shifts that cannot all be filled.
+#
+#    python test_flow.py
+################################################
+
+import random
+import unittest
+
+import flow
+
+# The number of random problems each test checks
+NB_PROBLEMS = 500
+
+
+################################################
+# The short key of a unique shift (short key, slot).
+################################################
+def shorten( shift ):
+    return shift[0]
+
+################################################
+# Draws a small problem.
+#
+# @param rng The random.Random to draw from
+# @return A tuple (allowed_workers, groups, costs), where
+#         costs maps each (unique shift, worker) to its cost
+################################################
+def make_problem( rng ):
+    short_keys = [ 'd1s%d' % shift for shift in range( rng.randint( 1, 3 ) ) ]
+    workers = range( rng.randint( 1, 4 ) )
+    allowed_workers = {}
+    costs = {}
+    for short_key in short_keys:
+        for slot in range( rng.randint( 1, 2 ) ):
+            shift = (short_key, slot)
+            # sometimes nobody can work it
+            allowed = [ worker for worker in workers if rng.random() < 0.6 ]
+            allowed_workers[shift] = set( allowed )
+            for worker in allowed:
+                costs[ (shift, worker) ] = rng.randint( 0, 9 )
+    windows = []
+    if len(short_keys) > 1 and rng.random() < 0.5:
+        windows.append( tuple( rng.sample( short_keys, 2 ) ) )
+    groups, exact = flow.make_flow_groups( short_keys, windows )
+    return ( allowed_workers, groups, costs )
+
+################################################
+# Lists every assignment of the worker-shifts, each one
+# either left unfilled (None) or given an allowed worker,
+# where a worker fills at most one worker-shift of a group.
+################################################
+def all_assignments( allowed_workers, groups ):
+    shifts = sorted( allowed_workers )
+    assignments = []
+    def extend( index, assignment, used ):
+        if index == len(shifts):
+            assignments.append( dict(assignment) )
+            return
+        shift = shifts[index]
+        assignment[shift] = None
+        extend( index + 1, assignment, used )
+        for worker in sorted( allowed_workers[shift] ):
+            node = ( groups[ shorten(shift) ], worker )
+            if node not in used:
+                used.add( node )
+                assignment[shift] = worker
+                extend( index + 1, assignment, used )
+                used.remove( node )
+        del assignment[shift]
+    extend( 0, {}, set() )
+    return assignments
+
+
+class FlowTest( unittest.TestCase ):
+
+    ################################################
+    # Checks that an assignment only gives allowed workers,
+    # and each worker at most once per group.
+    ################################################
+    def assertValid( self, assignment, allowed_workers, groups ):
+        used = set()
+        for shift, worker in assignment.items():
+            self.assertTrue( worker in allowed_workers[shift] )
+            node = ( groups[ shorten(shift) ], worker )
+            self.assertFalse( node in used )
+            used.add( node )
+
+    def test_max_flow( self ):
+        rng = random.Random( 0 )
+        for problem in range( NB_PROBLEMS ):
+            allowed_workers, groups, costs = make_problem( rng )
+            assignment = flow.max_flow_assignment( allowed_workers, groups,
+                                                   shorten )
+            self.assertValid( assignment, allowed_workers, groups )
+            most = max( [ len( [ worker for worker in found.values()
+                                 if worker is not None ] )
+                          for found in all_assignments( allowed_workers,
+                                                        groups ) ] )
+            self.assertEqual( len(assignment), most )
+
+    def test_min_cost( self ):
+        rng = random.Random( 1 )
+        infeasible = 0
+        for problem in range( NB_PROBLEMS ):
+            allowed_workers, groups, costs = make_problem( rng )
+            def cost( shift, worker ):
+                return costs[ (shift, worker) ]
+            assignment = flow.min_cost_assignment( allowed_workers, groups,
+                                                   shorten, cost )
+            totals = [ sum( [ costs[ (shift, worker) ]
+                              for shift, worker in found.items() ] )
+                       for found in all_assignments( allowed_workers, groups )
+                       if None not in found.values() ]
+            if not totals:
+                infeasible += 1
+                self.assertEqual( assignment, None )
+                continue
+            self.assertValid( assignment, allowed_workers, groups )
+            self.assertEqual( sorted( assignment ), sorted( allowed_workers ) )
+            self.assertEqual( sum( [ cost( shift, worker )
+                                     for shift, worker in assignment.items() ] ),
+                              min( totals ) )
+        # both kinds of problems were checked
+        self.assertTrue( 0 < infeasible < NB_PROBLEMS )
+
+
+if __name__ == '__main__':
+    unittest.main()
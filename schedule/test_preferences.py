@@ -0,0 +1,145 @@
+################################################
+# Unit tests for preferences.py: the matrix built with
+# numpy must answer like the one built without it, and
+# the score changes given by the scorer must match the
+# scores of the schedules before and after the change.
+#
+#    python test_preferences.py
+################################################
+
+import random
+import unittest
+
+import preferences
+
+# numpy as preferences.py found it, or None
+NUMPY = preferences.numpy
+
+# The highest availability a worker can give
+MAX_PREFERENCE = 3
+
+# The number of random problems each test checks
+NB_PROBLEMS = 200
+
+
+################################################
+# The short key of a unique shift, e.g. "d2s3" for "d2s3n1".
+################################################
+def shorten( key ):
+    return key.split('n')[0]
+
+################################################
+# Draws a small problem.
+#
+# @param rng The random.Random to draw from
+# @return A tuple (short_keys, workers, worker_list) as
+#         PreferenceMatrix takes them
+################################################
+def make_problem( rng ):
+    all_keys = [ (day, shift) for day in range(1, 4) for shift in range(1, 4) ]
+    chosen = rng.sample( all_keys, rng.randint( 1, len(all_keys) ) )
+    short_keys = [ 'd%ds%d' % key for key in chosen ]
+    # names out of the column order, so that ties are broken by name
+    workers = [ 'w%d' % worker for worker in range( rng.randint( 1, 6 ) ) ]
+    rng.shuffle( workers )
+    worker_list = []
+    if rng.random() < 0.9:
+        for worker in range( len(workers) ):
+            # some shifts rated are not scheduled, some are not rated
+            for day, shift in all_keys:
+                if rng.random() < 0.7:
+                    worker_list.append( [ worker, day, shift,
+                                          rng.randint( 0, MAX_PREFERENCE ) ] )
+    return ( short_keys, tuple(workers), worker_list )
+
+
+class PreferencesTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self.rng = random.Random( 0 )
+
+    def tearDown( self ):
+        preferences.numpy = NUMPY
+
+    ################################################
+    # Builds the matrix of a problem with or without numpy.
+    ################################################
+    def make_matrix( self, problem, use_numpy ):
+        if use_numpy:
+            preferences.numpy = NUMPY
+        else:
+            preferences.numpy = None
+        return preferences.PreferenceMatrix( *problem )
+
+    ################################################
+    # Lists the backends to check: numpy when it is installed,
+    # and the plain loops.
+    ################################################
+    def backends( self ):
+        if NUMPY is None:
+            return [ False ]
+        return [ True, False ]
+
+    @unittest.skipIf( NUMPY is None, 'numpy is not installed' )
+    def test_same_matrix( self ):
+        for problem in range( NB_PROBLEMS ):
+            problem = make_problem( self.rng )
+            short_keys, workers, worker_list = problem
+            dense = self.make_matrix( problem, True )
+            plain = self.make_matrix( problem, False )
+            self.assertEqual( dense.rankings(), plain.rankings() )
+            self.assertEqual( dense.levels(), plain.levels() )
+            for threshold in range( MAX_PREFERENCE + 2 ):
+                self.assertEqual( dense.available_counts( threshold ),
+                                  plain.available_counts( threshold ) )
+            self.assertEqual( dense.worker_classes(), plain.worker_classes() )
+            job_types = dict( [ (worker, self.rng.randint( 0, 1 ))
+                                for worker in workers ] )
+            self.assertEqual( dense.worker_classes( job_types ),
+                              plain.worker_classes( job_types ) )
+            pairs = [ ( self.rng.choice( short_keys ),
+                        self.rng.choice( workers ) ) for pair in range(5) ]
+            self.assertEqual( dense.total( [ pair[0] for pair in pairs ],
+                                           [ pair[1] for pair in pairs ] ),
+                              plain.total( [ pair[0] for pair in pairs ],
+                                           [ pair[1] for pair in pairs ] ) )
+            for short_key, worker in pairs:
+                self.assertEqual( dense.preference( worker, short_key ),
+                                  plain.preference( worker, short_key ) )
+
+    def test_deltas( self ):
+        for use_numpy in self.backends():
+            for problem in range( NB_PROBLEMS ):
+                problem = make_problem( self.rng )
+                short_keys, workers, worker_list = problem
+                matrix = self.make_matrix( problem, use_numpy )
+                shifts = [ '%sn%d' % (short_key, number)
+                           for short_key in short_keys
+                           for number in range( self.rng.randint( 1, 2 ) ) ]
+                scorer = preferences.ScheduleScorer( matrix, shifts, shorten,
+                                                     MAX_PREFERENCE )
+                assignment = dict( [ (shift, self.rng.choice( workers ))
+                                     for shift in shifts ] )
+                score = scorer.score( assignment )
+                solution = dict( [ (shift, (0, 0, worker))
+                                   for shift, worker in assignment.items() ] )
+                self.assertEqual( scorer( **solution ), score )
+                for shift in shifts:
+                    for worker in workers:
+                        changed = dict( assignment )
+                        changed[shift] = worker
+                        self.assertEqual(
+                            scorer.reassign_delta( assignment, shift, worker ),
+                            scorer.score( changed ) - score )
+                for shift1 in shifts:
+                    for shift2 in shifts:
+                        changed = dict( assignment )
+                        changed[shift1] = assignment[shift2]
+                        changed[shift2] = assignment[shift1]
+                        self.assertEqual(
+                            scorer.swap_delta( assignment, shift1, shift2 ),
+                            scorer.score( changed ) - score )
+
+
+if __name__ == '__main__':
+    unittest.main()